@@ -0,0 +1,84 @@
+#
+# FILE: alignment_utils.py
+#
+# Tug-aircraft hitch alignment for whole yaw sweeps in one vectorized pass.
+# The aircraft is placed so that its tow-bar link sits on the tug's caster
+# link; an optional tow-bar articulation angle turns the aircraft about the
+# vertical axis through the hitch.
+#
+import numpy as np
+
+import urdf_utils
+
+
+def _link_index(model_data, link_name):
+    tree = urdf_utils.kinematic_tree(model_data)
+    if link_name not in tree["link_index"]:
+        raise ValueError(f"Link '{link_name}' not found in the URDF.")
+    return tree["link_index"][link_name]
+
+
+def _rot_z(angles):
+    """(N,3,3) rotations about +Z."""
+    c, s = np.cos(angles), np.sin(angles)
+    R = np.zeros((len(angles), 3, 3))
+    R[:, 0, 0], R[:, 0, 1], R[:, 1, 0], R[:, 1, 1], R[:, 2, 2] = c, -s, s, c, 1.0
+    return R
+
+
+def align_aircraft(tug_data, ac_data, yaws_deg, towbar_deg=None,
+                   tug_location=(0, 0, 0), tug_rotation=(0, 0, 0), ac_rotation=(0, 0, 0),
+                   tug_link="caster", ac_link="towbar", tug_cfg=None, ac_cfg=None):
+    """
+    Aircraft pose for every tug yaw (degrees) so that ac_link coincides with tug_link.
+    towbar_deg (scalar or one value per yaw) rotates the aircraft about the hitch, relative
+    to ac_rotation; with None the aircraft keeps ac_rotation, as main.py does today.
+    tug_rotation supplies the tug's roll/pitch (its yaw is replaced by the sweep).
+    Returns a dict of (N,) / (N,3) / (N,4,4) arrays: yaw_deg, towbar_deg, tug_matrix,
+    aircraft_matrix, aircraft_location, aircraft_rotation (XYZ euler, radians) and hitch.
+    """
+    yaws = np.atleast_1d(np.asarray(yaws_deg, dtype=float))
+    n = len(yaws)
+    towbar = np.zeros(n) if towbar_deg is None else np.broadcast_to(np.asarray(towbar_deg, dtype=float), (n,))
+
+    tug_poses = np.zeros((n, 6))
+    tug_poses[:, :3] = tug_location
+    tug_poses[:, 3:5] = tug_rotation[:2]
+    tug_poses[:, 5] = np.radians(yaws)
+    tug_links, _ = urdf_utils.batched_link_fk(tug_data, tug_poses, tug_cfg)
+    hitch = tug_links[:, _link_index(tug_data, tug_link), :3, 3]
+
+    # tow-bar point in the aircraft base frame (one FK pass, the base pose does not change it)
+    ac_links, _ = urdf_utils.batched_link_fk(ac_data, np.zeros((1, 3)), ac_cfg)
+    towbar_local = ac_links[0, _link_index(ac_data, ac_link), :3, 3]
+
+    R = _rot_z(np.radians(towbar)) @ urdf_utils.rpy_matrices(np.asarray(ac_rotation, dtype=float)[None])[0]
+    ac_matrix = np.tile(np.identity(4), (n, 1, 1))
+    ac_matrix[:, :3, :3] = R
+    ac_matrix[:, :3, 3] = hitch - R @ towbar_local
+
+    rotation = np.tile(np.asarray(ac_rotation, dtype=float), (n, 1))
+    rotation[:, 2] += np.radians(towbar)  # Rz(a) @ Rz(c) Ry Rx only changes the euler Z angle
+    return {
+        "yaw_deg": yaws,
+        "towbar_deg": np.array(towbar),
+        "tug_matrix": tug_links[:, 0],
+        "aircraft_matrix": ac_matrix,
+        "aircraft_location": ac_matrix[:, :3, 3],
+        "aircraft_rotation": rotation,
+        "hitch": hitch,
+    }
+
+
+def sweep(yaw_start, yaw_stop, yaw_step, towbar_deg=(0.0,)):
+    """(yaws, towbar angles) of the full yaw x tow-bar grid, yaw_stop excluded, e.g. sweep(0, 360, 0.5)."""
+    yaws = np.arange(yaw_start, yaw_stop, yaw_step)
+    Y, T = np.meshgrid(yaws, np.asarray(towbar_deg, dtype=float), indexing="ij")
+    return Y.ravel(), T.ravel()
+
+
+def alignment_lookup(alignment, decimals=6):
+    """{yaw_deg: aircraft location tuple} for a towbar-free alignment, e.g. for scan_scheduler.expand_manifest."""
+    return {round(float(y), decimals): tuple(float(v) for v in loc)
+            for y, loc in zip(alignment["yaw_deg"], alignment["aircraft_location"])}
+
@@ -0,0 +1,202 @@
+#
+# FILE: async_export.py
+#
+# Background scan export: finished scan dicts are handed to a bounded queue
+# and serialized (CSV or .lscan), optionally gzip-compressed and written by
+# worker threads while the caller moves on to the next scan. A full queue
+# blocks submit() (or raises queue.Full with block=False), so memory stays
+# bounded by max_pending scans. Files are written under a temporary name and
+# renamed when complete: an interrupted run leaves no partial exports, only
+# temporary files that remove_stale_temp() cleans up.
+#
+import os
+import re
+import time
+import gzip
+import queue
+import threading
+from concurrent.futures import Future
+
+import file_utils
+import raycast_utils
+import scan_io
+import instrumentation
+
+log = instrumentation.get_logger(__name__)
+
+_STOP = object()
+
+
+def encode(scan, export_format="csv", metadata=None, compress=None, level=6):
+    """(file suffix, bytes) of one exported scan; compress is None or "gzip"."""
+    if export_format == "binary":
+        suffix, data = scan_io.EXTENSION, scan_io.encode_scan(scan, metadata)
+    else:
+        suffix, data = ".csv", raycast_utils.encode_csv(scan)
+    if compress == "gzip":
+        return suffix + ".gz", gzip.compress(data, compresslevel=level, mtime=0)
+    if compress is not None:
+        raise ValueError(f"Unknown compression '{compress}'.")
+    return suffix, data
+
+
+def write_atomic(path, data, fsync=False):
+    """Writes bytes to path through a temporary file in the same directory and an atomic rename."""
+    tmp_path = f"{path}.{file_utils.temp_tag()}-{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+# Temporary names of the pipeline's atomic writes, all tagged with the writer's file_utils.temp_tag
+# (<host>-<pid>; older files carry the PID alone): <name>.<tag>.tmp, <name>.<tag>-<thread>.tmp
+# (write_atomic), <name>.<tag>.tmp.<column> (scan_io stream spills) and .<name>.<tag>.tmp.csv
+# (scan_scheduler CSV exports).
+TEMP_NAME = re.compile(r"\.(?:([A-Za-z0-9_]+)-)?(\d+)(?:-\d+)?\.tmp(?:\.\w+)?$")
+
+
+def _pid_alive(pid):
+    """Whether a process with this PID runs on this machine (assumed alive where that cannot be checked safely)."""
+    if os.name == "nt":
+        return True  # os.kill(pid, 0) would terminate the process on Windows
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def remove_stale_temp(output_dir, max_age=24 * 3600.0):
+    """
+    Deletes temporary files left in output_dir by interrupted runs: those written on this machine whose
+    writer process is no longer alive, and any older than max_age seconds. Files of writers on other
+    machines (and of old names without a host) are only aged out, so in-flight files of running writers,
+    e.g. scheduler shards sharing the directory, are kept.
+    Returns the removed paths.
+    """
+    stale = []
+    now = time.time()
+    for entry in os.scandir(output_dir):
+        match = TEMP_NAME.search(entry.name)
+        if not match or not entry.is_file():
+            continue
+        try:
+            age = now - entry.stat().st_mtime
+            local = match[1] == file_utils.HOST
+            if age > max_age or (local and not _pid_alive(int(match[2]))):
+                os.remove(entry.path)
+                stale.append(entry.path)
+        except FileNotFoundError:
+            continue  # renamed or removed by its writer in the meantime
+    if stale:
+        log.warning(f"Removed {len(stale)} stale temporary files from {output_dir}")
+    return stale
+
+
+class ScanWriter:
+    """
+    Thread pool writing scans in the background.
+
+        with async_export.ScanWriter(workers=2, max_pending=4) as writer:
+            for ...:
+                scan = raycast_utils.scan_rotating(...)
+                writer.submit(scan, EXPORT_DIR, out_name, "binary", metadata)
+            writer.flush()  # all files are on disk (raises the first write error)
+
+    submit() takes ownership of the scan dict: it must not be modified until its future is done.
+    """
+
+    def __init__(self, workers=2, max_pending=4, compress=None, level=6, fsync=False):
+        self.compress = compress
+        self.level = level
+        self.fsync = fsync
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._errors = []
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._work, name=f"scan-writer-{i}", daemon=True) for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is _STOP:
+                    return
+                future, scan, output_dir, output_filename, export_format, metadata = job
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    with instrumentation.span("async_export", scan=output_filename, format=export_format):
+                        suffix, data = encode(scan, export_format, metadata, self.compress, self.level)
+                        path = write_atomic(os.path.join(output_dir, output_filename + suffix), data, self.fsync)
+                    log.info(f"Exported {len(scan['X'])} points to {path}")
+                    future.set_result(path)
+                except Exception as e:
+                    log.error(f"Export of '{output_filename}' failed: {e}")
+                    with self._lock:
+                        self._errors.append(e)
+                    future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    def submit(self, scan, output_dir, output_filename, export_format="csv", metadata=None, block=True, timeout=None):
+        """
+        Queues one scan for export and returns a Future of its path. When max_pending scans are
+        already queued this waits for a free slot (block=True, up to timeout) or raises queue.Full.
+        """
+        if not self._threads:
+            raise RuntimeError("ScanWriter is closed.")
+        future = Future()
+        self._queue.put((future, scan, output_dir, output_filename, export_format, metadata), block, timeout)
+        return future
+
+    def pending(self):
+        """Number of scans queued and not yet taken by a worker."""
+        return self._queue.qsize()
+
+    def flush(self):
+        """Waits until every submitted scan is written; raises the first error since the last flush."""
+        with instrumentation.span("export_flush"):
+            self._queue.join()
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        """Flushes and stops the workers."""
+        if not self._threads:
+            return
+        try:
+            self.flush()
+        finally:
+            for _ in self._threads:
+                self._queue.put(_STOP)
+            for thread in self._threads:
+                thread.join()
+            self._threads = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            try:
+                self.close()
+            except Exception as e:
+                log.error(f"Export failed while handling another error: {e}")
+        return False
@@ -0,0 +1,377 @@
+#
+# FILE: benchmarks.py
+#
+# Blender-free benchmarks of the placement pipeline's hot paths: URDF load and
+# FK, candidate sampling, mesh loading, ray casting at the production angular
+# resolution, and scan export/reload. Every run is appended to a JSON-lines
+# history; a stage is reported as a regression when its median time exceeds
+# the best earlier median on the same machine by more than the threshold.
+#
+# python benchmarks.py                    # all stages, history in bench_history.jsonl
+# python benchmarks.py --quick            # coarse ray grid (1.6 x 1.32 degree), for quick checks
+# python benchmarks.py --only mesh raycast --threshold 1.15
+#
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+import numpy as np
+
+import mesh_utils
+import raycast_utils
+import sampling_utils
+import scan_io
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TUG_URDF = os.path.join(HERE, "Tugs", "t5.urdf")
+AC_URDF = os.path.join(HERE, "AC", "a320_ceo.urdf")
+TUG_MESH = os.path.join(HERE, "Tugs", "t5.ply")
+AC_MESH = os.path.join(HERE, "AC", "a320_ceo.stl")
+
+# Blender-free modules: analysis workers import these in a plain Python process.
+CORE_MODULES = ("instrumentation", "file_utils", "urdf_utils", "alignment_utils", "sampling_utils", "mesh_utils", "mesh_lod", "raycast_utils",
+                "adaptive_scan", "sensor_models", "scan_io", "scan_cache", "scan_catalog", "async_export", "coverage_utils",
+                "fusion_utils", "labeling_utils", "placement_optimizer", "clearance_utils", "surrogate_search", "scan_scheduler")
+
+BENCHMARKS = []
+
+
+def benchmark(name, repeat=5):
+    """Registers fn(ctx) -> callable: fn does the (untimed) setup, the returned callable is timed."""
+    def register(fn):
+        BENCHMARKS.append((name, repeat, fn))
+        return fn
+    return register
+
+
+def box_mesh(size=(1.2, 0.8, 0.1)):
+    """Synthetic mounting plate: a triangulated box with its top face at z = size[2]."""
+    sx, sy, sz = size
+    v = np.array([[x, y, z] for z in (0, sz) for y in (-sy / 2, sy / 2) for x in (-sx / 2, sx / 2)], dtype=float)
+    quads = [(0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1), (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)]
+    return v, np.array([t for a, b, c, d in quads for t in ((a, b, c), (a, c, d))])
+
+
+def sphere_mesh(n_lat=200, n_lon=400, radius=5.0):
+    """Synthetic UV sphere with 2 * n_lat * n_lon triangles (minus the poles' degenerate ones)."""
+    lat = np.linspace(0, np.pi, n_lat + 1)
+    lon = np.linspace(0, 2 * np.pi, n_lon, endpoint=False)
+    la, lo = np.meshgrid(lat, lon, indexing="ij")
+    v = radius * np.stack([np.sin(la) * np.cos(lo), np.sin(la) * np.sin(lo), np.cos(la)], axis=-1).reshape(-1, 3)
+    i, j = np.meshgrid(np.arange(n_lat), np.arange(n_lon), indexing="ij")
+    a, b = i * n_lon + j, i * n_lon + (j + 1) % n_lon
+    c, d = a + n_lon, b + n_lon
+    faces = np.concatenate([np.stack([a, b, d], -1).reshape(-1, 3), np.stack([a, d, c], -1).reshape(-1, 3)])
+    return v, faces
+
+
+def production_scene():
+    tug_matrix = mesh_utils.transform_matrix((0, 0, 0), (0, 0, np.radians(45)))
+    ac_matrix = mesh_utils.transform_matrix((-12.0, 0.0, 0.0))
+    return raycast_utils.load_scene(TUG_MESH, AC_MESH, tug_matrix, ac_matrix)
+
+
+# ---------------------------------------------------------------------------------------------------------
+# Stages
+
+@benchmark("startup.core_imports", repeat=3)
+def bench_core_imports(ctx):
+    """Fresh interpreter importing every core module; fails if one of them pulls in Blender."""
+    code = (f"import sys; import {', '.join(CORE_MODULES)}; "
+            "sys.exit([m for m in ('bpy', 'mathutils', 'bmesh', 'range_scanner') if m in sys.modules] or 0)")
+
+    def run():
+        subprocess.run([sys.executable, "-c", code], cwd=HERE, check=True)
+    return run
+
+
+@benchmark("urdf.load", repeat=3)
+def bench_urdf_load(ctx):
+    import urdf_utils
+    return lambda: (urdf_utils.parse_urdf(AC_URDF), urdf_utils.parse_urdf(TUG_URDF))  # uncached parse
+
+
+@benchmark("urdf.link_positions")
+def bench_link_positions(ctx):
+    import urdf_utils
+    model = urdf_utils.load_and_verify_urdf(AC_URDF)
+    return lambda: [urdf_utils.link_positions(model, base_rotation=(0, 0, np.radians(y))) for y in range(0, 360, 10)]
+
+
+@benchmark("urdf.batched_fk_3600")
+def bench_batched_fk(ctx):
+    import urdf_utils
+    model = urdf_utils.load_and_verify_urdf(AC_URDF)
+    poses = np.zeros((3600, 4))
+    poses[:, 3] = np.radians(np.arange(3600) / 10.0)
+    return lambda: urdf_utils.batched_link_fk(model, poses)
+
+
+@benchmark("sampling.grid_1cm")
+def bench_sampling_grid(ctx):
+    v, f = box_mesh()
+    return lambda: sampling_utils.sample_candidates(v, f, method="grid", spacing=0.01, margin=0.1)
+
+
+@benchmark("sampling.random_50k")
+def bench_sampling_random(ctx):
+    v, f = box_mesh()
+    return lambda: sampling_utils.sample_candidates(v, f, method="random", count=50000, margin=0.1)
+
+
+@benchmark("sampling.poisson_2cm", repeat=3)
+def bench_sampling_poisson(ctx):
+    v, f = box_mesh()
+    return lambda: sampling_utils.sample_candidates(v, f, method="poisson", spacing=0.02, margin=0.1)
+
+
+@benchmark("mesh.load_ply_t5")
+def bench_load_ply(ctx):
+    return lambda: mesh_utils.load_mesh(TUG_MESH)
+
+
+@benchmark("mesh.load_stl_a320")
+def bench_load_stl(ctx):
+    return lambda: mesh_utils.load_mesh(AC_MESH)
+
+
+@benchmark("mesh.load_cached_t5")
+def bench_load_cached(ctx):
+    cache_dir = os.path.join(ctx["tmp"], "mesh_cache")
+    mesh_utils.load_mesh_cached(TUG_MESH, cache_dir)
+    return lambda: mesh_utils.load_mesh_cached(TUG_MESH, cache_dir)
+
+
+@benchmark("mesh.simplify_t5_2cm", repeat=3)
+def bench_simplify(ctx):
+    import mesh_lod
+    v, f, _ = mesh_utils.load_mesh_cached(TUG_MESH)
+    return lambda: mesh_lod.simplify(v, f, 0.02)
+
+
+@benchmark("raycast.build_bvh_sphere_160k", repeat=3)
+def bench_build_bvh(ctx):
+    v, f = sphere_mesh()
+    triangles = v[f]
+    return lambda: raycast_utils.build_bvh(triangles)
+
+
+@benchmark("raycast.build_scene", repeat=3)
+def bench_build_scene(ctx):
+    return production_scene
+
+
+@benchmark("raycast.refit_tug_yaw_x36")
+def bench_refit(ctx):
+    scene = production_scene()
+    yaws = [mesh_utils.transform_matrix((0, 0, 0), (0, 0, np.radians(y))) for y in range(0, 360, 10)]
+    return lambda: [raycast_utils.set_instance_matrices(scene, {"Tug_t5": M}) for M in yaws]
+
+
+@benchmark("raycast.scan_production", repeat=1)
+def bench_scan(ctx):
+    scene = production_scene()
+    params = dict(raycast_utils.DETAILED_SCAN_PARAMS)
+    if ctx["quick"]:
+        params.update(xStepDegree=4 * params["xStepDegree"], yStepDegree=4 * params["yStepDegree"])
+    lidar = mesh_utils.transform_matrix((0.3, 0.3, 1.2), np.radians((90, 0, 90)))
+
+    def run():
+        ctx["scan"] = raycast_utils.scan_rotating(scene, lidar, **params)
+        return ctx["scan"]
+    return run
+
+
+@benchmark("raycast.stream_scan_64mb", repeat=1)
+def bench_stream_scan(ctx):
+    scene = production_scene()
+    params = dict(raycast_utils.DETAILED_SCAN_PARAMS)
+    if ctx["quick"]:
+        params.update(xStepDegree=4 * params["xStepDegree"], yStepDegree=4 * params["yStepDegree"])
+    lidar = mesh_utils.transform_matrix((0.3, 0.3, 1.2), np.radians((90, 0, 90)))
+    return lambda: raycast_utils.stream_scan(scene, lidar, lambda chunk: None, 64, **params)
+
+
+@benchmark("raycast.scan_targeted", repeat=1)
+def bench_scan_targeted(ctx):
+    import adaptive_scan
+    scene = production_scene()
+    lidar = mesh_utils.transform_matrix((0.3, 0.3, 1.2), np.radians((90, 0, 90)))
+    return lambda: adaptive_scan.scan_targeted(scene, lidar, **raycast_utils.DETAILED_SCAN_PARAMS)
+
+
+@benchmark("sensors.scan_vls128")
+def bench_sensor_scan(ctx):
+    import sensor_models
+    scene = production_scene()
+    lidar = mesh_utils.transform_matrix((0.3, 0.3, 1.2), np.radians((90, 0, 90)))
+    sensor_models.ray_table("vls128")
+    return lambda: sensor_models.scan_sensor(scene, lidar, "vls128")
+
+
+@benchmark("clearance.check_yaw_x720")
+def bench_clearance(ctx):
+    import urdf_utils
+    import alignment_utils
+    import clearance_utils
+    tug, ac = urdf_utils.load_and_verify_urdf(TUG_URDF), urdf_utils.load_and_verify_urdf(AC_URDF)
+    alignment = alignment_utils.align_aircraft(tug, ac, np.arange(0.0, 360.0, 0.5))
+    tug_v, tug_f, _ = mesh_utils.load_mesh_cached(TUG_MESH)
+    ac_v, ac_f, _ = mesh_utils.load_mesh_cached(AC_MESH)
+    checker = clearance_utils.ClearanceChecker([("Tug_t5", tug_v, tug_f, np.identity(4))], ac_v, ac_f,
+                                               exclude=[clearance_utils.link_box(ac, "towbar", (0.6, 0.6, 0.8))])
+    checker.check(alignment["tug_matrix"], alignment["aircraft_matrix"])  # builds the distance grid
+    return lambda: checker.check(alignment["tug_matrix"], alignment["aircraft_matrix"])
+
+
+def _scan_for_export(ctx):
+    """The production scan when it ran, otherwise 500k synthetic points."""
+    if "scan" in ctx:
+        return ctx["scan"]
+    n = 500000
+    rng = np.random.default_rng(0)
+    return {"categoryID": rng.integers(0, 6, n), "partID": rng.integers(0, 6, n),
+            "X": rng.random(n), "Y": rng.random(n), "Z": rng.random(n),
+            "distance": rng.random(n) * 30, "intensity": rng.random(n),
+            "azimuthIndex": rng.integers(0, 900, n), "elevationIndex": rng.integers(0, 818, n),
+            "names": ["Tug_t5", "a3320_ceo", "Wall_Back", "Wall_Left", "Wall_Right", "Floor"]}
+
+
+@benchmark("labeling.label_1M")
+def bench_labeling(ctx):
+    import urdf_utils
+    import labeling_utils
+    model = urdf_utils.load_and_verify_urdf(AC_URDF)
+    ac_matrix = mesh_utils.transform_matrix((-12.0, 0.0, 0.0))
+    link_poses, _ = urdf_utils.batched_link_fk(model, ac_matrix[None])
+    placed = labeling_utils.world_volumes(labeling_utils.link_volumes(model, point_radius=0.3), link_poses[0])
+    points = np.random.default_rng(0).random((1_000_000, 3)) * (40, 36, 13) + (-50, -18, -3.6)
+    return lambda: labeling_utils.label_points(placed, points)
+
+
+@benchmark("export.csv_write_read", repeat=3)
+def bench_csv(ctx):
+    scan = _scan_for_export(ctx)
+
+    def run():
+        raycast_utils.write_csv(scan, ctx["tmp"], "bench")
+        return raycast_utils.read_csv(os.path.join(ctx["tmp"], "bench.csv"))
+    return run
+
+
+@benchmark("export.lscan_write_read")
+def bench_lscan(ctx):
+    scan = _scan_for_export(ctx)
+
+    def run():
+        header, columns = scan_io.read_scan(scan_io.write_scan(scan, ctx["tmp"], "bench"))
+        return float(columns["distance"].sum())
+    return run
+
+
+@benchmark("export.async_lscan_x8", repeat=3)
+def bench_async_export(ctx):
+    import async_export
+    scan = _scan_for_export(ctx)
+
+    def run():
+        with async_export.ScanWriter(workers=2, max_pending=4) as writer:
+            for i in range(8):
+                writer.submit(scan, ctx["tmp"], f"bench_async_{i}", "binary")
+    return run
+
+
+# ---------------------------------------------------------------------------------------------------------
+# Runner and history
+
+def machine_id():
+    return f"{platform.node()}|{platform.machine()}|{platform.python_version()}|numpy {np.__version__}|{os.cpu_count()} cpus"
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmarks(only=None, repeat=None, quick=False):
+    """Runs the selected stages. Returns {name: {median, min, runs} or {skipped: reason}}."""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        ctx = {"tmp": tmp, "quick": quick}
+        for name, default_repeat, fn in BENCHMARKS:
+            if only and not any(name.startswith(prefix) for prefix in only):
+                continue
+            try:
+                run = fn(ctx)
+                times = []
+                for _ in range(repeat or default_repeat):
+                    start = time.perf_counter()
+                    run()
+                    times.append(time.perf_counter() - start)
+            except (Exception, SystemExit) as e:  # load_and_verify_urdf exits on failure
+                results[name] = {"skipped": f"{type(e).__name__}: {e}"}
+                print(f"{name:34s} skipped ({type(e).__name__}: {e})")
+                continue
+            results[name] = {"median": statistics.median(times), "min": min(times), "runs": len(times)}
+            print(f"{name:34s} median {results[name]['median'] * 1e3:10.2f} ms   min {results[name]['min'] * 1e3:10.2f} ms")
+    return results
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def regressions(results, history, machine, quick, threshold):
+    """[(name, median, baseline)] of stages slower than threshold x the best earlier median on this machine."""
+    found = []
+    for name, result in results.items():
+        if "median" not in result:
+            continue
+        earlier = [run["results"][name]["median"] for run in history
+                   if run.get("machine") == machine and run.get("quick") == quick
+                   and "median" in run.get("results", {}).get(name, {})]
+        if earlier and result["median"] > threshold * min(earlier):
+            found.append((name, result["median"], min(earlier)))
+    return found
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the lidar placement pipeline (no Blender needed).")
+    parser.add_argument("--only", nargs="*", help="stage name prefixes, e.g. mesh raycast.scan")
+    parser.add_argument("--repeat", type=int, help="override the per-stage repeat count")
+    parser.add_argument("--quick", action="store_true", help="coarse ray grid for raycast.scan_production")
+    parser.add_argument("--history", default=os.path.join(HERE, "bench_history.jsonl"))
+    parser.add_argument("--threshold", type=float, default=1.25, help="allowed slowdown vs. the best earlier run")
+    parser.add_argument("--no-record", action="store_true", help="compare only, do not append to the history")
+    args = parser.parse_args(argv)
+
+    history = load_history(args.history)
+    machine = machine_id()
+    results = run_benchmarks(args.only, args.repeat, args.quick)
+    slow = regressions(results, history, machine, args.quick, args.threshold)
+    for name, median, baseline in slow:
+        print(f"REGRESSION {name}: {median * 1e3:.2f} ms vs. best {baseline * 1e3:.2f} ms (x{median / baseline:.2f})")
+
+    if not args.no_record:
+        entry = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": git_commit(), "machine": machine,
+                 "quick": args.quick, "threshold": args.threshold, "results": results,
+                 "regressions": [name for name, _, _ in slow]}
+        with open(args.history, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+    return 1 if slow else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
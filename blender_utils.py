@@ -5,6 +5,14 @@ import bmesh
 import os
 from mathutils import Vector, Euler
 import random
+import numpy as np
+
+import mesh_utils
+import sampling_utils
+import sensor_models
+import instrumentation
+
+log = instrumentation.get_logger(__name__)
 
 
 
@@ -38,14 +46,14 @@ def create_boundary_walls(size=60, distance=30):
         wall = bpy.context.active_object
         wall.name = name
         wall.data.materials.append(wall_materials)
-        print(f"Created '{name}'")
+        log.debug(f"Created '{name}'")
 
 def import_stl(filepath, model_name):
     """Imports an STL model and gives it a specific name."""
     bpy.ops.wm.stl_import(filepath=filepath)
     imported_obj = bpy.context.active_object
     imported_obj.name = model_name
-    print(f"Imported {model_name}")
+    log.info(f"Imported {model_name}")
     return imported_obj  
 
 def import_ply(filepath, model_name):
@@ -53,16 +61,35 @@ def import_ply(filepath, model_name):
     bpy.ops.wm.ply_import(filepath=filepath)
     imported_obj = bpy.context.active_object
     imported_obj.name = model_name
-    print(f"Imported {model_name}")
+    log.info(f"Imported {model_name}")
     return imported_obj  
 
+def import_mesh_cached(filepath, model_name):
+    """Creates a mesh object from a PLY/STL through mesh_utils' parser and .npz cache (no import operator)."""
+    vertices, faces, _ = mesh_utils.load_mesh_cached(filepath)
+    mesh = bpy.data.meshes.new(model_name)
+    mesh.vertices.add(len(vertices))
+    mesh.vertices.foreach_set("co", np.ascontiguousarray(vertices, dtype=np.float32).ravel())
+    mesh.loops.add(3 * len(faces))
+    mesh.loops.foreach_set("vertex_index", np.ascontiguousarray(faces, dtype=np.int32).ravel())
+    mesh.polygons.add(len(faces))
+    mesh.polygons.foreach_set("loop_start", np.arange(0, 3 * len(faces), 3, dtype=np.int32))
+    mesh.polygons.foreach_set("loop_total", np.full(len(faces), 3, dtype=np.int32))
+    mesh.update()
+    mesh.validate()
+    imported_obj = bpy.data.objects.new(model_name, mesh)
+    bpy.context.collection.objects.link(imported_obj)
+    bpy.context.view_layer.objects.active = imported_obj
+    log.info(f"Imported {model_name}")
+    return imported_obj
+
 def get_position(object_name):
     """Gets the world-space location of an object."""
     obj = bpy.data.objects.get(object_name)
     if obj:
         return obj.location
     else:
-        print(f"Object {object_name} not found.")
+        log.warning(f"Object {object_name} not found.")
         return None
 
 def set_position(object_name, position):
@@ -70,15 +97,15 @@ def set_position(object_name, position):
     obj = bpy.data.objects.get(object_name)
     if obj:
         obj.location = position
-        print(f"Set position of '{object_name}' to {position}")
+        log.debug(f"Set position of '{object_name}' to {position}")
     else:
-        print(f"Warning: Object '{object_name}' not found.")  
+        log.warning(f"Object '{object_name}' not found.")  
 
 def set_transform(object_name, position, rotation):
     """Sets the object's location and rotation (in degrees)."""
     obj = bpy.data.objects.get(object_name)
     if not obj:
-        print(f"Warning: Object '{object_name}' not found.")
+        log.warning(f"Object '{object_name}' not found.")
         return
         
     rotation_radians = (
@@ -90,9 +117,7 @@ def set_transform(object_name, position, rotation):
     obj.location = position
     obj.rotation_euler = rotation_radians
     
-    print(f"Set transform for '{object_name}':")
-    print(f"  Position: {position}")
-    print(f"  Rotation (XYZ degrees): {rotation}")
+    log.debug(f"Set transform for '{object_name}': position {position}, rotation (XYZ degrees) {rotation}")
 
 def assign_material(object_name, color=(0.6, 0.6, 0.6, 1.0), roughness=0.5):
     """Assigns a simple new material to an object for range_scanner addon"""
@@ -109,7 +134,7 @@ def assign_material(object_name, color=(0.6, 0.6, 0.6, 1.0), roughness=0.5):
             obj.data.materials[0] = material
         else:
             obj.data.materials.append(material)
-        print(f"Assigned basic material '{mat_name}' to '{object_name}'.")
+        log.debug(f"Assigned basic material '{mat_name}' to '{object_name}'.")
 
 def make_object_scannable(object_name):
     """Ensures an object is visible to the Lidar scanner."""
@@ -119,9 +144,9 @@ def make_object_scannable(object_name):
         obj.cycles_visibility.camera = True
         obj.cycles_visibility.diffuse = True
         obj.cycles_visibility.shadow = True
-        print(f" Made '{object_name}' fully visible for scanning.")
+        log.debug(f"Made '{object_name}' fully visible for scanning.")
     else:
-        print(f"Warning: Could not find '{object_name}' to make it scannable.")
+        log.warning(f"Could not find '{object_name}' to make it scannable.")
 
 # def create_debug_marker(position, name="DebugMarker", size=0.01):
 #     """
@@ -173,22 +198,23 @@ def save_blend_file(filepath):
         filepath += ".blend"
     
     bpy.ops.wm.save_as_mainfile(filepath=filepath)
-    print(f"Scene saved to: {filepath}")
+    log.info(f"Scene saved to: {filepath}")
 
 def load_blend_file(filepath):
     """Loads a .blend file, replacing the current scene."""
     if not os.path.exists(filepath):
-        print(f"ERROR: File not found, cannot load: {filepath}")
+        log.error(f"File not found, cannot load: {filepath}")
         return False
         
     bpy.ops.wm.open_mainfile(filepath=filepath)
-    print(f"Scene loaded from: {filepath}")
+    log.info(f"Scene loaded from: {filepath}")
     return True
 
-def create_camera(name, location, rotation_degrees, scale=(1,1,1)):
+def create_camera(name, location, rotation_degrees, scale=(1,1,1), sensor_model=None):
     """
     Creates a new camera object in the scene.
-    
+    sensor_model names a sensor_models model (e.g. "vlp16"); it is stored on the object and
+    selects the scan pattern, range limits and mounting offset of its scans.
     """
     try:
         #Create new camera data
@@ -208,12 +234,15 @@ def create_camera(name, location, rotation_degrees, scale=(1,1,1)):
             math.radians(rotation_degrees[1]),
             math.radians(rotation_degrees[2])
         )
+        if sensor_model is not None:
+            sensor_models.get_sensor(sensor_model)
+            cam_obj["sensor_model"] = sensor_model
         
-        print(f" Successfully created camera '{name}' at {location}")
+        log.debug(f"Created camera '{name}' at {location}")
         return cam_obj
         
     except Exception as e:
-        print(f"ERROR in create_camera: {e}")
+        log.error(f"create_camera failed: {e}")
         return None
 
 ###############################################################################################################################################################
@@ -236,7 +265,7 @@ def get_plate_area(obj_name):
     # Get the object from Blender
     obj = bpy.data.objects.get(obj_name)
     if not obj or obj.type != 'MESH':
-        print(f"Error: {obj_name} not found or not a mesh.")
+        log.error(f"{obj_name} not found or not a mesh.")
         return 0.0
 
     # Get its evaluated mesh (includes transformations)
@@ -316,34 +345,9 @@ def get_grid_points(plate_name: str,
             raise RuntimeError(f"{plate_name}: could not determine top face.")
 
 
-    c = sum(top_world, Vector((0,0,0))) / 4.0
-    def ang(pt): return (pt - c).to_2d().angle_signed(Vector((1,0)))
-    top_world.sort(key=ang)
-    p0, p1, p2, p3 = top_world
-
-    # Plate normal (world)
-    z_hat = (p1 - p0).cross(p3 - p0).normalized()
-    if z_hat.length == 0:
-        raise RuntimeError("Degenerate plate: cannot compute normal.")
-
-    # Bilinear interpolation inside the quad with margins
-    u0, u1 = margin, 1.0 - margin
-    v0, v1 = margin, 1.0 - margin
-    us = [u0 + i*(u1-u0)/(nx-1) for i in range(nx)] if nx > 1 else [(u0+u1)/2]
-    vs = [v0 + j*(v1-v0)/(ny-1) for j in range(ny)] if ny > 1 else [(v0+v1)/2]
-
-    def lerp(a,b,t): return a + t*(b-a)
-    def bilinear(u,v):
-        a = lerp(p0, p1, u)
-        b = lerp(p3, p2, u)
-        return lerp(a, b, v)
-
-    points, indices = [], []
-    for j, v in enumerate(vs):
-        for i, u in enumerate(us):
-            P = bilinear(u, v) + z_hat * height_offset
-            points.append(P)
-            indices.append((i, j))
+    # Bilinear lattice inside the quad with margins (sampling_utils, so workers can rebuild it without Blender)
+    grid, indices = sampling_utils.quad_grid([tuple(p) for p in top_world], nx, ny, margin, height_offset)
+    points = [Vector(P) for P in grid]
 
     # Optional visualization as empties
     if visualize:
@@ -362,3 +366,41 @@ def get_grid_points(plate_name: str,
     return points, indices
 
 
+def mesh_arrays_in_frame(obj, frame_obj):
+    """(vertices, triangles) of a mesh object in the unscaled location/rotation frame of frame_obj (e.g. the tug)."""
+    vertices, faces = mesh_arrays(obj)
+    frame = mesh_utils.transform_matrix(tuple(frame_obj.location), tuple(frame_obj.rotation_euler))
+    return sampling_utils.transform_points(vertices, np.linalg.inv(frame)), faces
+
+
+def mesh_arrays(obj):
+    """World-space (vertices (V,3), triangles (F,3)) of a mesh object, read with foreach_get."""
+    deps = bpy.context.evaluated_depsgraph_get()
+    obj_eval = obj.evaluated_get(deps)
+    mesh = obj_eval.to_mesh()
+    mesh.calc_loop_triangles()
+    vertices = np.empty(3 * len(mesh.vertices), dtype=np.float64)
+    mesh.vertices.foreach_get("co", vertices)
+    faces = np.empty(3 * len(mesh.loop_triangles), dtype=np.int64)
+    mesh.loop_triangles.foreach_get("vertices", faces)
+    M = np.array(obj_eval.matrix_world)
+    obj_eval.to_mesh_clear()
+    return sampling_utils.transform_points(vertices.reshape(-1, 3), M), faces.reshape(-1, 3)
+
+
+def get_sampled_points(plate_name, method="grid", spacing=0.1, count=1000, margin=0.10,
+                       height_offset=0.03, min_up_dot=0.9, seed=0):
+    """
+    NumPy alternative to get_grid_points for any triangulated plate: "grid", "random" or "poisson"
+    samples on its up-facing faces (see sampling_utils.sample_candidates; margin is in meters here).
+    Returns (points as Vectors, indices), like get_grid_points.
+    """
+    obj = bpy.data.objects.get(plate_name)
+    if not obj or obj.type != 'MESH':
+        raise ValueError(f"{plate_name} not found or not a mesh.")
+    vertices, faces = mesh_arrays(obj)
+    result = sampling_utils.sample_candidates(vertices, faces, method=method, spacing=spacing, count=count,
+                                              margin=margin, normal_offset=height_offset,
+                                              min_up_dot=min_up_dot, seed=seed)
+    points = [Vector(p) for p in result["points"]]
+    return points, list(range(len(points)))
@@ -0,0 +1,201 @@
+#
+# FILE: clearance_utils.py
+#
+# Tug-aircraft clearance for whole batches of poses, before anything is
+# scanned. The aircraft surface near the tug is turned once into a sparse
+# narrow-band distance grid: every voxel within `band` of the skin stores
+# its nearest surface sample (with the face normal for the sign). The tug
+# and the parts riding on it (the lidar plates) are sampled once in the tug
+# frame; a pose is then checked by moving those samples into the aircraft
+# frame and looking their voxels up, a few milliseconds per pose.
+#
+import numpy as np
+
+import coverage_utils
+import fusion_utils
+import urdf_utils
+import instrumentation
+
+log = instrumentation.get_logger(__name__)
+
+
+def _first_per_key(keys, order=None):
+    """Index of the first occurrence (in order, by default a stable argsort) of every distinct key, in key order."""
+    order = np.argsort(keys, kind="stable") if order is None else order
+    return order[np.flatnonzero(np.r_[True, np.diff(keys[order]) != 0][:len(order)])]
+
+
+def link_box(model, link, half_extent):
+    """Aircraft-frame (lo, hi) box of half_extent (m) around a URDF link at the model's rest pose."""
+    links, _ = urdf_utils.batched_link_fk(model, np.zeros((1, 3)))
+    center = links[0, urdf_utils.kinematic_tree(model)["link_index"][link], :3, 3]
+    return center - np.asarray(half_extent, dtype=float), center + np.asarray(half_extent, dtype=float)
+
+
+class ClearanceChecker:
+    """
+    Minimum tug-aircraft distance for batches of (tug matrix, aircraft matrix) poses.
+
+        checker = ClearanceChecker([("Tug_t5", tug_v, tug_f, np.identity(4))], ac_v, ac_f,
+                                   exclude=[link_box(ac_data, "towbar", (0.6, 0.6, 0.8))])
+        result = checker.check(alignment["tug_matrix"], alignment["aircraft_matrix"], clearance=0.05)
+
+    tug_parts are (name, vertices, faces, part-to-tug 4x4) meshes rigidly attached to the tug.
+    exclude lists aircraft-frame (lo, hi) boxes whose skin is ignored: the nose gear rests in the
+    tug's cradle by design. Distances are estimated from skin samples voxel_size / 2 apart and
+    err on the short side; beyond band they are reported as band. The distance grid covers the
+    region the checked poses reach and grows when later poses leave it.
+    """
+
+    def __init__(self, tug_parts, ac_vertices, ac_faces, voxel_size=0.05, band=0.15, exclude=()):
+        self.voxel_size = float(voxel_size)
+        self.band = float(band)
+        self.exclude = [(np.asarray(lo, dtype=float), np.asarray(hi, dtype=float)) for lo, hi in exclude]
+        self.part_names = []
+        points, part = [], []
+        for i, (name, vertices, faces, matrix) in enumerate(tug_parts):
+            M = np.asarray(matrix, dtype=np.float64)
+            world = np.asarray(vertices, dtype=np.float64) @ M[:3, :3].T + M[:3, 3]
+            samples, _ = coverage_utils.sample_triangles(world, faces, self.voxel_size)
+            # Dense meshes give many samples per voxel: one per half voxel is enough.
+            samples = samples[_first_per_key(fusion_utils.pack_voxels(np.floor(samples / (self.voxel_size / 2))))]
+            points.append(samples)
+            part.append(np.full(len(samples), i, dtype=np.int32))
+            self.part_names.append(name)
+        points, part = np.concatenate(points), np.concatenate(part)
+
+        # Tug samples grouped into cells of 4 voxels for the broad phase.
+        self.cell_size = 4 * self.voxel_size
+        cells = fusion_utils.pack_voxels(np.floor(points / self.cell_size))
+        order = np.argsort(cells, kind="stable")
+        self.tug_points, self.tug_part = points[order], part[order]
+        starts = np.flatnonzero(np.r_[True, np.diff(cells[order]) != 0])
+        self._cell_start = starts
+        self._cell_count = np.diff(np.r_[starts, len(order)])
+        self._cell_center = np.add.reduceat(self.tug_points, starts, axis=0) / self._cell_count[:, None]
+        self._ac_triangles = np.asarray(ac_vertices, dtype=np.float64)[np.asarray(ac_faces)]
+        self._region = None
+        self._field = None
+
+    def _build_field(self, lo, hi):
+        """Narrow-band grid over the aircraft skin inside [lo, hi] (aircraft frame)."""
+        h, band = self.voxel_size, self.band
+        lo, hi = lo - band - h, hi + band + h
+        tris = self._ac_triangles
+        near = np.all((tris.max(axis=1) >= lo) & (tris.min(axis=1) <= hi), axis=1)
+        with instrumentation.span("clearance_field", triangles=int(near.sum())):
+            tris = tris[near]
+            samples, faces = coverage_utils.sample_triangles(tris.reshape(-1, 3), np.arange(3 * len(tris)).reshape(-1, 3), h / 2)
+            normals = np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0])[faces]
+            normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+            keep = np.all((samples >= lo) & (samples <= hi), axis=1)
+            for box_lo, box_hi in self.exclude:
+                keep &= ~np.all((samples >= box_lo) & (samples <= box_hi), axis=1)
+            samples, normals = samples[keep], normals[keep]
+
+            reach = int(np.ceil(band / h))
+            offsets = np.stack(np.meshgrid(*[np.arange(-reach, reach + 1)] * 3, indexing="ij"), axis=-1).reshape(-1, 3)
+            keys, sq, idx = [np.zeros(0, dtype=np.int64)], [np.zeros(0)], [np.zeros(0, dtype=np.int64)]
+            for start in range(0, len(samples), 4096):
+                s = samples[start:start + 4096]
+                ijk = np.floor(s / h).astype(np.int64)[:, None, :] + offsets
+                d2 = (((ijk + 0.5) * h - s[:, None, :]) ** 2).sum(axis=2)
+                inside = d2 <= (band + h) ** 2
+                keys.append(fusion_utils.pack_voxels(ijk[inside]))
+                sq.append(d2[inside])
+                idx.append(np.broadcast_to(np.arange(start, start + len(s))[:, None], inside.shape)[inside])
+            keys, sq, idx = np.concatenate(keys), np.concatenate(sq), np.concatenate(idx)
+            first = _first_per_key(keys, np.lexsort((sq, keys)))
+
+            # Broad phase: coarse cells holding band voxels, grown by one cell so that a tug cell
+            # whose centre falls outside them cannot reach the band.
+            ijk = np.floor((fusion_utils.unpack_voxels(keys[first]) + 0.5) * h / self.cell_size).astype(np.int64)
+            ijk = np.unique(ijk.reshape(-1, 3), axis=0)
+            grown = (ijk[:, None, :] + np.stack(np.meshgrid(*[np.arange(-1, 2)] * 3, indexing="ij"), axis=-1).reshape(-1, 3)).reshape(-1, 3)
+        self._field = {"keys": keys[first], "sample": idx[first].astype(np.int32), "samples": samples, "normals": normals,
+                       "cells": np.unique(fusion_utils.pack_voxels(grown))}
+        self._region = (lo + band + h, hi - band - h)
+        log.debug(f"Clearance field: {len(first)} voxels over {len(samples)} skin samples")
+
+    def signed_distance(self, points):
+        """Signed distance (m) of (N,3) aircraft-frame points to the skin (negative inside), clipped to +band."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        field = self._field
+        distance = np.full(len(points), self.band)
+        if field is None or not len(field["keys"]):
+            return distance
+        ijk = np.floor(points / self.voxel_size)
+        found, pos = _lookup(field["keys"], fusion_utils.pack_voxels(ijk))
+        nearest = field["sample"][pos]
+        delta = points[found] - field["samples"][nearest]
+        normal = np.einsum("ij,ij->i", delta, field["normals"][nearest])
+        # The sample nearest to the voxel centre is at most twice the point-centre offset further
+        # from the point than the point's own nearest sample: clamp the tangent-plane distance to that range.
+        upper = np.linalg.norm(delta, axis=1)
+        lower = np.maximum(upper - 2 * np.linalg.norm(points[found] - (ijk[found] + 0.5) * self.voxel_size, axis=1), 0.0)
+        d = np.clip(np.abs(normal), lower, upper)
+        distance[found] = np.minimum(np.where(normal < 0, -d, d), self.band)
+        return distance
+
+    def check(self, tug_matrices, aircraft_matrices, clearance=0.05, batch_poses=256):
+        """
+        Clearance of every pose. Returns a dict of (N,) arrays: min_distance (signed, m, capped at
+        band), closest_part (index into part_names, -1 when clear of the band), feasible
+        (min_distance >= clearance), plus part_distance (N, parts).
+        """
+        tug_matrices = np.asarray(tug_matrices, dtype=np.float64).reshape(-1, 4, 4)
+        aircraft_matrices = np.broadcast_to(np.asarray(aircraft_matrices, dtype=np.float64).reshape(-1, 4, 4), tug_matrices.shape)
+        relative = np.linalg.inv(aircraft_matrices) @ tug_matrices
+        n_parts = len(self.part_names)
+
+        # Grow the grid to the region the poses reach (bounding-box corners of the tug samples).
+        lo, hi = self.tug_points.min(axis=0), self.tug_points.max(axis=0)
+        corners = np.stack(np.meshgrid(*zip(lo, hi), indexing="ij"), axis=-1).reshape(-1, 3)
+        reach = np.einsum("nij,cj->nci", relative[:, :3, :3], corners) + relative[:, None, :3, 3]
+        lo, hi = reach.min(axis=(0, 1)), reach.max(axis=(0, 1))
+        if self._region is None or np.any(lo < self._region[0]) or np.any(hi > self._region[1]):
+            if self._region is not None:
+                lo, hi = np.minimum(lo, self._region[0]), np.maximum(hi, self._region[1])
+            self._build_field(lo, hi)
+
+        part_distance = np.full((len(relative), n_parts), self.band)
+        with instrumentation.span("clearance_check", poses=len(relative)):
+            for start in range(0, len(relative) if len(self._field["cells"]) else 0, batch_poses):
+                R = relative[start:start + batch_poses]
+                centers = np.einsum("nij,cj->nci", R[:, :3, :3], self._cell_center) + R[:, None, :3, 3]
+                near, _ = _lookup(self._field["cells"], fusion_utils.pack_voxels(np.floor(centers.reshape(-1, 3) / self.cell_size)))
+                if not len(near):
+                    continue
+                pose, cell = np.divmod(near, len(self._cell_center))
+                counts = self._cell_count[cell]
+                first = np.repeat(self._cell_start[cell] - np.cumsum(counts) + counts, counts)
+                point = first + np.arange(counts.sum())
+                pose = np.repeat(pose, counts)
+                world = np.einsum("kij,kj->ki", R[pose, :3, :3], self.tug_points[point]) + R[pose, :3, 3]
+                np.minimum.at(part_distance, (start + pose, self.tug_part[point]), self.signed_distance(world))
+        min_distance = part_distance.min(axis=1)
+        return {
+            "min_distance": min_distance,
+            "closest_part": np.where(min_distance < self.band, part_distance.argmin(axis=1), -1),
+            "part_distance": part_distance,
+            "feasible": min_distance >= clearance,
+        }
+
+
+def _lookup(sorted_keys, keys):
+    """(indices of keys present in sorted_keys, their positions there)."""
+    pos = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+    found = np.flatnonzero(sorted_keys[pos] == keys)
+    return found, pos[found]
+
+
+def feasible_yaws(checker, alignment, clearance=0.05):
+    """
+    Yaws of an alignment_utils.align_aircraft result whose tug keeps clearance to the aircraft,
+    plus the full check result. Logs every rejected yaw with its closest part.
+    """
+    result = checker.check(alignment["tug_matrix"], alignment["aircraft_matrix"], clearance)
+    for yaw, d, part in zip(alignment["yaw_deg"], result["min_distance"], result["closest_part"]):
+        if d < clearance:
+            log.info(f"Yaw {yaw:g}: {checker.part_names[part]} at {d:.3f} m from the aircraft (< {clearance} m), skipped.")
+    return [float(y) for y, ok in zip(alignment["yaw_deg"], result["feasible"]) if ok], result
@@ -0,0 +1,240 @@
+#
+# FILE: coverage_utils.py
+#
+# Aircraft coverage scoring for lidar placements. The aircraft surface is
+# voxelized once (in the aircraft's own frame); each scan is then scored by
+# binning its aircraft hits into those voxels with vectorized lookups.
+#
+import math
+import numpy as np
+
+import mesh_utils
+import mesh_lod
+import instrumentation
+
+log = instrumentation.get_logger(__name__)
+
+AIRCRAFT_REGION = "aircraft"
+
+
+def _row_weights(n, m):
+    """Barycentric weights of rows parallel to edge 0-1 (n steps along it) stacked towards vertex 2 (m rows)."""
+    weights = []
+    for r in range(m + 1):
+        t = r / m
+        u = np.linspace(0.0, 1.0, max(int(math.ceil(n * (1.0 - t))), 0) + 1)
+        weights.append(np.stack([(1.0 - t) * (1.0 - u), (1.0 - t) * u, np.full_like(u, t)], axis=1))
+    return np.concatenate(weights)
+
+
+def sample_triangles(vertices, faces, spacing):
+    """
+    Samples every triangle on rows parallel to its longest edge, no sample further than
+    spacing from its neighbours; the count follows the triangle area, so slivers stay cheap.
+    Returns (points (P,3), face index (P,)).
+    """
+    tris = np.asarray(vertices, dtype=np.float64)[np.asarray(faces)]
+    lengths = np.linalg.norm(tris[:, [1, 2, 0]] - tris, axis=2)
+    longest = lengths.argmax(axis=1)
+    order = (longest[:, None] + np.arange(3)) % 3
+    tris = np.take_along_axis(tris, order[:, :, None], axis=1)
+    edge = tris[:, 1] - tris[:, 0]
+    length = np.linalg.norm(edge, axis=1)
+    height = np.linalg.norm(np.cross(edge, tris[:, 2] - tris[:, 0]), axis=1) / np.maximum(length, 1e-12)
+    n = np.maximum(np.ceil(length / spacing), 1).astype(np.int64)
+    m = np.maximum(np.ceil(height / spacing), 1).astype(np.int64)
+
+    group = n * (m.max() + 1) + m
+    sort = np.argsort(group, kind="stable")
+    starts = np.flatnonzero(np.r_[True, np.diff(group[sort]) != 0])
+    points, face_ids = [], []
+    for sel in np.split(sort, starts[1:]):
+        weights = _row_weights(int(n[sel[0]]), int(m[sel[0]]))
+        points.append(np.einsum("mk,tkd->tmd", weights, tris[sel]).reshape(-1, 3))
+        face_ids.append(np.repeat(sel, len(weights)))
+    return np.concatenate(points), np.concatenate(face_ids)
+
+
+def voxel_keys(points, origin, voxel_size, dims):
+    """Packed int64 voxel keys of points (-1 for points outside the grid)."""
+    ijk = np.floor((np.asarray(points) - origin) / voxel_size).astype(np.int64)
+    inside = np.all((ijk >= 0) & (ijk < dims), axis=1)
+    keys = (ijk[:, 0] * dims[1] + ijk[:, 1]) * dims[2] + ijk[:, 2]
+    return np.where(inside, keys, -1)
+
+
+def voxelize_aircraft(vertices, faces, voxel_size=0.1, regions=None):
+    """
+    Surface voxel model of the aircraft mesh (aircraft-local frame).
+    regions optionally maps region names (e.g. URDF links such as "towbar" or the gear
+    wheel links) to (center, radius) spheres in the same frame; voxels inside a sphere
+    belong to that region, all others to AIRCRAFT_REGION.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64)
+    samples, _ = sample_triangles(vertices, faces, voxel_size / 3.0)
+    origin = vertices.min(axis=0) - voxel_size
+    dims = np.ceil((vertices.max(axis=0) + voxel_size - origin) / voxel_size).astype(np.int64) + 1
+    keys = np.unique(voxel_keys(samples, origin, voxel_size, dims))
+    keys = keys[keys >= 0]
+
+    k = keys.copy()
+    ijk = np.empty((len(k), 3), dtype=np.int64)
+    ijk[:, 2] = k % dims[2]
+    k //= dims[2]
+    ijk[:, 1] = k % dims[1]
+    ijk[:, 0] = k // dims[1]
+    centers = origin + (ijk + 0.5) * voxel_size
+
+    region_names = [AIRCRAFT_REGION]
+    region = np.zeros(len(keys), dtype=np.int32)
+    for name, (center, radius) in (regions or {}).items():
+        region_names.append(name)
+        inside = np.linalg.norm(centers - np.asarray(center, dtype=float), axis=1) <= radius
+        region[inside] = len(region_names) - 1
+
+    return {
+        "voxel_size": voxel_size,
+        "origin": origin,
+        "dims": dims,
+        "keys": keys,
+        "centers": centers,
+        "region": region,
+        "region_names": region_names,
+        "region_voxels": np.bincount(region, minlength=len(region_names)),
+    }
+
+
+def load_aircraft_model(mesh_path, voxel_size=0.1, regions=None, lod=False):
+    """
+    Voxel model straight from the aircraft mesh file. With lod, the surface is sampled from the
+    coarsest mesh_lod level within a quarter voxel of the source, which only moves samples near
+    voxel borders.
+    """
+    if lod:
+        lods = mesh_lod.load_lods(mesh_path)
+        level = lods[mesh_lod.level_within(lods, voxel_size / 4.0)]
+        vertices, faces = level["vertices"], level["faces"]
+        log.debug(f"Coverage model of {mesh_path} from the {level['error'] * 1000:g} mm level ({len(faces)} faces)")
+    else:
+        vertices, faces, _ = mesh_utils.load_mesh_cached(mesh_path)
+    return voxelize_aircraft(vertices, faces, voxel_size, regions)
+
+
+def link_regions(link_poses, link_names, radius=0.5, aircraft_matrix=None):
+    """
+    Region spheres around URDF links, in the aircraft frame.
+    link_poses is a urdf_utils.link_positions dict; pass the aircraft matrix it was
+    computed with so the centers can be brought back into the mesh frame.
+    """
+    to_local = np.identity(4) if aircraft_matrix is None else np.linalg.inv(aircraft_matrix)
+    regions = {}
+    for name in link_names:
+        pose = link_poses.get(name)
+        if pose is None:
+            log.warning(f"Link '{name}' not found, no coverage region created.")
+            continue
+        regions[name] = ((to_local @ pose)[:3, 3], radius)
+    return regions
+
+
+def score_points(model, points, distances=None, aircraft_matrix=None):
+    """
+    Coverage of one scan's aircraft hits (world-space points).
+    Returns a dict with the overall and per-region covered fraction, hits per covered
+    voxel, minimum hit distance and the covered voxel indices (for set operations).
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    if aircraft_matrix is not None:
+        inv = np.linalg.inv(aircraft_matrix)
+        points = points @ inv[:3, :3].T + inv[:3, 3]
+    keys = voxel_keys(points, model["origin"], model["voxel_size"], model["dims"])
+    idx = np.searchsorted(model["keys"], keys)
+    idx = np.minimum(idx, len(model["keys"]) - 1)
+    matched = (keys >= 0) & (model["keys"][idx] == keys)
+    hit_voxels = idx[matched]
+
+    counts = np.bincount(hit_voxels, minlength=len(model["keys"]))
+    covered = counts > 0
+    n_regions = len(model["region_names"])
+    region_covered = np.bincount(model["region"], weights=covered, minlength=n_regions)
+    region_hits = np.bincount(model["region"], weights=counts, minlength=n_regions)
+
+    min_distance = math.inf
+    if distances is not None and matched.any():
+        min_distance = float(np.asarray(distances)[matched].min())
+
+    regions = {}
+    for r, name in enumerate(model["region_names"]):
+        voxels = model["region_voxels"][r]
+        regions[name] = {
+            "coverage": float(region_covered[r] / voxels) if voxels else 0.0,
+            "density": float(region_hits[r] / region_covered[r]) if region_covered[r] else 0.0,
+        }
+    return {
+        "coverage": float(covered.mean()) if len(covered) else 0.0,
+        "hits": int(matched.sum()),
+        "unmatched": int(len(keys) - matched.sum()),
+        "density": float(counts.sum() / max(covered.sum(), 1)),
+        "min_distance": min_distance,
+        "regions": regions,
+        "covered_voxels": np.flatnonzero(covered),
+    }
+
+
+def target_mask(names, object_ids, target):
+    """Mask of the hits on the target object; none (with a warning) when the scan does not name it."""
+    if target not in names:
+        log.warning(f"Scan has no object '{target}' (objects: {', '.join(map(str, names)) or 'none'}); scoring it as uncovered.")
+        return np.zeros(len(object_ids), dtype=bool)
+    return np.asarray(object_ids) == names.index(target)
+
+
+def scan_aircraft_matrix(metadata):
+    """
+    Aircraft world matrix recorded in scan metadata: "aircraft_matrix" (full pose, written by the
+    scheduler), else a translation to "aircraft_location"; None when neither is present.
+    """
+    if metadata.get("aircraft_matrix") is not None:
+        return np.asarray(metadata["aircraft_matrix"], dtype=np.float64)
+    location = metadata.get("aircraft_location")
+    return None if location is None else mesh_utils.transform_matrix(location)
+
+
+def score_scan(model, scan, aircraft_matrix=None, target="a3320_ceo"):
+    """
+    Scores a scan dict (raycast_utils/scan_cache layout), keeping only hits on the target object.
+    A scan that does not name the target (e.g. a range_scanner CSV labelled by other categories) scores
+    zero coverage, with a warning, rather than counting tug and ground hits as aircraft.
+    """
+    mask = target_mask(list(scan["names"]), scan["categoryID"], target)
+    points = np.stack([scan["X"], scan["Y"], scan["Z"]], axis=1)[mask]
+    return score_points(model, points, np.asarray(scan["distance"])[mask], aircraft_matrix)
+
+
+def score_lscan(model, header, columns, target="a3320_ceo", aircraft_matrix=None):
+    """
+    Scores a memory-mapped .lscan (scan_io.read_scan) like score_scan. The aircraft pose is aircraft_matrix
+    when given, else the one recorded in the header metadata (scan_aircraft_matrix).
+    """
+    mask = target_mask(list(header["names"]), columns["object"], target)
+    matrix = scan_aircraft_matrix(header["metadata"]) if aircraft_matrix is None else aircraft_matrix
+    points = np.stack([columns["x"][mask], columns["y"][mask], columns["z"][mask]], axis=1)
+    return score_points(model, points, columns["distance"][mask], matrix)
+
+
+def rank_placements(model, sweep, target="a3320_ceo", region=None):
+    """
+    Scores every scan of a scan_io.load_sweep dict and returns [(name, score)] sorted
+    best first, by overall coverage or by the coverage of one region.
+    """
+    scores = [(name, score_lscan(model, header, columns, target)) for name, (header, columns) in sweep.items()]
+    key = (lambda s: s[1]["coverage"]) if region is None else (lambda s: s[1]["regions"][region]["coverage"])
+    return sorted(scores, key=key, reverse=True)
+
+
+def combined_coverage(model, scores):
+    """Covered fraction of the union of several scored scans (e.g. one lidar per plate)."""
+    covered = np.zeros(len(model["keys"]), dtype=bool)
+    for score in scores:
+        covered[score["covered_voxels"]] = True
+    return float(covered.mean()) if len(covered) else 0.0
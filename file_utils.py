@@ -0,0 +1,38 @@
+#
+# FILE: file_utils.py
+#
+# Content hashes of input files (meshes, URDFs), shared by the caches that
+# key on them: mesh_utils, mesh_lod, urdf_utils and scan_cache, and the tag
+# of the temporary files behind every atomic write.
+#
+import os
+import re
+import socket
+import hashlib
+
+_FILE_HASHES = {}
+# Host name as it appears in temporary file names (letters, digits and underscores only).
+HOST = re.sub(r"[^A-Za-z0-9_]", "_", socket.gethostname()) or "localhost"
+
+
+def temp_tag():
+    """
+    <host>-<pid> tag of this process's temporary file names. Output directories may be shared by
+    writers on several machines (scan_scheduler shards); the host tells async_export.remove_stale_temp
+    which writers it can check.
+    """
+    return f"{HOST}-{os.getpid()}"
+
+
+def file_hash(path):
+    """sha256 of a file's content, memoised on (path, size, mtime)."""
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    digest = _FILE_HASHES.get(memo_key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        digest = _FILE_HASHES[memo_key] = h.hexdigest()
+    return digest
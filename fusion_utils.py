@@ -0,0 +1,247 @@
+#
+# FILE: fusion_utils.py
+#
+# Streaming voxel-grid fusion of the scans of one orientation (e.g. yaw_045)
+# into a single downsampled cloud. Scans are consumed one at a time; each is
+# reduced to its occupied voxels and merged into sorted per-voxel arrays
+# (hit count, coordinate sums, minimum distance, hit-object mask and a bitset
+# of the source sensors), so memory follows the number of voxels, not points.
+#
+import os
+import re
+import json
+import numpy as np
+
+import file_utils
+import raycast_utils
+import scan_io
+import instrumentation
+
+log = instrumentation.get_logger(__name__)
+
+_AXIS_BITS = 21                      # voxel index range per axis: +-2^20
+_AXIS_OFFSET = 1 << (_AXIS_BITS - 1)
+_AXIS_MASK = (1 << _AXIS_BITS) - 1
+# Scan outputs: yaw_<tag>_<surface>_scan_<n>, plus any suffix range_scanner adds to CSV names.
+SCAN_NAME = re.compile(r"^(yaw_-?\d+(?:p\d+)?)_(.+?)_scan_\d+")
+SCAN_EXTENSIONS = (scan_io.EXTENSION + ".gz", scan_io.EXTENSION, ".csv.gz", ".csv")
+
+
+def pack_voxels(ijk):
+    """(N,3) signed voxel indices -> packed int64 keys (order-preserving per axis)."""
+    ijk = np.asarray(ijk, dtype=np.int64) + _AXIS_OFFSET
+    return (ijk[:, 0] << (2 * _AXIS_BITS)) | (ijk[:, 1] << _AXIS_BITS) | ijk[:, 2]
+
+
+def unpack_voxels(keys):
+    keys = np.asarray(keys, dtype=np.int64)
+    return np.stack([keys >> (2 * _AXIS_BITS), (keys >> _AXIS_BITS) & _AXIS_MASK, keys & _AXIS_MASK], axis=1) - _AXIS_OFFSET
+
+
+def _group_starts(sorted_keys):
+    return np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+
+
+class VoxelFusion:
+    """
+    Accumulates scans into a hashed voxel grid. add() reduces a scan to one row per occupied voxel;
+    rows are merged into the sorted grid whenever more than merge_rows are pending, so peak memory is
+    about (voxels + merge_rows) rows of (8 + 8 + 24 + 4 + 4 + 8 * sensor words) bytes.
+    """
+
+    def __init__(self, voxel_size=0.05, merge_rows=2_000_000):
+        self.voxel_size = float(voxel_size)
+        self.merge_rows = merge_rows
+        self.sensors = []
+        self.names = []
+        self.points_in = 0
+        self._grid = None
+        self._pending = []
+        self._pending_rows = 0
+
+    def _object_bits(self, object_ids, names):
+        """Maps a scan's object ids to bits of the fusion-wide object name list."""
+        remap = np.zeros(max(len(names), 1), dtype=np.uint32)
+        for i, name in enumerate(names):
+            if name not in self.names:
+                if len(self.names) == 32:
+                    raise ValueError("More than 32 distinct hit objects in one fusion.")
+                self.names.append(name)
+            remap[i] = np.uint32(1) << np.uint32(self.names.index(name))
+        return remap[np.asarray(object_ids, dtype=np.int64)]
+
+    def add(self, points, sensor, distances=None, object_ids=None, names=()):
+        """
+        Adds one scan's (N,3) world points, seen from the named sensor. Consecutive calls with the
+        same sensor (the chunks of raycast_utils.stream_scan) count as one scan.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        self.points_in += len(points)
+        if not self.sensors or self.sensors[-1] != sensor:
+            self.sensors.append(sensor)
+        s = len(self.sensors) - 1
+        if not len(points):
+            return
+        keys = pack_voxels(np.floor(points / self.voxel_size))
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        starts = _group_starts(keys)
+        rows = {
+            "key": keys[starts],
+            "count": np.diff(np.r_[starts, len(keys)]).astype(np.int64),
+            "sum": np.add.reduceat(points[order], starts, axis=0),
+            "min_distance": (np.full(len(starts), np.inf, dtype=np.float32) if distances is None else
+                             np.minimum.reduceat(np.asarray(distances, dtype=np.float32)[order], starts)),
+            "objects": (np.zeros(len(starts), dtype=np.uint32) if object_ids is None else
+                        np.bitwise_or.reduceat(self._object_bits(object_ids, names)[order], starts)),
+            "sensor_word": np.full(len(starts), s >> 6, dtype=np.int64),
+            "sensor_bit": np.full(len(starts), np.uint64(1) << np.uint64(s & 63), dtype=np.uint64),
+        }
+        self._pending.append(rows)
+        self._pending_rows += len(starts)
+        if self._pending_rows >= self.merge_rows:
+            self.merge()
+
+    def add_scan(self, scan, sensor):
+        """Adds a scan dict (raycast_utils / read_csv / scan cache layout)."""
+        self.add(np.stack([scan["X"], scan["Y"], scan["Z"]], axis=1), sensor, scan.get("distance"),
+                 scan.get("categoryID"), scan.get("names", ()))
+
+    def add_lscan(self, header, columns, sensor):
+        """Adds a memory-mapped .lscan (scan_io.read_scan)."""
+        self.add(scan_io.points(columns), sensor, columns["distance"], columns["object"], header["names"])
+
+    def merge(self):
+        """Folds the pending rows into the sorted grid."""
+        if not self._pending:
+            return
+        n_words = (len(self.sensors) + 63) >> 6
+        parts = [] if self._grid is None else [self._grid]
+        for rows in self._pending:
+            sensors = np.zeros((len(rows["key"]), n_words), dtype=np.uint64)
+            sensors[np.arange(len(rows["key"])), rows["sensor_word"]] = rows["sensor_bit"]
+            parts.append({k: rows[k] for k in ("key", "count", "sum", "min_distance", "objects")} | {"sensors": sensors})
+        self._pending, self._pending_rows = [], 0
+
+        merged = {}
+        for k in parts[0]:
+            if k == "sensors":
+                merged[k] = np.concatenate([np.pad(p[k], ((0, 0), (0, n_words - p[k].shape[1]))) for p in parts])
+            else:
+                merged[k] = np.concatenate([p[k] for p in parts])
+        order = np.argsort(merged["key"], kind="stable")
+        keys = merged["key"][order]
+        starts = _group_starts(keys)
+        self._grid = {
+            "key": keys[starts],
+            "count": np.add.reduceat(merged["count"][order], starts),
+            "sum": np.add.reduceat(merged["sum"][order], starts, axis=0),
+            "min_distance": np.minimum.reduceat(merged["min_distance"][order], starts),
+            "objects": np.bitwise_or.reduceat(merged["objects"][order], starts),
+            "sensors": np.bitwise_or.reduceat(merged["sensors"][order], starts, axis=0),
+        }
+
+    def result(self):
+        """Per-voxel arrays: key, ijk, count, centroid, min_distance, objects (bit mask), sensors (bitset), n_sensors."""
+        self.merge()
+        grid = self._grid or {"key": np.zeros(0, dtype=np.int64), "count": np.zeros(0, dtype=np.int64),
+                              "sum": np.zeros((0, 3)), "min_distance": np.zeros(0, dtype=np.float32),
+                              "objects": np.zeros(0, dtype=np.uint32), "sensors": np.zeros((0, 1), dtype=np.uint64)}
+        bits = np.unpackbits(grid["sensors"].view(np.uint8), axis=1) if len(grid["key"]) else np.zeros((0, 1), np.uint8)
+        return {
+            "key": grid["key"],
+            "ijk": unpack_voxels(grid["key"]),
+            "count": grid["count"],
+            "centroid": grid["sum"] / np.maximum(grid["count"], 1)[:, None],
+            "min_distance": grid["min_distance"],
+            "objects": grid["objects"],
+            "sensors": grid["sensors"],
+            "n_sensors": bits.sum(axis=1).astype(np.int32),
+        }
+
+    def write(self, output_dir, output_filename, metadata=None):
+        """
+        Writes <name>.lscan (one point per voxel at the hit centroid, object = lowest object bit)
+        and <name>_voxels.npz (per-voxel statistics, sensor names, voxel size). Returns both paths.
+        """
+        fused = self.result()
+        objects = fused["objects"]
+        first_object = np.where(objects > 0, np.log2(objects & -objects.astype(np.int64)).astype(np.int64), 0)
+        scan = {"X": fused["centroid"][:, 0], "Y": fused["centroid"][:, 1], "Z": fused["centroid"][:, 2],
+                "distance": fused["min_distance"], "intensity": fused["count"].astype(np.float32),
+                "categoryID": first_object, "names": self.names}
+        header = dict(metadata or {}, voxel_size=self.voxel_size, sensors=self.sensors,
+                      points_in=self.points_in, voxels=len(fused["key"]))
+        cloud_path = scan_io.write_scan(scan, output_dir, output_filename, header)
+        stats_path = os.path.join(output_dir, f"{output_filename}_voxels.npz")
+        tmp_path = f"{stats_path}.{file_utils.temp_tag()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, voxel_size=self.voxel_size, sensor_names=np.asarray(self.sensors, dtype=str),
+                     object_names=np.asarray(self.names, dtype=str), **fused)
+        os.replace(tmp_path, stats_path)
+        log.info(f"Fused {len(self.sensors)} scans, {self.points_in} points into {len(fused['key'])} voxels: {cloud_path}")
+        return cloud_path, stats_path
+
+
+def run_outputs(directory):
+    """Scan files recorded in directory's completed.jsonl (the scan_scheduler run that wrote it), or None without one."""
+    path = os.path.join(directory, "completed.jsonl")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        results = [json.loads(line) for line in f if line.strip()]
+    return [r["output"] for r in results if r.get("output")]
+
+
+def _scan_files(directory, orientation_tag=None, surface=None, outputs=None):
+    """
+    (name, path) of the scan outputs in directory (.lscan or CSV, gzipped or not), optionally of one
+    orientation and surface. outputs restricts them to these paths; by default to run_outputs(directory)
+    when the directory has one, so leftovers of earlier runs are not fused. A scan found in several
+    formats counts once, from its newest file. Fused clouds and temp files never match.
+    """
+    if outputs is None:
+        outputs = run_outputs(directory)
+    allowed = None if outputs is None else {os.path.abspath(p) for p in outputs}
+    newest = {}
+    for entry in os.scandir(directory):
+        extension = next((e for e in SCAN_EXTENSIONS if entry.name.endswith(e)), None)
+        match = extension and SCAN_NAME.match(entry.name)
+        if not match or (orientation_tag and match[1] != orientation_tag) or (surface and match[2] != surface):
+            continue
+        if allowed is not None and os.path.abspath(entry.path) not in allowed:
+            continue
+        mtime = entry.stat().st_mtime
+        if match[0] not in newest or mtime > newest[match[0]][0]:
+            newest[match[0]] = (mtime, entry.name[:-len(extension)], entry.path)
+    return sorted((name, path) for _, name, path in newest.values())
+
+
+def fuse_files(paths, voxel_size=0.05, merge_rows=2_000_000):
+    """Streams (sensor name, path) scan files (.lscan or CSV) into a VoxelFusion."""
+    fusion = VoxelFusion(voxel_size, merge_rows)
+    for sensor, path in paths:
+        with instrumentation.span("fuse_scan", sensor=sensor):
+            if scan_io.EXTENSION in os.path.basename(path):
+                header, columns = scan_io.read_scan(path)
+                fusion.add_lscan(header, columns, sensor)
+            else:
+                fusion.add_scan(raycast_utils.read_csv(path), sensor)
+    return fusion
+
+
+def fuse_orientation(directory, orientation_tag, voxel_size=0.05, output_dir=None, surface=None, outputs=None):
+    """
+    Fuses the scans of one orientation (e.g. "yaw_045") into <tag>_fused.lscan + <tag>_fused_voxels.npz,
+    or those of one surface into <tag>_<surface>_fused.*. See _scan_files for which files are used.
+    """
+    fusion = fuse_files(_scan_files(directory, orientation_tag, surface, outputs), voxel_size)
+    name = f"{orientation_tag}_{surface}_fused" if surface else f"{orientation_tag}_fused"
+    metadata = {"orientation": orientation_tag, "surface": surface} if surface else {"orientation": orientation_tag}
+    return fusion.write(output_dir or directory, name, metadata)
+
+
+def fuse_sweep(directory, voxel_size=0.05, output_dir=None, surface=None, outputs=None):
+    """fuse_orientation for every orientation tag found in directory. Returns {tag: (cloud, stats)}."""
+    tags = sorted({SCAN_NAME.match(name)[1] for name, _ in _scan_files(directory, None, surface, outputs)})
+    return {tag: fuse_orientation(directory, tag, voxel_size, output_dir, surface, outputs) for tag in tags}
@@ -0,0 +1,209 @@
+#
+# FILE: instrumentation.py
+#
+# Nested timing spans and leveled logging for the placement pipeline.
+#
+#   log = instrumentation.get_logger(__name__)
+#   with instrumentation.span("scan", yaw=45, surface="Cube", index=3):
+#       ...
+#
+# Spans are recorded only after configure(trace=True); otherwise span() returns
+# one shared no-op context manager, so instrumented code costs a function call
+# and a dict lookup. Recorded spans can be written as a Chrome trace
+# (chrome://tracing, Perfetto) and summarised per span name.
+#
+import os
+import sys
+import json
+import time
+import logging
+import functools
+import threading
+import tracemalloc
+
+ROOT_LOGGER = "lidar"
+
+_STATE = {"enabled": False, "events": [], "start": time.perf_counter()}
+_LOCAL = threading.local()
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **metadata):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """One timed region; metadata can be added while it runs with set()."""
+
+    __slots__ = ("name", "metadata", "start", "depth")
+
+    def __init__(self, name, metadata):
+        self.name = name
+        self.metadata = metadata
+
+    def set(self, **metadata):
+        self.metadata.update(metadata)
+
+    def __enter__(self):
+        stack = getattr(_LOCAL, "stack", None)
+        if stack is None:
+            stack = _LOCAL.stack = []
+        self.depth = len(stack)
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        _LOCAL.stack.pop()
+        if exc_type is not None:
+            self.metadata["error"] = exc_type.__name__
+        _STATE["events"].append((self.name, self.start, end, self.depth, threading.get_ident(), os.getpid(), self.metadata))
+        logging.getLogger(f"{ROOT_LOGGER}.span").debug(
+            "%s%s %.2f ms %s", "  " * self.depth, self.name, (end - self.start) * 1e3, self.metadata or "")
+        return False
+
+
+def get_logger(name):
+    """Logger below the pipeline's root logger (level and output set by configure)."""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name.rsplit('.', 1)[-1]}")
+
+
+def configure(level="INFO", trace=False, stream=None):
+    """
+    Sets the log level of every pipeline logger (DEBUG, INFO, WARNING, ERROR) and turns span
+    recording on or off. Recording again clears the spans of a previous run.
+    """
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(level)
+    if not root.handlers:
+        handler = logging.StreamHandler(stream or sys.stdout)
+        handler.setFormatter(logging.Formatter("[%(levelname)s] %(name)s: %(message)s"))
+        root.addHandler(handler)
+        root.propagate = False
+    _STATE["enabled"] = bool(trace)
+    _STATE["events"] = []
+    _STATE["start"] = time.perf_counter()
+
+
+def enabled():
+    return _STATE["enabled"]
+
+
+def span(name, **metadata):
+    """Context manager timing a region; a shared no-op when recording is off."""
+    if not _STATE["enabled"]:
+        return _NULL_SPAN
+    return Span(name, metadata)
+
+
+def traced(name=None):
+    """Decorator form of span() (the span is named after the function by default)."""
+    def decorate(fn):
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _STATE["enabled"]:
+                return fn(*args, **kwargs)
+            with Span(span_name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class _PeakMemory:
+    """Peak traced allocation (bytes above the level at entry) of the block; see peak_memory()."""
+
+    def __enter__(self):
+        self.started = not tracemalloc.is_tracing()
+        if self.started:
+            tracemalloc.start()
+        self.baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        self.peak_bytes = 0
+        return self
+
+    def __exit__(self, *exc):
+        self.peak_bytes = max(tracemalloc.get_traced_memory()[1] - self.baseline, 0)
+        if self.started:
+            tracemalloc.stop()
+        return False
+
+
+def peak_memory():
+    """
+    Context manager measuring the peak memory allocated in its block (NumPy arrays included)
+    with tracemalloc, e.g. `with peak_memory() as m: ...; m.peak_bytes`. Not nestable.
+    """
+    return _PeakMemory()
+
+
+def events():
+    """Recorded spans as dicts (seconds relative to configure()), in completion order."""
+    t0 = _STATE["start"]
+    return [{"name": name, "start": start - t0, "duration": end - start, "depth": depth,
+             "thread": tid, "pid": pid, "metadata": metadata}
+            for name, start, end, depth, tid, pid, metadata in _STATE["events"]]
+
+
+def _jsonable(value):
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    try:
+        return [_jsonable(v) for v in value]  # mathutils vectors, numpy arrays
+    except TypeError:
+        return str(value)
+
+
+def write_chrome_trace(path):
+    """Writes the recorded spans as a Chrome trace (complete 'X' events, microseconds)."""
+    trace = [{"name": e["name"], "ph": "X", "ts": e["start"] * 1e6, "dur": e["duration"] * 1e6,
+              "pid": e["pid"], "tid": e["thread"], "args": _jsonable(e["metadata"])} for e in events()]
+    with open(path, "w") as f:
+        json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+    return path
+
+
+def summary():
+    """Per span name: count, total, mean and max seconds, sorted by total time."""
+    stats = {}
+    for e in events():
+        s = stats.setdefault(e["name"], {"count": 0, "total": 0.0, "max": 0.0})
+        s["count"] += 1
+        s["total"] += e["duration"]
+        s["max"] = max(s["max"], e["duration"])
+    for s in stats.values():
+        s["mean"] = s["total"] / s["count"]
+    return dict(sorted(stats.items(), key=lambda item: -item[1]["total"]))
+
+
+def summary_table():
+    """summary() as a fixed-width text table."""
+    lines = [f"{'span':32s} {'count':>6s} {'total s':>10s} {'mean ms':>10s} {'max ms':>10s}"]
+    for name, s in summary().items():
+        lines.append(f"{name:32s} {s['count']:6d} {s['total']:10.3f} {s['mean'] * 1e3:10.2f} {s['max'] * 1e3:10.2f}")
+    return "\n".join(lines)
+
+
+def write_run_report(output_dir, run_name):
+    """Writes <run_name>_trace.json (Chrome trace) and <run_name>_summary.json; logs the summary table."""
+    os.makedirs(output_dir, exist_ok=True)
+    trace_path = write_chrome_trace(os.path.join(output_dir, f"{run_name}_trace.json"))
+    with open(os.path.join(output_dir, f"{run_name}_summary.json"), "w") as f:
+        json.dump(summary(), f, indent=2)
+    get_logger("instrumentation").info("Run summary:\n%s", summary_table())
+    return trace_path
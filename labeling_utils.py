@@ -0,0 +1,183 @@
+#
+# FILE: labeling_utils.py
+#
+# Per-point URDF link labels for lidar returns (which gear, wheel, sensor or
+# fuselage part a ray hit). Every link's URDF geometry becomes a bounding
+# volume in its link frame (boxes, cylinders, spheres; meshes as their box);
+# for one base pose the volumes are placed with batched FK and points are
+# labelled with a world-AABB broad phase followed by an exact test in the
+# volume frame. Nested volumes resolve to the smallest one, so a wheel wins
+# over the fuselage mesh box around it.
+#
+import os
+import numpy as np
+
+import mesh_utils
+import coverage_utils
+import urdf_utils
+import instrumentation
+
+log = instrumentation.get_logger(__name__)
+
+KIND_BOX, KIND_CYLINDER, KIND_SPHERE = 0, 1, 2
+MESH_EXTENSIONS = (".stl", ".ply")
+
+
+def resolve_mesh_path(filename, urdf_path, mesh_dirs=()):
+    """
+    File behind a URDF <mesh filename>: package:// and file:// prefixes are dropped and the name
+    is looked up next to the URDF and in mesh_dirs; a missing file also matches the same stem
+    with another supported extension (t5.stl -> t5.ply). None when nothing is found.
+    """
+    name = filename.split("://", 1)[-1]
+    folders = [os.path.dirname(urdf_path), *mesh_dirs]
+    candidates = [name] + [os.path.join(d, os.path.basename(name)) for d in folders]
+    stem = os.path.splitext(os.path.basename(name))[0]
+    candidates += [os.path.join(d, stem + ext) for d in folders for ext in MESH_EXTENSIONS]
+    for path in candidates:
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _shape_volume(shape, urdf_path, mesh_dirs):
+    """(kind, volume-to-link 4x4, half extents) of one URDF shape, None when it cannot be bounded."""
+    local = shape["origin"]
+    if shape["type"] == "box":
+        return KIND_BOX, local, 0.5 * shape["size"]
+    if shape["type"] == "cylinder":
+        r = shape["radius"]
+        return KIND_CYLINDER, local, np.array([r, r, 0.5 * shape["length"]])
+    if shape["type"] == "sphere":
+        return KIND_SPHERE, local, np.full(3, shape["radius"])
+    path = resolve_mesh_path(shape["filename"], urdf_path, mesh_dirs)
+    if path is None:
+        log.warning(f"Mesh '{shape['filename']}' not found, link volume skipped.")
+        return None
+    vertices = mesh_utils.load_mesh_cached(path)[0] * shape["scale"]
+    vertices = vertices @ local[:3, :3].T + local[:3, 3]
+    lo, hi = vertices.min(axis=0), vertices.max(axis=0)
+    return KIND_BOX, mesh_utils.transform_matrix(0.5 * (lo + hi)), 0.5 * (hi - lo)
+
+
+def link_volumes(model, source="collision", point_radius=0.0, mesh_dirs=(), links=None):
+    """
+    Bounding volumes of the links' URDF geometry, in the link frames.
+      source: "collision" or "visual" shapes, falling back to the other one per link.
+      point_radius: links without geometry (towbar, wheels of the tug URDF) get a sphere of this
+                    radius when > 0.
+      links: restrict to these link names.
+    Returns a dict of arrays sorted by volume (smallest first): link (tree index), kind,
+    local (V,4,4), half (V,3), volume, plus link_names (tree order).
+    """
+    tree = urdf_utils.kinematic_tree(model)
+    other = "visual" if source == "collision" else "collision"
+    rows = []
+    for name in links or tree["link_names"]:
+        shapes = model["geometry"].get(name, [])
+        chosen = [s for s in shapes if s["source"] == source] or [s for s in shapes if s["source"] == other]
+        volumes = [v for v in (_shape_volume(s, model["path"], mesh_dirs) for s in chosen) if v is not None]
+        if not volumes and point_radius > 0:
+            volumes = [(KIND_SPHERE, np.identity(4), np.full(3, point_radius))]
+        rows += [(tree["link_index"][name],) + v for v in volumes]
+
+    half = np.array([r[3] for r in rows], dtype=float).reshape(-1, 3)
+    kind = np.array([r[1] for r in rows], dtype=np.int8)
+    volume = np.where(kind == KIND_BOX, 8 * half.prod(axis=1),
+                      np.where(kind == KIND_CYLINDER, 2 * np.pi * half[:, 0] ** 2 * half[:, 2], 4 / 3 * np.pi * half[:, 0] ** 3))
+    order = np.argsort(volume, kind="stable")
+    return {
+        "link": np.array([r[0] for r in rows], dtype=np.int64)[order],
+        "kind": kind[order],
+        "local": np.array([r[2] for r in rows], dtype=float).reshape(-1, 4, 4)[order],
+        "half": half[order],
+        "volume": volume[order],
+        "link_names": tree["link_names"],
+    }
+
+
+def world_volumes(volumes, link_poses):
+    """
+    Places the volumes for one base pose. link_poses is (L,4,4) in kinematic_tree order (one row of
+    batched_link_fk) or a urdf_utils.link_positions dict. Adds world (V,4,4) and the world AABBs lo/hi.
+    """
+    if isinstance(link_poses, dict):
+        link_poses = np.array([link_poses.get(name, np.identity(4)) for name in volumes["link_names"]])
+    world = np.asarray(link_poses)[volumes["link"]] @ volumes["local"]
+    extent = np.abs(world[:, :3, :3]) @ volumes["half"][:, :, None]
+    center = world[:, :3, 3]
+    return dict(volumes, world=world, lo=center - extent[:, :, 0], hi=center + extent[:, :, 0])
+
+
+def label_points(placed, points, margin=0.02):
+    """
+    Link index (kinematic_tree order) of every (N,3) world point, -1 outside all volumes.
+    margin (m) inflates every volume, absorbing tessellation and range noise. Volumes are
+    applied largest first, so where they overlap the smallest one keeps the point.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    x, y, z = (np.ascontiguousarray(points[:, k]) for k in range(3))
+    labels = np.full(len(points), -1, dtype=np.int64)
+    for v in range(len(placed["link"]) - 1, -1, -1):
+        lo, hi = placed["lo"][v] - margin, placed["hi"][v] + margin
+        cand = np.flatnonzero((x >= lo[0]) & (x <= hi[0]))
+        cand = cand[(y[cand] >= lo[1]) & (y[cand] <= hi[1]) & (z[cand] >= lo[2]) & (z[cand] <= hi[2])]
+        if not len(cand):
+            continue
+        R, t = placed["world"][v, :3, :3], placed["world"][v, :3, 3]
+        local = (points[cand] - t) @ R
+        half = placed["half"][v] + margin
+        kind = placed["kind"][v]
+        if kind == KIND_BOX:
+            inside = np.all(np.abs(local) <= half, axis=1)
+        elif kind == KIND_CYLINDER:
+            inside = (np.abs(local[:, 2]) <= half[2]) & (np.einsum("ij,ij->i", local[:, :2], local[:, :2]) <= half[0] ** 2)
+        else:
+            inside = np.einsum("ij,ij->i", local, local) <= half[0] ** 2
+        labels[cand[inside]] = placed["link"][v]
+    return labels
+
+
+def link_hit_counts(labels, link_names):
+    """{link name: hits} for the links hit at least once; unlabelled points are counted under None."""
+    counts = np.bincount(labels + 1, minlength=len(link_names) + 1)
+    hits = {link_names[i]: int(c) for i, c in enumerate(counts[1:]) if c}
+    if counts[0]:
+        hits[None] = int(counts[0])
+    return hits
+
+
+def label_scan(placed, scan, target="a3320_ceo", margin=0.02):
+    """Labels of a scan dict's points; points that did not hit the target object get -1 (all of them when the scan does not name it)."""
+    labels = np.full(len(scan["X"]), -1, dtype=np.int64)
+    mask = coverage_utils.target_mask(list(scan.get("names", [])), scan["categoryID"], target)
+    points = np.stack([np.asarray(scan[k])[mask] for k in ("X", "Y", "Z")], axis=1)
+    labels[mask] = label_points(placed, points, margin)
+    return labels
+
+
+def aircraft_pose(header):
+    """Base pose of a .lscan's aircraft: coverage_utils.scan_aircraft_matrix of its metadata, identity without."""
+    matrix = coverage_utils.scan_aircraft_matrix(header["metadata"])
+    return np.identity(4) if matrix is None else matrix
+
+
+def placement_link_hits(model, volumes, sweep, target="a3320_ceo", base_pose=aircraft_pose, margin=0.02):
+    """
+    Per-link hit counts of every placement of a scan_io.load_sweep dict: {name: {link: hits}}.
+    base_pose(header) gives the model's base matrix for a scan (the aircraft pose by default).
+    Scans sharing a base pose share one FK pass.
+    """
+    names = list(sweep)
+    poses = np.array([base_pose(sweep[name][0]) for name in names]).reshape(-1, 4, 4)
+    unique, inverse = np.unique(poses.reshape(len(names), -1), axis=0, return_inverse=True)
+    link_poses, _ = urdf_utils.batched_link_fk(model, unique.reshape(-1, 4, 4)) if len(names) else (None, None)
+    hits = {}
+    for i, name in enumerate(names):
+        header, columns = sweep[name]
+        placed = world_volumes(volumes, link_poses[inverse[i]])
+        mask = coverage_utils.target_mask(list(header["names"]), columns["object"], target)
+        points = np.stack([columns["x"][mask], columns["y"][mask], columns["z"][mask]], axis=1)
+        with instrumentation.span("label_scan", scan=name, points=len(points)):
+            hits[name] = link_hit_counts(label_points(placed, points, margin), volumes["link_names"])
+    return hits
@@ -1,55 +1,263 @@
 #
 # FILE: lidar_utils.py
 #
+# Blender backend of the scans: runs range_scanner or the NumPy ray caster on
+# scanner objects of the open scene. The range_scanner add-on is imported only
+# when a scan actually uses it, so headless scans work without it installed.
+#
+import os
+import glob
+import time
 import bpy
-import addon_utils
-import range_scanner
+import numpy as np
+
+import raycast_utils
+import scan_cache
+import scan_io
+import sensor_models
+import adaptive_scan
+import scan_catalog
+import instrumentation
+from raycast_utils import DETAILED_SCAN_PARAMS
+
+log = instrumentation.get_logger(__name__)
 
 def enable_scanner_addon():
     """Enables the Range Scanner add-on."""
+    import addon_utils
     try:
         # Check if it's not already enabled before trying to enable it
         if not addon_utils.check("range_scanner")[1]:
              bpy.ops.preferences.addon_enable(module="range_scanner")
-        print("Range Scanner add-on is enabled.")
+        log.info("Range Scanner add-on is enabled.")
     except Exception as e:
-        print(f"Warning: Could not enable add-on. May already be enabled. {e}")
+        log.warning(f"Could not enable add-on. May already be enabled. {e}")
+
+def blender_mesh_objects(exclude=()):
+    """(name, vertices, triangles, matrix_world) of every visible mesh with faces in the current scene."""
+    deps = bpy.context.evaluated_depsgraph_get()
+    objects = []
+    for obj in bpy.context.scene.objects:
+        if obj.type != 'MESH' or obj.name in exclude or obj.hide_render:
+            continue
+        obj_eval = obj.evaluated_get(deps)
+        mesh = obj_eval.to_mesh()
+        mesh.calc_loop_triangles()
+        vertices = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get("co", vertices)
+        faces = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+        mesh.loop_triangles.foreach_get("vertices", faces)
+        # Point-only meshes (e.g. scans added with addMesh) are not scannable geometry.
+        if len(faces):
+            objects.append((obj.name, vertices.reshape(-1, 3), faces.reshape(-1, 3), np.array(obj.matrix_world)))
+        obj_eval.to_mesh_clear()
+    return objects
+
+def scene_from_blender(exclude=()):
+    """
+    Collects every visible mesh object of the current Blender scene as a headless raycast scene
+    (one local-space BVH per object; move objects with raycast_utils.set_instance_matrices).
+    """
+    return raycast_utils.build_instanced_scene(blender_mesh_objects(exclude))
+
+def scanner_sensor(scanner_obj):
+    """Sensor model name of a scanner object (blender_utils.create_camera(sensor_model=...)), None for the default pattern."""
+    return scanner_obj.get("sensor_model") or None
+
+def scanner_scan_params(scanner_obj):
+    """Scan parameters of a scanner object: its sensor model's, DETAILED_SCAN_PARAMS without one."""
+    name = scanner_sensor(scanner_obj)
+    return DETAILED_SCAN_PARAMS if name is None else sensor_models.scan_params(name)
+
+def blender_scene_fingerprint(exclude=()):
+    """
+    scan_cache.scene_fingerprint of the current Blender scene. It reads back and hashes every mesh, so
+    compute it once per scene state (e.g. per tug orientation) and pass it to the scans as scene_fp.
+    """
+    return scan_cache.scene_fingerprint([(name, (v, f), M) for name, v, f, M in blender_mesh_objects(exclude)])
+
+def blender_scan_key(scanner_obj, backend, scene_fp=None):
+    """Scan cache key for the scene (blender_scene_fingerprint, computed here when not given), scanner pose and scan parameters."""
+    scene_fp = scene_fp or blender_scene_fingerprint()
+    params = dict(scanner_scan_params(scanner_obj), backend=backend)
+    name = scanner_sensor(scanner_obj)
+    if name is not None:
+        params["sensor_model"] = sensor_models.model_fingerprint(name)
+    return scan_cache.scan_key(scene_fp, np.array(scanner_obj.matrix_world), params)
 
-def run_detailed_rotating_scan(scanner_name, output_dir, output_filename, export=True, add_mesh_to_scene=True):
+def emit_scan(scan, output_dir, output_filename, export=True, add_mesh_to_scene=True, export_format="csv", metadata=None, writer=None):
+    """
+    Exports a scan dict as CSV or binary .lscan and/or adds its points to the scene as a mesh.
+    With an async_export.ScanWriter the export is queued and written in the background.
+    """
+    if export and writer is not None:
+        writer.submit(scan, output_dir, output_filename, export_format, metadata)
+    elif export:
+        with instrumentation.span("export", format=export_format, points=len(scan["X"])):
+            if export_format == "binary":
+                path = scan_io.write_scan(scan, output_dir, output_filename, metadata)
+            else:
+                path = raycast_utils.write_csv(scan, output_dir, output_filename)
+        log.info(f"Exported {len(scan['X'])} points to {path}")
+    if add_mesh_to_scene:
+        mesh = bpy.data.meshes.new(output_filename)
+        mesh.from_pydata(np.stack([scan["X"], scan["Y"], scan["Z"]], axis=1).tolist(), [], [])
+        bpy.context.scene.collection.objects.link(bpy.data.objects.new(output_filename, mesh))
+
+def catalog_scan(catalog, scan, metadata, path, backend, start):
+    """Records a finished scan (started at perf_counter() start) in a scan_catalog.ScanCatalog."""
+    if catalog is not None and scan is not None:
+        catalog.record(metadata, scan_catalog.scan_summary(scan), path=path, seconds=round(time.perf_counter() - start, 3), backend=backend)
+
+def export_path(output_dir, output_filename, export_format="csv", writer=None):
+    """Path emit_scan exports a scan to (also when it is still queued on an async_export.ScanWriter)."""
+    suffix = scan_io.EXTENSION if export_format == "binary" else ".csv"
+    return os.path.join(output_dir, output_filename + suffix + (".gz" if writer is not None and writer.compress == "gzip" else ""))
+
+def exported_file(output_dir, output_filename, export_format="csv", since=0.0, writer=None):
+    """
+    Path of a scan's export written at or after since (a time.time() stamp), or None. range_scanner may
+    add a suffix to its CSV names, so CSV exports are also looked up by prefix. Pass the
+    async_export.ScanWriter the export went through (after its flush()) to find compressed exports.
+    """
+    candidates = [export_path(output_dir, output_filename, export_format, writer)]
+    if export_format != "binary":
+        candidates += sorted(glob.glob(os.path.join(output_dir, f"{output_filename}*.csv")))
+    for path in candidates:
+        try:
+            if os.path.getmtime(path) >= since:
+                return path
+        except FileNotFoundError:
+            continue
+    return None
+
+def scan_metadata(scanner_obj, **extra):
+    """Metadata stored in binary scan headers: scanner pose, scan parameters and caller tags (yaw, surface, ...)."""
+    metadata = dict(extra, scanner=scanner_obj.name, matrix_world=np.array(scanner_obj.matrix_world).tolist(), scan_params=scanner_scan_params(scanner_obj))
+    if scanner_sensor(scanner_obj) is not None:
+        metadata["sensor_model"] = scanner_sensor(scanner_obj)
+    return metadata
+
+def run_headless_rotating_scan(scanner_obj, output_dir, output_filename, export=True, add_mesh_to_scene=True, scene=None, export_format="csv", metadata=None,
+                               writer=None, memory_budget_mb=None, targets=None):
+    """
+    Runs the detailed rotating scan with the NumPy ray caster instead of range_scanner.
+    A scanner with a sensor model traces the model's cached ray table from its mounted optical centre.
+    With targets (object names), only the rays that can reach them are traced (adaptive_scan.scan_targeted).
+    """
+    if scene is None:
+        scene = scene_from_blender()
+    name = scanner_sensor(scanner_obj)
+    with instrumentation.span("raycast", sensor=name or "detailed"):
+        if targets:
+            matrix = np.array(scanner_obj.matrix_world) if name is None else sensor_models.mounted_matrix(np.array(scanner_obj.matrix_world), name)
+            scan, stats = adaptive_scan.scan_targeted(scene, matrix, targets, rays=None if name is None else sensor_models.ray_table(name),
+                                                      **scanner_scan_params(scanner_obj))
+            log.info(f"Targeted scan traced {stats['traced']} of {stats['rays']} rays.")
+        elif name is None:
+            scan = raycast_utils.scan_rotating(scene, np.array(scanner_obj.matrix_world), memory_budget_mb=memory_budget_mb, **DETAILED_SCAN_PARAMS)
+        else:
+            scan = sensor_models.scan_sensor(scene, np.array(scanner_obj.matrix_world), name, memory_budget_mb)
+    emit_scan(scan, output_dir, output_filename, export, add_mesh_to_scene, export_format, metadata, writer)
+    return scan
+
+def run_detailed_rotating_scan(scanner_name, output_dir, output_filename, export=True, add_mesh_to_scene=True, backend="range_scanner", scene=None, cache=None,
+                               export_format="csv", metadata=None, writer=None, memory_budget_mb=None, targets=None, catalog=None, scene_fp=None):
+    """
+    Runs the detailed rotating scan from the given scanner object.
+    backend="headless" uses the NumPy ray caster (raycast_utils); pass a prebuilt scene to reuse its BVH across scans.
+    With a scan_cache.ScanCache, an unchanged scene/pose/parameter set returns the stored point cloud instead of rescanning.
+    Pass the scene's blender_scene_fingerprint as scene_fp so a cache hit does not read back and hash every mesh.
+    export_format="binary" writes a memory-mappable .lscan (scan_io) with metadata (e.g. yaw, surface) in its header.
+    With an async_export.ScanWriter, exports are written on its worker threads (call writer.flush() before reading them).
+    memory_budget_mb makes the headless backend trace rays in chunks that fit the budget.
+    targets (e.g. ["a3320_ceo"]) makes the headless backend trace only the rays that can reach those objects,
+    refined coarse-to-fine: the scan then holds the targets' hits and little else.
+    The scan pattern is the scanner's sensor model (sensor_models) when it has one; range_scanner can only
+    approximate a model with a uniform pattern at its finest channel spacing.
+    With a scan_catalog.ScanCatalog, the scan's metadata, timing and summary are recorded in it.
+    range_scanner scans are read back from the CSV they exported, so they are only cached, cataloged or
+    converted to binary with export=True.
+    """
+    start = time.perf_counter()
+    started_at = int(time.time())
     scanner_obj = bpy.data.objects.get(scanner_name)
     if not scanner_obj:
-        print(f" ERROR: Scanner object named '{scanner_name}' not found")
+        log.error(f"Scanner object named '{scanner_name}' not found")
         return    
-    range_scanner.ui.user_interface.scan_rotating(
-        bpy.context, 
+    metadata = scan_metadata(scanner_obj, **(metadata or {}))
+    if cache is not None:
+        key = blender_scan_key(scanner_obj, backend if not targets else f"{backend}:targets={','.join(sorted(targets))}", scene_fp)
+        scan = cache.get(key)
+        if scan is not None:
+            log.info(f"Cache hit for '{output_filename}', skipping scan.")
+            emit_scan(scan, output_dir, output_filename, export, add_mesh_to_scene, export_format, metadata, writer)
+            catalog_scan(catalog, scan, metadata, export_path(output_dir, output_filename, export_format, writer) if export else None, "cache", start)
+            return scan
+    if backend == "headless":
+        scan = run_headless_rotating_scan(scanner_obj, output_dir, output_filename, export, add_mesh_to_scene, scene, export_format, metadata,
+                                          writer, memory_budget_mb, targets)
+        if cache is not None:
+            cache.put(key, scan)
+        catalog_scan(catalog, scan, metadata, export_path(output_dir, output_filename, export_format, writer) if export else None, backend, start)
+        log.info("scan complete.")
+        return scan
+    if targets:
+        log.warning("Targeted scans need backend='headless'; range_scanner traces the full pattern.")
+    if scanner_sensor(scanner_obj) not in (None, "detailed"):
+        log.warning(f"range_scanner approximates sensor model '{scanner_sensor(scanner_obj)}' with a uniform pattern; use backend='headless' for its exact channels.")
+    import range_scanner
+    with instrumentation.span("range_scanner"):
+        range_scanner.ui.user_interface.scan_rotating(
+            bpy.context, 
 
-        scannerObject=scanner_obj,
+            scannerObject=scanner_obj,
 
-        # Your specific scan parameters ---
-        xStepDegree=0.4, fovX=360.0, yStepDegree=0.33, fovY=270.0, rotationsPerSecond=20,
-        reflectivityLower=1.0, distanceLower=0.0, reflectivityUpper=1.0, distanceUpper=99999.9, maxReflectionDepth=10,
+            # Your specific scan parameters ---
+            rotationsPerSecond=20, **scanner_scan_params(scanner_obj),
         
-        # Animation and Noise ---
-        enableAnimation=False, frameStart=1, frameEnd=1, frameStep=1, frameRate=1,
-        addNoise=False, noiseType='gaussian', mu=0.0, sigma=0.01, noiseAbsoluteOffset=0.0, noiseRelativeOffset=0.0, 
-        simulateRain=False, rainfallRate=0.0, 
-
-        # Output and Visualization ---
-        addMesh=add_mesh_to_scene,
-
-        # Export Formats ---
-        exportLAS=False, 
-        exportHDF=False, 
-        exportCSV=export,
-        exportPLY= False,
-        exportSingleFrames=False,
+            # Animation and Noise ---
+            enableAnimation=False, frameStart=1, frameEnd=1, frameStep=1, frameRate=1,
+            addNoise=False, noiseType='gaussian', mu=0.0, sigma=0.01, noiseAbsoluteOffset=0.0, noiseRelativeOffset=0.0, 
+            simulateRain=False, rainfallRate=0.0, 
+
+            # Output and Visualization ---
+            addMesh=add_mesh_to_scene,
+
+            # Export Formats ---
+            exportLAS=False, 
+            exportHDF=False, 
+            exportCSV=export,
+            exportPLY= False,
+            exportSingleFrames=False,
         
-        # File Paths ---
-        dataFilePath=output_dir, 
-        dataFileName=output_filename,
+            # File Paths ---
+            dataFilePath=output_dir, 
+            dataFileName=output_filename,
         
-        # Debugging ---
-        debugLines=False, debugOutput=False, outputProgress=True, measureTime=False, singleRay=False, destinationObject=None, targetObject=None
-    )
+            # Debugging ---
+            debugLines=False, debugOutput=False, outputProgress=True, measureTime=False, singleRay=False, destinationObject=None, targetObject=None
+        )
+    
+    log.info("scan complete.")
     
-    print("scan complete.")
\ No newline at end of file
+    if not export:
+        if cache is not None or catalog is not None:
+            log.warning(f"'{output_filename}' was not exported, so the range_scanner scan is neither cached nor cataloged.")
+        return
+    if cache is not None or catalog is not None or export_format == "binary":
+        # range_scanner only writes CSV files: read back what this scan exported (never an older file).
+        exported = exported_file(output_dir, output_filename, "csv", since=started_at)
+        if exported is None:
+            log.warning(f"range_scanner wrote no CSV export for '{output_filename}'.")
+            return
+        scan = raycast_utils.read_csv(exported)
+        if cache is not None:
+            cache.put(key, scan)
+        path = export_path(output_dir, output_filename, export_format, writer) if export_format == "binary" else exported
+        catalog_scan(catalog, scan, metadata, path, backend, start)
+        if export_format == "binary" and writer is not None:
+            writer.submit(scan, output_dir, output_filename, "binary", metadata)
+        elif export_format == "binary":
+            log.info(f"Converted to {scan_io.write_scan(scan, output_dir, output_filename, metadata)}")
+        return scan
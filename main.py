@@ -4,22 +4,45 @@ import os
 import sys
 import importlib
 import math
-import range_scanner 
+import time
 from mathutils import Vector
 
 #Defining and registering the script directory
 script_dir = os.path.dirname(bpy.data.filepath)
 if script_dir not in sys.path:
     sys.path.append(script_dir)
-print(script_dir)
 
+import instrumentation
 import blender_utils
 import urdf_utils
 import lidar_utils
-
+import scan_scheduler
+import alignment_utils
+import fusion_utils
+import async_export
+import scan_io
+import sensor_models
+import clearance_utils
+import scan_catalog
+import scan_cache
+import coverage_utils
+import mesh_utils
+import surrogate_search
+import numpy as np
+
+importlib.reload(sensor_models)
 importlib.reload(blender_utils)
 importlib.reload(urdf_utils)
 importlib.reload(lidar_utils)
+importlib.reload(scan_scheduler)
+importlib.reload(alignment_utils)
+importlib.reload(fusion_utils)
+importlib.reload(async_export)
+importlib.reload(clearance_utils)
+importlib.reload(scan_catalog)
+importlib.reload(scan_cache)
+importlib.reload(surrogate_search)
+importlib.reload(instrumentation)
 
 # Define all file paths ---
 TUG_URDF = os.path.join(script_dir, "Tugs", "t5.urdf")
@@ -37,54 +60,104 @@ BLEND_FILE_PATH = os.path.join(script_dir, "scene4.blend")
 # Set this to True to load the BLEND_FILE_PATH,Set this to False to create a new scene from scratch.
 LOAD_FROM_BLEND_FILE = True
 
-
-print("STARTING SCRIPT")
+# Set this to True to only write the sweep to MANIFEST_PATH and run it with scan_scheduler.py (parallel, resumable).
+WRITE_SCAN_MANIFEST = False
+MANIFEST_PATH = os.path.join(EXPORT_DIR, "scan_manifest.jsonl")
+
+# Set this to True to fuse the scans of every orientation into one voxel-downsampled cloud
+# (<yaw tag>_fused.lscan + per-voxel stats) and add only that cloud to the scene.
+FUSE_SCANS = True
+FUSION_VOXEL_SIZE = 0.05
+
+# Write scan exports on background threads (bounded queue of EXPORT_QUEUE scans) while the next
+# grid point is scanned. EXPORT_COMPRESSION = "gzip" writes .csv.gz / .lscan.gz instead.
+ASYNC_EXPORT = True
+EXPORT_WORKERS = 2
+EXPORT_QUEUE = 4
+EXPORT_COMPRESSION = None
+
+# Record every scan (yaw, surface, grid index, pose, timing, point and per-object hit counts) in an
+# SQLite catalog for queries such as scan_catalog.ScanCatalog(CATALOG_PATH).best_per_surface(yaw_deg=45).
+# None records nothing (range_scanner scans are read back from their CSV export for the summary).
+CATALOG_PATH = os.path.join(EXPORT_DIR, scan_catalog.CATALOG_NAME)
+
+# Reuse scans whose scene, lidar pose and scan parameters are unchanged since an earlier run
+# (scan_cache, keyed by content). None rescans everything.
+SCAN_CACHE_DIR = os.path.join(EXPORT_DIR, "cache")
+
+# "grid" scans every grid point of every plate at every yaw. "surrogate" searches a denser
+# SEARCH_GRID (nx, ny points per plate) over all yaws, but only scans the candidates a coverage
+# surrogate (surrogate_search) expects to improve on the best so far. It stops after
+# SEARCH_MAX_SCANS scans or when the expected gain drops below SEARCH_MIN_GAIN times the best coverage.
+SEARCH_MODE = "grid"
+SEARCH_GRID = (4, 6)
+SEARCH_MAX_SCANS = 60
+SEARCH_MIN_GAIN = 0.002
+
+# Skip tug orientations where the aligned aircraft comes closer than CLEARANCE_MIN (m) to the tug
+# or the lidar plates (SURFACES); the nose gear resting in the tug's cradle is not counted.
+CLEARANCE_CHECK = True
+CLEARANCE_MIN = 0.05
+
+# Sensor model of the lidar (a sensor_models name such as "vlp16", "os1_64", "vls128" or
+# "solid_state_120x25"); None scans the uniform detailed pattern (DETAILED_SCAN_PARAMS).
+SENSOR_MODEL = None
+
+# Log level (DEBUG, INFO, WARNING) and timing spans. With TRACE_RUN the run's Chrome trace
+# and per-span summary are written to EXPORT_DIR (open the trace in chrome://tracing or Perfetto).
+LOG_LEVEL = "INFO"
+TRACE_RUN = True
+
+instrumentation.configure(LOG_LEVEL, trace=TRACE_RUN)
+log = instrumentation.get_logger("main")
+log.info(f"STARTING SCRIPT in {script_dir}")
 scene_was_loaded = False
 
-if LOAD_FROM_BLEND_FILE:
-    scene_was_loaded = blender_utils.load_blend_file(BLEND_FILE_PATH)
-    if not scene_was_loaded:
-        print("Load failed. Halting script.")
-else:
-    #Creating a new scene from scratch.
-    blender_utils.clear_scene()
-    blender_utils.create_boundary_walls()
-
-    # Load Tug 
-    tug_start_location = (0, 0, 0)
-    tug_object = blender_utils.import_ply(TUG_STL, "Tug_t5")
-    blender_utils.assign_material(tug_object.name, color=(0.8, 0.1, 0.1, 1.0))
-    blender_utils.set_position(tug_object.name, tug_start_location)
-    tug_data = urdf_utils.load_and_verify_urdf(TUG_URDF)
-    tug_world_poses = urdf_utils.link_positions(tug_data, base_position=tug_start_location)
-
-    # Load Aircraft (AC) 
-    ac_start_location = (0, 0, 0) 
-    ac_object = blender_utils.import_ply(AC_STL, "a3320_ceo")
-    blender_utils.assign_material(ac_object.name, color=(0.9, 0.9, 0.9, 1.0))
-    blender_utils.set_position(ac_object.name, ac_start_location)
-    ac_data = urdf_utils.load_and_verify_urdf(AC_URDF)
-    ac_world_poses = urdf_utils.link_positions(ac_data, base_position=ac_start_location)
-
-    # Align AC to Tug 
-    caster_pos = urdf_utils.get_link_position(tug_world_poses, "caster")
-    towbar_pos = urdf_utils.get_link_position(ac_world_poses, "towbar")
-
-    if caster_pos is not None and towbar_pos is not None:
-        new_ac_pos = ac_start_location + (caster_pos - towbar_pos)
-        blender_utils.set_position(ac_object.name, new_ac_pos)
-        ac_world_poses = urdf_utils.link_positions(ac_data, base_position=new_ac_pos)
+with instrumentation.span("scene_load", from_blend_file=LOAD_FROM_BLEND_FILE):
+    if LOAD_FROM_BLEND_FILE:
+        scene_was_loaded = blender_utils.load_blend_file(BLEND_FILE_PATH)
+        if not scene_was_loaded:
+            log.error("Load failed. Halting script.")
     else:
-        print("Error: Could not find 'caster' or 'towbar' link for alignment.")
+        #Creating a new scene from scratch.
+        blender_utils.clear_scene()
+        blender_utils.create_boundary_walls()
+
+        # Load Tug 
+        tug_start_location = (0, 0, 0)
+        tug_object = blender_utils.import_mesh_cached(TUG_STL, "Tug_t5")
+        blender_utils.assign_material(tug_object.name, color=(0.8, 0.1, 0.1, 1.0))
+        blender_utils.set_position(tug_object.name, tug_start_location)
+        tug_data = urdf_utils.load_and_verify_urdf(TUG_URDF)
+        tug_world_poses = urdf_utils.link_positions(tug_data, base_position=tug_start_location)
+
+        # Load Aircraft (AC) 
+        ac_start_location = (0, 0, 0) 
+        ac_object = blender_utils.import_mesh_cached(AC_STL, "a3320_ceo")
+        blender_utils.assign_material(ac_object.name, color=(0.9, 0.9, 0.9, 1.0))
+        blender_utils.set_position(ac_object.name, ac_start_location)
+        ac_data = urdf_utils.load_and_verify_urdf(AC_URDF)
+        ac_world_poses = urdf_utils.link_positions(ac_data, base_position=ac_start_location)
 
-    # Create Debug Markers ---
-    #urdf_utils.draw_link_markers(tug_world_poses, size=0.03)
+        # Align AC to Tug 
+        caster_pos = urdf_utils.get_link_position(tug_world_poses, "caster")
+        towbar_pos = urdf_utils.get_link_position(ac_world_poses, "towbar")
 
+        if caster_pos is not None and towbar_pos is not None:
+            new_ac_pos = ac_start_location + (caster_pos - towbar_pos)
+            blender_utils.set_position(ac_object.name, new_ac_pos)
+            ac_world_poses = urdf_utils.link_positions(ac_data, base_position=new_ac_pos)
+        else:
+            log.error("Could not find 'caster' or 'towbar' link for alignment.")
 
+        # Create Debug Markers ---
+        #urdf_utils.draw_link_markers(tug_world_poses, size=0.03)
 
-    # Saving the new scene in blender
-    print(f"Scene creation complete. Saving to: {BLEND_FILE_PATH}")
-    blender_utils.save_blend_file(BLEND_FILE_PATH)
+
+
+        # Saving the new scene in blender
+        log.info(f"Scene creation complete. Saving to: {BLEND_FILE_PATH}")
+        blender_utils.save_blend_file(BLEND_FILE_PATH)
 
 # ============================================================================================================================
 # Setup Lidar
@@ -99,12 +172,12 @@ if not LOAD_FROM_BLEND_FILE or scene_was_loaded:
 
     # Check if tug was found
     if tug_obj and ac_obj:
-        print("Found Tug and AC, setting up dynamic Lidar...")
+        log.info("Found Tug and AC, setting up dynamic Lidar...")
         
         # Get Tug's and AC's kinematics at its CURRENT position
         tug_data = urdf_utils.load_and_verify_urdf(TUG_URDF)
         tug_current_location = tug_obj.location 
-        tug_world_poses = urdf_utils.link_positions(tug_data, base_position=tug_current_location)
+        tug_world_poses = urdf_utils.link_positions(tug_data, base_position=tug_current_location, base_rotation=tug_obj.rotation_euler)
 
         ac_data = urdf_utils.load_and_verify_urdf(AC_URDF)
 
@@ -115,47 +188,119 @@ if not LOAD_FROM_BLEND_FILE or scene_was_loaded:
             obj = bpy.data.objects.get(name)
             
             if obj is None:
-                print(f"Surface '{name}' not found, skipping.")
+                log.warning(f"Surface '{name}' not found, skipping.")
                 continue
             if obj.type != 'MESH':
-                print(f"Object '{name}' is not a mesh, skipping.")
+                log.warning(f"Object '{name}' is not a mesh, skipping.")
                 continue
 
             # force dependency graph update to ensure valid bound_box
             bpy.context.view_layer.update()
             obj.parent = tug_obj
 
-            print(f"Current location of {name}: {obj.location}")
-            print(f"Current box for {name}: {list(obj.bound_box)}")
-
-        for yaw_deg in TUG_ORIENTATIONS:
+            log.debug(f"Current location of {name}: {obj.location}")
+            log.debug(f"Current box for {name}: {list(obj.bound_box)}")
+
+        # Aircraft pose for every orientation in one vectorized FK pass (towbar on the tug's caster)
+        with instrumentation.span("realignment", yaws=len(TUG_ORIENTATIONS)):
+            alignment = alignment_utils.align_aircraft(tug_data, ac_data, TUG_ORIENTATIONS, tug_location=tuple(tug_obj.location),
+                                                       tug_rotation=tuple(tug_obj.rotation_euler), ac_rotation=tuple(ac_obj.rotation_euler))
+
+        scan_yaws = list(TUG_ORIENTATIONS)
+        if CLEARANCE_CHECK:
+            with instrumentation.span("clearance", yaws=len(TUG_ORIENTATIONS)):
+                parts = [(o.name, *blender_utils.mesh_arrays_in_frame(o, tug_obj), np.identity(4))
+                         for o in [tug_obj] + [bpy.data.objects.get(s) for s in SURFACES] if o is not None and o.type == 'MESH']
+                checker = clearance_utils.ClearanceChecker(parts, *blender_utils.mesh_arrays_in_frame(ac_obj, ac_obj),
+                                                           exclude=[clearance_utils.link_box(ac_data, "towbar", (0.6, 0.6, 0.8))])
+                feasible, _ = clearance_utils.feasible_yaws(checker, alignment, CLEARANCE_MIN)
+            scan_yaws = [y for y in TUG_ORIENTATIONS if y in feasible]
+            log.info(f"Clearance check: {len(scan_yaws)} of {len(TUG_ORIENTATIONS)} orientations are feasible.")
+
+        if WRITE_SCAN_MANIFEST:
+            # Export the sweep instead of scanning here: grid points in the tug frame
+            # plus the aligned aircraft location for every yaw.
+            tug_inv = tug_obj.matrix_world.inverted()
+            plate_points = {s: [tuple(tug_inv @ p) for p in blender_utils.get_grid_points(s)[0]] for s in SURFACES}
+
+            aligned_ac_location = alignment_utils.alignment_lookup(alignment)
+            jobs = scan_scheduler.expand_manifest(scan_yaws, plate_points, tug_location=tuple(tug_obj.location),
+                                                  aircraft_location=lambda yaw_deg: aligned_ac_location[yaw_deg], sensor_model=SENSOR_MODEL)
+            scan_scheduler.write_manifest(jobs, MANIFEST_PATH)
+
+        export_writer = None
+        if ASYNC_EXPORT:
+            async_export.remove_stale_temp(EXPORT_DIR)
+            export_writer = async_export.ScanWriter(EXPORT_WORKERS, EXPORT_QUEUE, EXPORT_COMPRESSION)
+        catalog = scan_catalog.ScanCatalog(CATALOG_PATH) if CATALOG_PATH and not WRITE_SCAN_MANIFEST else None
+        cache = scan_cache.ScanCache(SCAN_CACHE_DIR) if SCAN_CACHE_DIR and not WRITE_SCAN_MANIFEST else None
+        scene_fps = {}  # yaw -> blender_scene_fingerprint, hashed once per orientation
+
+        if SEARCH_MODE == "surrogate" and not WRITE_SCAN_MANIFEST:
+            with instrumentation.span("surrogate_setup"):
+                # Candidates in the tug frame: the plates are parented to the tug and follow its yaw.
+                coverage_model = coverage_utils.voxelize_aircraft(*blender_utils.mesh_arrays_in_frame(ac_obj, ac_obj))
+                tug_inv = tug_obj.matrix_world.inverted()
+                candidates = [(yaw_deg, surf, idx, tug_inv @ pt) for yaw_deg in scan_yaws for idx, (surf, pt) in
+                              enumerate([(s, p) for s in SURFACES for p in blender_utils.get_grid_points(s, *SEARCH_GRID)[0]], start=1)]
+                if candidates:
+                    lidar_cam = blender_utils.create_camera(name="lidar", location=candidates[0][3], rotation_degrees=(90, 0, 90),
+                                                            scale=(0.15, 0.15, 0.15), sensor_model=SENSOR_MODEL)
+
+            def scan_candidates(indices):
+                scores = []
+                for i in indices:
+                    yaw_deg, surf, idx, pt = candidates[i]
+                    tug_obj.rotation_euler = (0.0, 0.0, math.radians(yaw_deg))
+                    blender_utils.set_position(ac_obj.name, Vector(alignment["aircraft_location"][TUG_ORIENTATIONS.index(yaw_deg)]))
+                    bpy.context.view_layer.update()
+                    if cache is not None and yaw_deg not in scene_fps:
+                        scene_fps[yaw_deg] = lidar_utils.blender_scene_fingerprint()
+                    blender_utils.set_position(lidar_cam.name, tug_obj.matrix_world @ pt + Vector((0, 0, 0.1)))
+                    bpy.context.view_layer.update()
+                    # Headless: range_scanner scans are read back from CSVs labelled by category, without the aircraft's name.
+                    with instrumentation.span("scan", yaw=yaw_deg, surface=surf, index=idx):
+                        scan = lidar_utils.run_detailed_rotating_scan(scanner_name=lidar_cam.name, output_dir=EXPORT_DIR,
+                                                                      output_filename=f"{scan_scheduler.yaw_tag(yaw_deg)}_{surf}_scan_{idx:03d}",
+                                                                      add_mesh_to_scene=False, backend="headless",
+                                                                      metadata={"yaw_deg": yaw_deg, "surface": surf, "index": idx},
+                                                                      writer=export_writer, catalog=catalog, cache=cache, scene_fp=scene_fps.get(yaw_deg))
+                    if ac_obj.name not in scan["names"]:
+                        raise RuntimeError(f"Scan of candidate {i} names no '{ac_obj.name}'; the surrogate search has no coverage to score.")
+                    ac_matrix = mesh_utils.transform_matrix(tuple(ac_obj.location), tuple(ac_obj.rotation_euler))
+                    scores.append(coverage_utils.score_scan(coverage_model, scan, ac_matrix, target=ac_obj.name)["coverage"])
+                    log.info(f"[SEARCH] yaw {yaw_deg} | {surf} | {idx}: coverage {scores[-1]:.4f}")
+                return scores
+
+            if not candidates:
+                log.warning("Surrogate search: no candidates (no feasible orientation or no plate grid points).")
+            else:
+                X = surrogate_search.features([tuple(c[3]) for c in candidates], [c[0] for c in candidates])
+                search = surrogate_search.search(X, scan_candidates, max_scans=SEARCH_MAX_SCANS, min_gain=SEARCH_MIN_GAIN)
+                yaw_deg, surf, idx, _ = candidates[search["best"]]
+                log.info(f"Surrogate search: best placement yaw {yaw_deg} | {surf} | {idx} with coverage {search['best_score']:.4f} "
+                         f"after {len(search['scores'])} of {len(candidates)} candidate scans ({search['stop']}).")
+
+        for yaw_deg in ([] if WRITE_SCAN_MANIFEST or SEARCH_MODE == "surrogate" else scan_yaws):
             yaw_rad = math.radians(yaw_deg)
             tug_obj.rotation_euler = (0.0, 0.0, yaw_rad)
             bpy.context.view_layer.update() 
 
             #Realignment of the Tug with AC model..
-            tug_world_poses = urdf_utils.link_positions(tug_data, base_position=tug_obj.location)
-            caster_pos = urdf_utils.get_link_position(tug_world_poses, "caster")
-            print(caster_pos)
-            ac_world_poses = urdf_utils.link_positions(ac_data, base_position=ac_obj.location)
-            towbar_pos = urdf_utils.get_link_position(ac_world_poses, "towbar")
-            print(towbar_pos)
-            if caster_pos is not None and towbar_pos is not None:
-                correction = caster_pos - towbar_pos
-                correction_vector = Vector(correction)
-                print(correction_vector)
-                new_ac_pos = ac_obj.location + correction_vector
+            with instrumentation.span("realignment", yaw=yaw_deg):
+                new_ac_pos = Vector(alignment["aircraft_location"][TUG_ORIENTATIONS.index(yaw_deg)])
                 blender_utils.set_position(ac_obj.name, new_ac_pos)
                 bpy.context.view_layer.update()
-            else : 
-                print("Not able to perform realignment")
+            if cache is not None:
+                scene_fps[yaw_deg] = lidar_utils.blender_scene_fingerprint()
 
-            print(f"\n=== Scanning with Tug orientation {yaw_deg}° ===")
+            log.info(f"=== Scanning with Tug orientation {yaw_deg}° ===")
 
-            tug_world_poses = urdf_utils.link_positions(tug_data, base_position=tug_obj.location)
+            tug_world_poses = urdf_utils.link_positions(tug_data, base_position=tug_obj.location, base_rotation=tug_obj.rotation_euler)
 
             
-            grid_points = [(s, p) for s in SURFACES for p in blender_utils.get_grid_points(s)[0]]
+            with instrumentation.span("grid_sampling", yaw=yaw_deg):
+                grid_points = [(s, p) for s in SURFACES for p in blender_utils.get_grid_points(s)[0]]
           
 
     
@@ -169,41 +314,67 @@ if not LOAD_FROM_BLEND_FILE or scene_was_loaded:
                 name=lidar_name,
                 location=grid_points[0][1],
                 rotation_degrees=lidar_rotation,
-                scale=lidar_scale
+                scale=lidar_scale,
+                sensor_model=SENSOR_MODEL
             )
             
             z_offset = 0.1   # raise LiDAR a bit above the plate (meters)
             show_wire = True  # draw scans as wire so point clouds are easy to see
-            orientation_tag = f"yaw_{yaw_deg:03d}"
-            print("Ahya poicha")
+            orientation_tag = scan_scheduler.yaw_tag(yaw_deg)
+            # Scans of this orientation and when they started: fusion reads only these files, not leftovers of earlier runs.
+            out_names, orientation_start = [], math.floor(time.time())
 
             for idx, (surf,pt) in enumerate(grid_points, start=1):
                 # move lidar to this grid point (+ small Z )
-                print(f"[SCAN] {orientation_tag} | {surf} | {idx}/{len(grid_points)} "f"at {(round(pt.x,3), round(pt.y,3), round(pt.z,3))}")
+                log.info(f"[SCAN] {orientation_tag} | {surf} | {idx}/{len(grid_points)} "f"at {(round(pt.x,3), round(pt.y,3), round(pt.z,3))}")
                 pos = Vector((pt.x, pt.y, pt.z + z_offset))
                 blender_utils.set_position(lidar_cam.name, pos)
-                print("Ahya poicha3")
                 #bpy.context.view_layer.update()
                 out_name = f"{orientation_tag}_{surf}_scan_{idx:03d}"
+                out_names.append(out_name)
                 
                 # remember current objects to detect what the scanner adds
                 before = {o.name for o in bpy.data.objects}
-                print("Ahya poicha")
-                lidar_utils.run_detailed_rotating_scan(
-                    scanner_name=lidar_cam.name,
-                    output_dir=EXPORT_DIR,
-                    output_filename=out_name,
-                    export=True,          # set True later if you want files
-                    add_mesh_to_scene=True 
-                    #target_object=bpy.data.objects.get(surf)   
-                )
+                with instrumentation.span("scan", yaw=yaw_deg, surface=surf, index=idx):
+                    lidar_utils.run_detailed_rotating_scan(
+                        scanner_name=lidar_cam.name,
+                        output_dir=EXPORT_DIR,
+                        output_filename=out_name,
+                        export=True,          # set True later if you want files
+                        add_mesh_to_scene=not FUSE_SCANS,
+                        metadata={"yaw_deg": yaw_deg, "surface": surf, "index": idx},
+                        writer=export_writer,
+                        catalog=catalog,
+                        cache=cache,
+                        scene_fp=scene_fps.get(yaw_deg),
+                        #target_object=bpy.data.objects.get(surf)   
+                    )
                 bpy.context.view_layer.update()
-                            
+
+            if export_writer is not None:
+                export_writer.flush()
+            outputs = [lidar_utils.exported_file(EXPORT_DIR, name, since=orientation_start, writer=export_writer) for name in out_names]
+            outputs = [path for path in outputs if path is not None]
+            if FUSE_SCANS and not outputs:
+                log.warning(f"No exports of {orientation_tag} found, nothing to fuse.")
+            elif FUSE_SCANS:
+                with instrumentation.span("fusion", yaw=yaw_deg):
+                    cloud_path, _ = fusion_utils.fuse_orientation(EXPORT_DIR, orientation_tag, FUSION_VOXEL_SIZE, outputs=outputs)
+                    _, fused = scan_io.read_scan(cloud_path)
+                    lidar_utils.emit_scan({"X": fused["x"], "Y": fused["y"], "Z": fused["z"]}, EXPORT_DIR,
+                                          f"{orientation_tag}_fused", export=False)
+
+        if export_writer is not None:
+            export_writer.close()
+        if catalog is not None:
+            catalog.close()
 
     else:
-        print("ERROR in Action Block: Could not find required objects.")
-        print(f"  Found Tug: {'Yes' if tug_obj else 'No'}")
-        print(f"  Found AC: {'Yes' if ac_obj else 'No'}")
+        log.error("Action Block could not find required objects.")
+        log.error(f"  Found Tug: {'Yes' if tug_obj else 'No'}")
+        log.error(f"  Found AC: {'Yes' if ac_obj else 'No'}")
 
-print("\n--- SCRIPT COMPLETE ---")
+if TRACE_RUN:
+    instrumentation.write_run_report(EXPORT_DIR, "run")
+log.info("--- SCRIPT COMPLETE ---")
 
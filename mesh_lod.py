@@ -0,0 +1,220 @@
+#
+# FILE: mesh_lod.py
+#
+# Levels of detail of the imported meshes for the headless ray caster and the
+# coverage model. A level is built by quadric-error clustering: vertices are
+# grouped on a grid, every group collapses to the point closest (in summed
+# squared plane distance) to its faces' planes, and groups whose vertices
+# would move further than the level's error bound are split on a finer grid
+# until none do. Every point of a level's surface therefore lies within its
+# error bound of the source surface.
+#
+# The chain of levels of a mesh file is cached next to its mesh cache
+# (.mesh_cache/<name>-<hash>-lod.npz) and keyed by the file's content hash.
+# select_lod picks, per object, the coarsest level a sensor cannot tell
+# apart from the source: error within the sensor's range noise and within
+# half its ray spacing at the object's distance.
+#
+import os
+import math
+import numpy as np
+
+import file_utils
+import mesh_utils
+import instrumentation
+
+log = instrumentation.get_logger(__name__)
+
+LOD_CACHE_VERSION = 1
+# Error bounds (m, mesh units) of the simplified levels; level 0 is always the source mesh (error 0).
+LOD_ERRORS = (0.0025, 0.005, 0.01, 0.02, 0.04)
+# Range noise (1 sigma, m) assumed for scans without a sensor model.
+DEFAULT_RANGE_NOISE = 0.02
+
+
+def _face_quadrics(vertices, faces):
+    """Area-weighted plane quadrics of the faces as (A (F,3,3), b (F,3)): area * (n.x + d)^2 = x'Ax + 2b'x + const."""
+    tris = vertices[faces]
+    cross = np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0])
+    double_area = np.linalg.norm(cross, axis=1)
+    n = cross / np.maximum(double_area, 1e-300)[:, None]
+    d = -np.einsum("ij,ij->i", n, tris[:, 0])
+    A = 0.5 * double_area[:, None, None] * n[:, :, None] * n[:, None, :]
+    b = (0.5 * double_area * d)[:, None] * n
+    return A, b
+
+
+def _cluster_points(vertices, faces, A_f, b_f, label, n_clusters, cond=1e-3):
+    """
+    Quadric-optimal point of every cluster. Each face adds its quadric to the clusters of its corners;
+    the minimiser is taken with a pseudo-inverse about the cluster mean, so directions the planes
+    leave free (flat or straight patches) keep the mean.
+    """
+    corner = label[faces].ravel()
+    Ab = np.repeat(np.concatenate([A_f.reshape(-1, 9), b_f], axis=1), 3, axis=0)
+    sums = np.stack([np.bincount(corner, Ab[:, i], n_clusters) for i in range(12)], axis=1)
+    A, b = sums[:, :9].reshape(-1, 3, 3), sums[:, 9:]
+    counts = np.bincount(label, minlength=n_clusters)[:, None]
+    mean = np.stack([np.bincount(label, vertices[:, i], n_clusters) for i in range(3)], axis=1) / counts
+    w, V = np.linalg.eigh(A)
+    keep = w > cond * w[:, -1:]
+    y = np.einsum("kji,kj->ki", V, -b - np.einsum("kij,kj->ki", A, mean))
+    y = np.where(keep, y / np.where(keep, w, 1.0), 0.0)
+    return mean + np.einsum("kij,kj->ki", V, y)
+
+
+def simplify(vertices, faces, max_error, coarsest=2.0):
+    """
+    Quadric-clustered copy of a mesh whose vertices move at most max_error (mesh units).
+    Clustering starts on a grid of coarsest * max_error; clusters that would move a vertex further are
+    split on grids of half the size. Representatives are clamped into their cells, so cells with a
+    diagonal below max_error always pass (two splits from the default start). Faces that collapse are
+    dropped, as are duplicates.
+    Returns (vertices (float32), faces, error) with error the largest vertex displacement (<= max_error).
+    """
+    v = np.asarray(vertices, dtype=np.float64)
+    f = np.asarray(faces, dtype=np.int64)
+    A_f, b_f = _face_quadrics(v, f)
+    origin = v.min(axis=0)
+    cell = coarsest * float(max_error)
+    splits = int(math.ceil(math.log2(coarsest * math.sqrt(3.0))))
+    size = int(np.ceil((v.max(axis=0) - origin).max() / (cell / 2.0 ** splits))) + 1
+    level = np.zeros(len(v), dtype=np.int64)
+    ijk = np.floor((v - origin) / cell).astype(np.int64)
+    for _ in range(splits + 1):
+        keys = ((level * size + ijk[:, 0]) * size + ijk[:, 1]) * size + ijk[:, 2]
+        _, lead, label = np.unique(keys, return_index=True, return_inverse=True)
+        points = _cluster_points(v, f, A_f, b_f, label, len(lead))
+        cell_size = cell / 2.0 ** level[lead]
+        lo = origin + ijk[lead] * cell_size[:, None]
+        points = np.clip(points, lo, lo + cell_size[:, None])
+        displacement = np.linalg.norm(v - points[label], axis=1)
+        worst = np.zeros(len(lead))
+        np.maximum.at(worst, label, displacement)
+        split = (worst > max_error)[label]
+        if not split.any():
+            break
+        level[split] += 1
+        ijk[split] = np.floor((v[split] - origin) / (cell / 2.0 ** level[split])[:, None]).astype(np.int64)
+
+    g = label.ravel()[f]
+    g = g[(g[:, 0] != g[:, 1]) & (g[:, 1] != g[:, 2]) & (g[:, 0] != g[:, 2])]
+    _, first = np.unique(np.sort(g, axis=1), axis=0, return_index=True)
+    used, g = np.unique(g[np.sort(first)], return_inverse=True)
+    return points[used].astype(np.float32), g.reshape(-1, 3), float(displacement.max(initial=0.0))
+
+
+def build_lods(vertices, faces, errors=LOD_ERRORS):
+    """
+    Chain of levels [{"error", "measured", "vertices", "faces"}], finest first: level 0 is the source
+    mesh, level k its simplify(..., errors[k - 1]). Every level is simplified from the source, so each
+    bound holds against the source surface. "measured" is the largest vertex displacement actually made.
+    """
+    lods = [{"error": 0.0, "measured": 0.0, "vertices": vertices, "faces": faces}]
+    for error in sorted(errors):
+        v, f, measured = simplify(vertices, faces, error)
+        lods.append({"error": float(error), "measured": measured, "vertices": v, "faces": f})
+    return lods
+
+
+def lod_cache_path(filepath, cache_dir=None):
+    """Cache file of a mesh's levels, next to its mesh_utils cache entry."""
+    return mesh_utils.mesh_cache_path(filepath, cache_dir)[:-len(".npz")] + "-lod.npz"
+
+
+def _read_lod_cache(path, digest, errors):
+    try:
+        with np.load(path) as data:
+            if int(data["version"]) != LOD_CACHE_VERSION or str(data["sha256"]) != digest \
+                    or not np.array_equal(data["errors"], errors):
+                return None
+            return [{"error": float(e), "measured": float(m), "vertices": data[f"vertices{k}"], "faces": data[f"faces{k}"].astype(np.int64)}
+                    for k, (e, m) in enumerate(zip(data["errors"], data["measured"]), start=1)]
+    except (FileNotFoundError, KeyError, ValueError, OSError):
+        return None
+
+
+def _write_lod_cache(path, digest, lods):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    arrays = {}
+    for k, lod in enumerate(lods, start=1):
+        arrays[f"vertices{k}"] = lod["vertices"]
+        arrays[f"faces{k}"] = lod["faces"].astype(np.uint32)
+    tmp_path = f"{path}.{file_utils.temp_tag()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, version=LOD_CACHE_VERSION, sha256=digest, errors=np.array([lod["error"] for lod in lods]),
+                 measured=np.array([lod["measured"] for lod in lods]), **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_lods(filepath, errors=LOD_ERRORS, cache_dir=None):
+    """
+    build_lods of a mesh file through the on-disk cache: the simplified levels are rebuilt only when
+    the file's content or the error bounds change. Level 0 comes from mesh_utils.load_mesh_cached.
+    """
+    vertices, faces, _ = mesh_utils.load_mesh_cached(filepath, cache_dir)
+    errors = np.array(sorted(errors), dtype=np.float64)
+    path = lod_cache_path(filepath, cache_dir)
+    digest = file_utils.file_hash(filepath)
+    levels = _read_lod_cache(path, digest, errors)
+    if levels is None:
+        with instrumentation.span("build_lods", mesh=os.path.basename(filepath), faces=len(faces)):
+            levels = build_lods(vertices, faces, errors)[1:]
+        _write_lod_cache(path, digest, levels)
+        log.info(f"Mesh levels of {os.path.basename(filepath)}: " + ", ".join(
+            f"{lod['error'] * 1000:g} mm -> {len(lod['faces'])} faces" for lod in levels) + f" (source {len(faces)} faces)")
+    lods = [{"error": 0.0, "measured": 0.0, "vertices": vertices, "faces": faces}] + levels
+    lods[-1]["spheres"] = _face_spheres(lods[-1]["vertices"], lods[-1]["faces"])
+    return lods
+
+
+def _face_spheres(vertices, faces):
+    """(centers, radii) of spheres around each face (centroid and farthest corner)."""
+    tris = np.asarray(vertices, dtype=np.float64)[faces]
+    centers = tris.mean(axis=1)
+    return centers, np.linalg.norm(tris - centers[:, None], axis=2).max(axis=1)
+
+
+def _matrix_scale(matrix):
+    return float(np.linalg.norm(np.asarray(matrix, dtype=np.float64)[:3, :3], axis=0).max())
+
+
+def nearest_distance(lods, matrix_world, origin):
+    """
+    Lower bound of the distance (m) from origin to an object's surface: the face spheres of the coarsest
+    level, less its error bound. Cheap enough to evaluate per scan.
+    """
+    M = np.asarray(matrix_world, dtype=np.float64)
+    scale = _matrix_scale(M)
+    centers, radii = lods[-1]["spheres"]
+    world = centers @ M[:3, :3].T + M[:3, 3]
+    gap = np.linalg.norm(world - np.asarray(origin, dtype=np.float64), axis=1) - radii * scale
+    return max(float(gap.min(initial=np.inf)) - lods[-1]["error"] * scale, 0.0)
+
+
+def error_budget(distance, angular_step_deg, range_noise=DEFAULT_RANGE_NOISE):
+    """
+    Largest geometric error (m) a sensor cannot tell apart at distance: its range noise, or half its
+    ray spacing there when that is smaller (detail between two rays is never sampled).
+    """
+    return min(float(range_noise), 0.5 * distance * math.radians(angular_step_deg))
+
+
+def level_within(lods, max_error, scale=1.0):
+    """Index of the coarsest level whose error bound (times the object's scale) is within max_error."""
+    level = 0
+    for k, lod in enumerate(lods):
+        if lod["error"] * scale <= max_error:
+            level = k
+    return level
+
+
+def select_lod(lods, matrix_world, origin, angular_step_deg, range_noise=DEFAULT_RANGE_NOISE):
+    """Level of an object placed at matrix_world for a sensor at origin: level_within its error_budget."""
+    budget = error_budget(nearest_distance(lods, matrix_world, origin), angular_step_deg, range_noise)
+    return level_within(lods, budget, _matrix_scale(matrix_world))
+
+
+def select_levels(chains, matrices, origin, angular_step_deg, range_noise=DEFAULT_RANGE_NOISE):
+    """{name: level} of the objects with a chain ({name: load_lods(...)}) at {name: matrix_world}."""
+    return {name: select_lod(lods, matrices[name], origin, angular_step_deg, range_noise) for name, lods in chains.items()}
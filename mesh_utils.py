@@ -0,0 +1,235 @@
+#
+# FILE: mesh_utils.py
+#
+import os
+import math
+import hashlib
+import numpy as np
+
+import file_utils
+import instrumentation
+
+log = instrumentation.get_logger(__name__)
+
+MESH_CACHE_VERSION = 1
+
+PLY_TYPES = {
+    "char": "i1", "uchar": "u1", "int8": "i1", "uint8": "u1",
+    "short": "i2", "ushort": "u2", "int16": "i2", "uint16": "u2",
+    "int": "i4", "uint": "u4", "int32": "i4", "uint32": "u4",
+    "float": "f4", "double": "f8", "float32": "f4", "float64": "f8",
+}
+
+
+def transform_matrix(location=(0, 0, 0), rotation=(0, 0, 0), scale=(1, 1, 1)):
+    """Builds a 4x4 world matrix from location, XYZ euler rotation (radians) and scale, like Blender's matrix_world."""
+    rx, ry, rz = rotation
+    cx, sx = math.cos(rx), math.sin(rx)
+    cy, sy = math.cos(ry), math.sin(ry)
+    cz, sz = math.cos(rz), math.sin(rz)
+    Rx = np.array([[1, 0, 0], [0, cx, -sx], [0, sx, cx]])
+    Ry = np.array([[cy, 0, sy], [0, 1, 0], [-sy, 0, cy]])
+    Rz = np.array([[cz, -sz, 0], [sz, cz, 0], [0, 0, 1]])
+    M = np.identity(4)
+    M[:3, :3] = (Rz @ Ry @ Rx) * np.asarray(scale, dtype=float)
+    M[:3, 3] = location
+    return M
+
+
+def _read_ply_header(data):
+    """Parses a PLY header and returns (format, elements, body offset)."""
+    end = data.find(b"end_header")
+    if not data.startswith(b"ply") or end < 0:
+        raise ValueError("Not a PLY file.")
+    offset = data.index(b"\n", end) + 1
+    fmt, elements = None, []
+    for line in data[:end].decode("ascii").splitlines():
+        parts = line.split()
+        if not parts:
+            continue
+        if parts[0] == "format":
+            fmt = parts[1]
+        elif parts[0] == "element":
+            elements.append((parts[1], int(parts[2]), []))
+        elif parts[0] == "property":
+            elements[-1][2].append(parts[1:])
+    return fmt, elements, offset
+
+
+def _map_file(filepath):
+    """Read-only memory map of a file (an empty array for empty files)."""
+    if os.path.getsize(filepath) == 0:
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(filepath, dtype=np.uint8, mode="r")
+
+
+def load_ply(filepath):
+    """Reads a binary little-endian PLY and returns (vertices (V,3) float32, faces (F,3) int64)."""
+    data = _map_file(filepath)
+    fmt, elements, offset = _read_ply_header(data[:65536].tobytes())
+    if fmt != "binary_little_endian":
+        raise ValueError(f"{filepath}: only binary_little_endian PLY is supported, got '{fmt}'.")
+
+    vertices, faces = None, None
+    for name, count, props in elements:
+        if vertices is not None and faces is not None:
+            break  # Trailing elements (edges, materials, ...) are not needed.
+        if name == "vertex":
+            dtype = np.dtype([(p[1], "<" + PLY_TYPES[p[0]]) for p in props])
+            block = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+            vertices = np.stack([block["x"], block["y"], block["z"]], axis=1).astype(np.float32)
+            offset += dtype.itemsize * count
+        elif name == "face":
+            if len(props) != 1 or props[0][0] != "list":
+                raise ValueError(f"{filepath}: unsupported face layout {props}.")
+            count_t, index_t = "<" + PLY_TYPES[props[0][1]], "<" + PLY_TYPES[props[0][2]]
+            tri = np.dtype([("n", count_t), ("v", index_t, 3)])
+            block = np.frombuffer(data, dtype=tri, count=count, offset=offset) if count else None
+            if block is not None and np.all(block["n"] == 3):
+                faces = block["v"].astype(np.int64)
+                offset += tri.itemsize * count
+            else:
+                # Mixed polygons: walk the list once and fan-triangulate.
+                n_size, i_size = np.dtype(count_t).itemsize, np.dtype(index_t).itemsize
+                tris = []
+                for _ in range(count):
+                    n = int(np.frombuffer(data, count_t, 1, offset)[0])
+                    idx = np.frombuffer(data, index_t, n, offset + n_size)
+                    offset += n_size + n * i_size
+                    tris.extend((idx[0], idx[k], idx[k + 1]) for k in range(1, n - 1))
+                faces = np.asarray(tris, dtype=np.int64).reshape(-1, 3)
+        elif all(p[0] != "list" for p in props):
+            # Fixed-size element we do not use: skip it by its declared size.
+            offset += np.dtype([(p[1], "<" + PLY_TYPES[p[0]]) for p in props]).itemsize * count
+        else:
+            raise ValueError(f"{filepath}: cannot skip list element '{name}' before the mesh data.")
+    if vertices is None or faces is None:
+        raise ValueError(f"{filepath}: missing vertex or face element.")
+    return vertices, faces
+
+
+def dedupe_vertices(vertices, faces):
+    """Merges bit-identical vertices (-0.0 == 0.0). Returns (unique vertices, remapped faces)."""
+    vertices = np.ascontiguousarray(np.asarray(vertices, dtype=np.float32) + np.float32(0.0))
+    keys = vertices.view(np.dtype((np.void, vertices.dtype.itemsize * 3))).ravel()
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    return vertices[first], inverse.reshape(-1).astype(np.int64)[faces]
+
+
+def load_stl(filepath, dedupe=True):
+    """
+    Reads a binary STL and returns (vertices (V,3) float32, faces (F,3) int64).
+    Corners sharing a position are merged unless dedupe is False (one vertex per corner).
+    """
+    data = _map_file(filepath)
+    if len(data) < 84:
+        raise ValueError(f"{filepath}: file too small to be a binary STL.")
+    count = int(np.frombuffer(data, "<u4", 1, 80)[0])
+    if 84 + 50 * count > len(data):
+        raise ValueError(f"{filepath}: ASCII or truncated STL is not supported.")
+    if 84 + 50 * count < len(data):
+        # Some exporters pad the file or append their own data after the last triangle.
+        log.warning(f"{filepath}: ignoring {len(data) - 84 - 50 * count} bytes after the {count} triangles.")
+    record = np.dtype([("normal", "<f4", 3), ("v", "<f4", (3, 3)), ("attr", "<u2")])
+    block = np.frombuffer(data, dtype=record, count=count, offset=84)
+    vertices = block["v"].reshape(-1, 3).astype(np.float32)
+    faces = np.arange(3 * count, dtype=np.int64).reshape(-1, 3)
+    return dedupe_vertices(vertices, faces) if dedupe else (vertices, faces)
+
+
+def load_mesh(filepath):
+    """Loads a PLY or STL mesh based on its extension."""
+    ext = os.path.splitext(filepath)[1].lower()
+    if ext == ".ply":
+        return load_ply(filepath)
+    if ext == ".stl":
+        return load_stl(filepath)
+    raise ValueError(f"Unsupported mesh format: {filepath}")
+
+
+def face_normals(vertices, faces):
+    """Unit normals (F,3) of every triangle (zero for degenerate ones)."""
+    tris = np.asarray(vertices, dtype=np.float64)[faces]
+    n = np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0])
+    length = np.linalg.norm(n, axis=1, keepdims=True)
+    return (n / np.where(length > 0, length, 1.0)).astype(np.float32)
+
+
+def vertex_normals(vertices, faces):
+    """Area-weighted unit vertex normals (V,3)."""
+    tris = np.asarray(vertices, dtype=np.float64)[faces]
+    n = np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0])  # length = 2 * area
+    flat = np.asarray(faces).ravel()
+    summed = np.stack([np.bincount(flat, np.repeat(n[:, k], 3), len(vertices)) for k in range(3)], axis=1)
+    length = np.linalg.norm(summed, axis=1, keepdims=True)
+    return (summed / np.where(length > 0, length, 1.0)).astype(np.float32)
+
+
+def mesh_cache_path(filepath, cache_dir=None):
+    """Cache file of a mesh: <cache_dir or <mesh dir>/.mesh_cache>/<name>-<path hash>.npz."""
+    filepath = os.path.abspath(filepath)
+    cache_dir = cache_dir or os.path.join(os.path.dirname(filepath), ".mesh_cache")
+    tag = hashlib.sha1(filepath.encode()).hexdigest()[:12]
+    return os.path.join(cache_dir, f"{os.path.basename(filepath)}-{tag}.npz")
+
+
+def _read_mesh_cache(path, st):
+    """(mesh, content sha256, stamp matches size/mtime) of a cache entry, or (None, None, False)."""
+    try:
+        with np.load(path) as data:
+            if int(data["version"]) != MESH_CACHE_VERSION:
+                return None, None, False
+            mesh = data["vertices"], data["faces"].astype(np.int64), data["normals"]
+            fresh = int(data["size"]) == st.st_size and int(data["mtime_ns"]) == st.st_mtime_ns
+            return mesh, str(data["sha256"]), fresh
+    except (FileNotFoundError, KeyError, ValueError, OSError):
+        return None, None, False
+
+
+def _write_mesh_cache(path, st, digest, mesh):
+    vertices, faces, normals = mesh
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{file_utils.temp_tag()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, version=MESH_CACHE_VERSION, size=st.st_size, mtime_ns=st.st_mtime_ns, sha256=digest,
+                 vertices=vertices, faces=faces.astype(np.uint32), normals=normals)
+    os.replace(tmp_path, path)
+
+
+def load_mesh_cached(filepath, cache_dir=None):
+    """
+    load_mesh through a compact .npz cache, also returning area-weighted vertex normals:
+    (vertices, faces, normals). An entry is used as is while the file's size and mtime match;
+    otherwise the file is hashed and only reparsed if its content changed.
+    """
+    path = mesh_cache_path(filepath, cache_dir)
+    st = os.stat(filepath)
+    mesh, cached_digest, fresh = _read_mesh_cache(path, st)
+    if mesh is not None and fresh:
+        return mesh
+    digest = file_utils.file_hash(filepath)
+    if mesh is None or digest != cached_digest:
+        vertices, faces = load_mesh(filepath)
+        mesh = vertices, faces, vertex_normals(vertices, faces)
+    _write_mesh_cache(path, st, digest, mesh)
+    return mesh
+
+
+def plane_mesh(size):
+    """Returns the vertices/faces of a square XY plane, like bpy.ops.mesh.primitive_plane_add."""
+    h = size / 2.0
+    vertices = np.array([[-h, -h, 0], [h, -h, 0], [h, h, 0], [-h, h, 0]], dtype=np.float32)
+    faces = np.array([[0, 1, 2], [0, 2, 3]], dtype=np.int64)
+    return vertices, faces
+
+
+def boundary_walls(size=60, distance=30):
+    """Floor and 3 walls matching blender_utils.create_boundary_walls, as (name, vertices, faces, matrix) tuples."""
+    walls = [
+        ("Wall_Back", (0, -distance, size / 2), (math.radians(90), 0, 0)),
+        ("Wall_Left", (-distance, 0, size / 2), (0, math.radians(90), 0)),
+        ("Wall_Right", (0, distance, size / 2), (math.radians(90), 0, 0)),
+        ("Floor", (0, 0, -0.6), (0, 0, 0)),
+    ]
+    vertices, faces = plane_mesh(size)
+    return [(name, vertices, faces, transform_matrix(loc, rot)) for name, loc, rot in walls]
@@ -0,0 +1,168 @@
+#
+# FILE: placement_optimizer.py
+#
+# Picks the best set of k lidar positions from a finished sweep. Every candidate
+# (one scan) becomes a row of a visibility matrix over the aircraft surface
+# voxels of coverage_utils, stored as compressed bitsets: only the non-zero
+# 64-bit words of a row are kept (word index + word), CSR style. Selection is
+# lazy-greedy max coverage, optionally with one sensor per plate and/or a
+# minimum baseline between sensors.
+#
+import heapq
+import numpy as np
+
+import coverage_utils
+import scan_io
+
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(words):
+    """Set bits of every uint64 word."""
+    return _POPCOUNT8[np.ascontiguousarray(words).view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.int64)
+
+
+def _row_words(elements):
+    """Sorted element indices -> (word indices, uint64 words) of the non-zero words."""
+    elements = np.asarray(elements, dtype=np.int64)
+    word_index, inverse = np.unique(elements >> 6, return_inverse=True)
+    words = np.zeros(len(word_index), dtype=np.uint64)
+    np.bitwise_or.at(words, inverse, np.left_shift(np.uint64(1), (elements & 63).astype(np.uint64)))
+    return word_index.astype(np.int32), words
+
+
+def visibility_matrix(rows, n_elements, names=None, groups=None, locations=None):
+    """
+    Builds the compressed visibility matrix from one array of visible element indices per candidate.
+    names, groups (e.g. plate name) and locations (C,3) describe the candidates for the constraints.
+    """
+    indptr, word_index, words = [0], [], []
+    for elements in rows:
+        w_idx, w = _row_words(elements)
+        word_index.append(w_idx)
+        words.append(w)
+        indptr.append(indptr[-1] + len(w))
+    n = len(indptr) - 1
+    return {
+        "n_elements": int(n_elements),
+        "n_words": (int(n_elements) + 63) >> 6,
+        "indptr": np.asarray(indptr, dtype=np.int64),
+        "word_index": np.concatenate(word_index) if n else np.zeros(0, dtype=np.int32),
+        "words": np.concatenate(words) if n else np.zeros(0, dtype=np.uint64),
+        "names": list(names) if names is not None else [str(i) for i in range(n)],
+        "groups": list(groups) if groups is not None else [None] * n,
+        "locations": None if locations is None else np.asarray(locations, dtype=np.float64),
+    }
+
+
+def build_visibility(model, sweep, target="a3320_ceo"):
+    """
+    Visibility matrix of a scan_io.load_sweep dict against a coverage_utils voxel model.
+    Scans are scored one at a time and only their compressed row is kept, so memory stays
+    proportional to what the candidates see, not to the point clouds. Every scan must record its
+    scanner location (scheduler "location" or Blender "matrix_world").
+    """
+    rows, names, groups, locations = [], [], [], []
+    for name, (header, columns) in sweep.items():
+        score = coverage_utils.score_lscan(model, header, columns, target)
+        metadata = header["metadata"]
+        rows.append(score["covered_voxels"])
+        names.append(name)
+        groups.append(metadata.get("surface"))
+        location = scan_io.scanner_location(metadata)
+        if location is None:
+            raise ValueError(f"Scan '{name}' records no scanner location (location or matrix_world) for the baseline constraint.")
+        locations.append(location)
+    return visibility_matrix(rows, len(model["keys"]), names, groups, locations)
+
+
+def load_visibility(model, directory, pattern="*", target="a3320_ceo"):
+    """build_visibility for the .lscan files of a directory (e.g. pattern="yaw_045_*" for one yaw)."""
+    return build_visibility(model, scan_io.load_sweep(directory, pattern), target)
+
+
+def save_visibility(vis, path):
+    np.savez(path, n_elements=vis["n_elements"], indptr=vis["indptr"], word_index=vis["word_index"],
+             words=vis["words"], names=np.asarray(vis["names"], dtype=str),
+             groups=np.asarray(["" if g is None else g for g in vis["groups"]], dtype=str),
+             locations=np.full((len(vis["names"]), 3), np.nan) if vis["locations"] is None else vis["locations"])
+
+
+def read_visibility(path):
+    with np.load(path) as data:
+        vis = visibility_matrix([], int(data["n_elements"]))
+        vis.update(indptr=data["indptr"], word_index=data["word_index"], words=data["words"],
+                   names=[str(n) for n in data["names"]], groups=[str(g) or None for g in data["groups"]],
+                   locations=data["locations"])
+    return vis
+
+
+def row(vis, c):
+    """(word indices, words) of candidate c."""
+    lo, hi = vis["indptr"][c], vis["indptr"][c + 1]
+    return vis["word_index"][lo:hi], vis["words"][lo:hi]
+
+
+def row_counts(vis):
+    """Number of visible elements of every candidate."""
+    bits = _popcount(vis["words"])
+    return np.add.reduceat(np.r_[bits, 0], vis["indptr"][:-1]) * (np.diff(vis["indptr"]) > 0)
+
+
+def coverage(vis, selection):
+    """Covered fraction of the union of the selected candidates (indices or names)."""
+    covered = np.zeros(vis["n_words"], dtype=np.uint64)
+    for c in selection:
+        w_idx, w = row(vis, vis["names"].index(c) if isinstance(c, str) else c)
+        covered[w_idx] |= w
+    return float(_popcount(covered).sum() / max(vis["n_elements"], 1))
+
+
+def _allowed(vis, c, selected, group_counts, max_per_group, min_baseline):
+    if max_per_group is not None and vis["groups"][c] is not None:
+        if group_counts.get(vis["groups"][c], 0) >= max_per_group:
+            return False
+    if min_baseline and selected and vis["locations"] is not None:
+        spacing = np.linalg.norm(vis["locations"][selected] - vis["locations"][c], axis=1)
+        if np.any(spacing < min_baseline):
+            return False
+    return True
+
+
+def select_greedy(vis, k, max_per_group=None, min_baseline=None, min_gain=1):
+    """
+    Lazy-greedy max coverage: picks up to k candidates, each time the allowed candidate adding
+    the most not-yet-covered elements. Stale gains are only recomputed when they reach the top
+    of the heap (coverage is submodular, so a stale gain is an upper bound).
+    max_per_group=1 gives one sensor per plate; min_baseline is the minimum distance (m) between
+    selected sensors. Stops early when no allowed candidate adds min_gain elements.
+    Returns a dict with selected indices and names, the gain of each pick and the coverage curve.
+    """
+    covered = np.zeros(vis["n_words"], dtype=np.uint64)
+    heap = [(-int(g), c, 0) for c, g in enumerate(row_counts(vis)) if g >= min_gain]
+    heapq.heapify(heap)
+    selected, gains, curve, group_counts = [], [], [], {}
+    total = 0
+    while heap and len(selected) < k:
+        neg_gain, c, stamp = heapq.heappop(heap)
+        if not _allowed(vis, c, selected, group_counts, max_per_group, min_baseline):
+            continue  # constraints only tighten as the selection grows
+        w_idx, w = row(vis, c)
+        if stamp != len(selected):
+            gain = int(_popcount(w & ~covered[w_idx]).sum())
+            if gain >= min_gain:
+                heapq.heappush(heap, (-gain, c, len(selected)))
+            continue
+        covered[w_idx] |= w
+        total += -neg_gain
+        selected.append(c)
+        gains.append(-neg_gain)
+        curve.append(total / max(vis["n_elements"], 1))
+        group = vis["groups"][c]
+        group_counts[group] = group_counts.get(group, 0) + 1
+    return {
+        "selected": selected,
+        "names": [vis["names"][c] for c in selected],
+        "gains": gains,
+        "coverage": curve,
+    }
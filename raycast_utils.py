@@ -0,0 +1,584 @@
+#
+# FILE: raycast_utils.py
+#
+# Headless (Blender-free) replacement for range_scanner's rotating scan.
+# The scene is flattened into world-space triangles, a BVH is built over
+# them and the whole ray pattern is intersected in vectorized batches.
+#
+import io
+import os
+import gzip
+import contextlib
+import numpy as np
+
+import mesh_utils
+import instrumentation
+
+CSV_COLUMNS = ("categoryID", "partID", "X", "Y", "Z", "distance", "intensity")
+CSV_FORMAT = "%s;%s;%.6f;%.6f;%.6f;%.6f;%.6f"
+RAY_BYTES = 640  # per-ray temporaries of a traced chunk besides the traversal stack (calibrated with tracemalloc)
+
+# Ray pattern and range limits of the detailed rotating scan, shared by every backend.
+DETAILED_SCAN_PARAMS = dict(
+    xStepDegree=0.4, fovX=360.0, yStepDegree=0.33, fovY=270.0,
+    reflectivityLower=1.0, distanceLower=0.0, reflectivityUpper=1.0, distanceUpper=99999.9, maxReflectionDepth=10,
+)
+# Defaults of the headless scan functions.
+_DEFAULTS = DETAILED_SCAN_PARAMS
+
+
+def _spread_bits(x):
+    """Spreads the low 10 bits of x so there are two zero bits between each (for Morton codes)."""
+    x = x.astype(np.uint64) & np.uint64(0x3FF)
+    x = (x | (x << np.uint64(16))) & np.uint64(0x030000FF)
+    x = (x | (x << np.uint64(8))) & np.uint64(0x0300F00F)
+    x = (x | (x << np.uint64(4))) & np.uint64(0x030C30C3)
+    x = (x | (x << np.uint64(2))) & np.uint64(0x09249249)
+    return x
+
+
+def morton_codes(points):
+    """30-bit Morton codes of points normalised to their bounding box."""
+    lo, hi = points.min(axis=0), points.max(axis=0)
+    q = ((points - lo) / np.maximum(hi - lo, 1e-12) * 1023.0).astype(np.int64)
+    return (_spread_bits(q[:, 0]) << np.uint64(2)) | (_spread_bits(q[:, 1]) << np.uint64(1)) | _spread_bits(q[:, 2])
+
+
+def build_bvh(triangles, leaf_size=4, width=4):
+    """
+    Builds a BVH over (T,3,3) world-space triangles.
+    Triangles are sorted along a Morton curve, grouped into leaves of leaf_size
+    and a complete width-ary tree (heap layout) is built bottom-up over the leaves.
+    """
+    triangles = np.asarray(triangles, dtype=np.float64)
+    count = len(triangles)
+    if count == 0:
+        raise ValueError("Cannot build a BVH without triangles.")
+    order = np.argsort(morton_codes(triangles.mean(axis=1)), kind="stable")
+
+    n_leaves = -(-count // leaf_size)
+    depth = 0
+    while width ** depth < n_leaves:
+        depth += 1
+    first_leaf = (width ** depth - 1) // (width - 1)
+
+    bvh = {
+        "order": order,
+        "count": count,
+        "leaf_size": leaf_size,
+        "width": width,
+        "depth": depth,
+        "first_leaf": first_leaf,
+        "bounds": np.empty((first_leaf + width ** depth, 2, 3)),
+    }
+    refit_bvh(bvh, triangles)
+    return bvh
+
+
+def refit_bvh(bvh, triangles):
+    """Recomputes all node bounds of a BVH for moved triangles, keeping its topology."""
+    triangles = np.asarray(triangles, dtype=np.float64)
+    tris = triangles[bvh["order"]]
+    # Per triangle: v0, edge v1-v0, edge v2-v0 packed as one row for a single gather.
+    bvh["tri_data"] = np.concatenate([tris[:, 0], tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0]], axis=1)
+
+    width, first_leaf, leaf_size = bvh["width"], bvh["first_leaf"], bvh["leaf_size"]
+    n_pad = len(bvh["bounds"]) - first_leaf
+    tri_lo = np.full((n_pad * leaf_size, 3), np.inf)
+    tri_hi = np.full((n_pad * leaf_size, 3), -np.inf)
+    tri_lo[:len(tris)] = tris.min(axis=1)
+    tri_hi[:len(tris)] = tris.max(axis=1)
+
+    # bounds[node] = (lo, hi); padding leaves stay empty (lo > hi).
+    bounds = bvh["bounds"]
+    bounds[first_leaf:, 0] = tri_lo.reshape(n_pad, leaf_size, 3).min(axis=1)
+    bounds[first_leaf:, 1] = tri_hi.reshape(n_pad, leaf_size, 3).max(axis=1)
+    for level in range(bvh["depth"] - 1, -1, -1):
+        start = (width ** level - 1) // (width - 1)
+        nodes = np.arange(start, start + width ** level)
+        children = bounds[width * nodes[:, None] + 1 + np.arange(width)]
+        bounds[nodes, 0] = children[:, :, 0].min(axis=1)
+        bounds[nodes, 1] = children[:, :, 1].max(axis=1)
+    return bvh
+
+
+def _slab_test(bounds, origins, inv_dirs):
+    """Entry/exit distances of rays against (..., 2, 3) lo/hi boxes; origins/inv_dirs broadcast over the box axes."""
+    t0 = (bounds[..., 0, :] - origins) * inv_dirs
+    t1 = (bounds[..., 1, :] - origins) * inv_dirs
+    lo, hi = np.minimum(t0, t1), np.maximum(t0, t1)
+    # Explicit per-axis max/min: much faster than reducing over a length-3 axis.
+    t_near = np.maximum(np.maximum(lo[..., 0], lo[..., 1]), lo[..., 2])
+    t_far = np.minimum(np.minimum(hi[..., 0], hi[..., 1]), hi[..., 2])
+    return t_near, t_far
+
+
+def _rows(array, idx):
+    """Selects per-ray rows, passing a single shared (3,) vector through unchanged."""
+    return array if array.ndim == 1 else array[idx]
+
+
+def _intersect_batch(bvh, origins, directions, t_min, t_max):
+    """
+    Closest hit for one batch of rays. Returns (t, sorted triangle index or -1).
+    origins is either (N,3) or a single (3,) origin shared by every ray.
+    Every ray keeps its own traversal stack; each iteration pops one node per
+    active ray, visiting children front-to-back so hits prune the far subtrees.
+    """
+    n_rays = len(directions)
+    # Axis-parallel rays get a huge finite inverse so slab tests never produce NaN.
+    inv_dirs = 1.0 / np.where(np.abs(directions) < 1e-12, np.copysign(1e-12, directions), directions)
+    t_best = np.full(n_rays, t_max, dtype=np.float64)
+    hit = np.full(n_rays, -1, dtype=np.int64)
+    bounds = bvh["bounds"]
+    width, first_leaf, leaf_size, count = bvh["width"], bvh["first_leaf"], bvh["leaf_size"], bvh["count"]
+    offsets = np.arange(leaf_size)
+    slots = np.arange(width)
+
+    stack_depth = bvh["depth"] * (width - 1) + 2
+    stack = np.zeros((n_rays, stack_depth), dtype=np.int64)
+    stack_near = np.zeros((n_rays, stack_depth), dtype=np.float64)
+    sp = np.zeros(n_rays, dtype=np.int64)
+    t_near, t_far = _slab_test(bounds[0], origins, inv_dirs)
+    root_hit = (t_near <= t_far) & (t_far >= t_min) & (t_near <= t_max)
+    stack_near[:, 0] = t_near
+    sp[root_hit] = 1
+    active = np.flatnonzero(root_hit)
+
+    while active.size:
+        sp[active] -= 1
+        top = sp[active]
+        live = stack_near[active, top] < t_best[active]
+        ray, node = active[live], stack[active[live], top[live]]
+        is_leaf = node >= first_leaf
+
+        r = ray[is_leaf]
+        if r.size:
+            tri = (node[is_leaf] - first_leaf)[:, None] * leaf_size + offsets
+            valid = tri < count
+            tri = np.minimum(tri, count - 1)
+            o = origins if origins.ndim == 1 else origins[r, None, :]
+            t = _moller_trumbore(bvh, tri, o, directions[r, None, :], t_min)
+            t[~valid] = np.inf
+            best = t.argmin(axis=1)
+            t_hit = t[np.arange(len(r)), best]
+            better = t_hit < t_best[r]
+            t_best[r[better]] = t_hit[better]
+            hit[r[better]] = tri[better, best[better]]
+
+        r, parent = ray[~is_leaf], node[~is_leaf]
+        if r.size:
+            # Heap layout: the children of p are width*p+1 .. width*p+width.
+            children = (width * parent + 1)[:, None] + slots
+            box = bounds[children]
+            o = origins if origins.ndim == 1 else origins[r, None, :]
+            near, far = _slab_test(box, o, inv_dirs[r, None, :])
+            ok = ((box[:, :, 0, 0] <= box[:, :, 1, 0]) & (near <= far) & (far >= t_min)
+                  & (near < t_best[r, None]))
+            # Push far-to-near so the nearest child is popped next.
+            rows = np.arange(len(r))
+            by_distance = np.argsort(np.where(ok, -near, np.inf), axis=1)
+            for k in range(width):
+                col = by_distance[:, k]
+                c_ok = ok[rows, col]
+                rr = r[c_ok]
+                stack[rr, sp[rr]] = children[rows[c_ok], col[c_ok]]
+                stack_near[rr, sp[rr]] = near[rows[c_ok], col[c_ok]]
+                sp[rr] += 1
+        active = active[sp[active] > 0]
+    return t_best, hit
+
+
+def _moller_trumbore(bvh, tri, origins, directions, t_min):
+    """Two-sided ray/triangle distances for (P,L) triangle indices; misses are inf."""
+    g = bvh["tri_data"][tri]
+    ox, oy, oz = origins[..., 0], origins[..., 1], origins[..., 2]
+    dx, dy, dz = directions[..., 0], directions[..., 1], directions[..., 2]
+    ax, ay, az = g[..., 3], g[..., 4], g[..., 5]
+    bx, by, bz = g[..., 6], g[..., 7], g[..., 8]
+    # Component-wise cross/dot products: faster than np.cross on length-3 axes.
+    px, py, pz = dy * bz - dz * by, dz * bx - dx * bz, dx * by - dy * bx
+    det = ax * px + ay * py + az * pz
+    tx, ty, tz = ox - g[..., 0], oy - g[..., 1], oz - g[..., 2]
+    qx, qy, qz = ty * az - tz * ay, tz * ax - tx * az, tx * ay - ty * ax
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inv_det = 1.0 / det
+        u = (tx * px + ty * py + tz * pz) * inv_det
+        v = (dx * qx + dy * qy + dz * qz) * inv_det
+        t = (bx * qx + by * qy + bz * qz) * inv_det
+        ok = (np.abs(det) > 1e-12) & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > t_min)
+    return np.where(ok, t, np.inf)
+
+
+def intersect(bvh, origins, directions, t_min=0.0, t_max=np.inf, batch_size=65536):
+    """
+    Closest-hit query for many rays. Directions must be normalised.
+    Returns (distance, triangle index) arrays; misses have distance inf and index -1.
+    """
+    origins = np.asarray(origins, dtype=np.float64)
+    directions = np.asarray(directions, dtype=np.float64)
+    n_rays = len(directions)
+    distance = np.full(n_rays, np.inf)
+    triangle = np.full(n_rays, -1, dtype=np.int64)
+    for start in range(0, n_rays, batch_size):
+        stop = min(start + batch_size, n_rays)
+        t, hit = _intersect_batch(bvh, _rows(origins, slice(start, stop)), directions[start:stop], t_min, t_max)
+        found = hit >= 0
+        distance[start:stop][found] = t[found]
+        triangle[start:stop][found] = bvh["order"][hit[found]]
+    return distance, triangle
+
+
+def build_scene(objects, reflectivity=None, leaf_size=4, width=4):
+    """
+    Flattens (name, vertices, faces, matrix_world) objects into one world-space
+    scene with a BVH. reflectivity optionally maps object names to [0, 1] (default 1.0).
+    """
+    reflectivity = reflectivity or {}
+    names, triangles, object_ids = [], [], []
+    for i, (name, vertices, faces, matrix) in enumerate(objects):
+        M = np.asarray(matrix, dtype=np.float64)
+        world = np.asarray(vertices, dtype=np.float64) @ M[:3, :3].T + M[:3, 3]
+        triangles.append(world[np.asarray(faces)])
+        object_ids.append(np.full(len(faces), i, dtype=np.int32))
+        names.append(name)
+    triangles = np.concatenate(triangles)
+    return {
+        "names": names,
+        "triangles": triangles,
+        "object_ids": np.concatenate(object_ids),
+        "reflectivity": np.array([reflectivity.get(n, 1.0) for n in names]),
+        "bvh": build_bvh(triangles, leaf_size=leaf_size, width=width),
+    }
+
+
+def mesh_blas(vertices, faces, leaf_size=4, width=4):
+    """Bottom level of one mesh in its local space: {"triangles", "bvh"}."""
+    triangles = np.asarray(vertices, dtype=np.float64)[np.asarray(faces)]
+    return {"triangles": triangles, "bvh": build_bvh(triangles, leaf_size=leaf_size, width=width)}
+
+
+def build_instanced_scene(objects, reflectivity=None, leaf_size=4, width=4):
+    """
+    Two-level scene over (name, vertices, faces, matrix_world) objects: one BVH per mesh in its
+    local space (objects passing the same vertex/face arrays share it) and a top level of
+    per-instance world bounds. Moving an object (set_instance_matrices) only refits the top level.
+    """
+    reflectivity = reflectivity or {}
+    shared, blas, names, matrices = {}, [], [], []
+    for name, vertices, faces, matrix in objects:
+        key = (id(vertices), id(faces))
+        if key not in shared:
+            shared[key] = mesh_blas(vertices, faces, leaf_size, width)
+        blas.append(shared[key])
+        names.append(name)
+        matrices.append(np.asarray(matrix, dtype=np.float64))
+    scene = {
+        "names": names,
+        "instanced": True,
+        "blas": blas,
+        "reflectivity": np.array([reflectivity.get(n, 1.0) for n in names]),
+        "matrices": np.array(matrices).reshape(-1, 4, 4),
+    }
+    return refit_tlas(scene)
+
+
+def refit_tlas(scene):
+    """Recomputes the instances' inverse matrices and world bounds (the top level) from scene["matrices"]."""
+    M = scene["matrices"]
+    scene["inverse"] = np.linalg.inv(M)
+    root = np.array([b["bvh"]["bounds"][0] for b in scene["blas"]]).reshape(-1, 2, 3)
+    center, half = 0.5 * (root[:, 0] + root[:, 1]), 0.5 * (root[:, 1] - root[:, 0])
+    world_center = np.einsum("kij,kj->ki", M[:, :3, :3], center) + M[:, :3, 3]
+    world_half = np.einsum("kij,kj->ki", np.abs(M[:, :3, :3]), half)
+    scene["tlas"] = np.stack([world_center - world_half, world_center + world_half], axis=1)
+    return scene
+
+
+def set_instance_matrices(scene, matrices):
+    """Moves instances of an instanced scene ({name: 4x4 matrix_world}) and refits the top level."""
+    for name, matrix in matrices.items():
+        scene["matrices"][scene["names"].index(name)] = matrix
+    return refit_tlas(scene)
+
+
+def set_instance_meshes(scene, meshes):
+    """Swaps the mesh of instances of an instanced scene ({name: mesh_blas}, e.g. another mesh_lod level) and refits the top level."""
+    for name, blas in meshes.items():
+        scene["blas"][scene["names"].index(name)] = blas
+    return refit_tlas(scene)
+
+
+def _trace_instanced(scene, origins, directions, t_min, t_max):
+    """Closest hit of one ray batch over the instances, nearest instance bounds first. Returns (t, instance, local triangle)."""
+    n_rays = len(directions)
+    inv_dirs = 1.0 / np.where(np.abs(directions) < 1e-12, np.copysign(1e-12, directions), directions)
+    t_best = np.full(n_rays, t_max, dtype=np.float64)
+    instance = np.full(n_rays, -1, dtype=np.int64)
+    triangle = np.full(n_rays, -1, dtype=np.int64)
+    o = origins if origins.ndim == 1 else origins[:, None, :]
+    near, far = _slab_test(scene["tlas"], o, inv_dirs[:, None, :])
+    overlaps = (near <= far) & (far >= t_min)
+    for k in np.argsort(np.where(overlaps, near, np.inf).min(axis=0)):
+        cand = np.flatnonzero(overlaps[:, k] & (near[:, k] < t_best))
+        if not cand.size:
+            continue
+        # Rays enter the object's local space unnormalised, so the hit distance t is unchanged.
+        Minv = scene["inverse"][k]
+        local_o = _rows(origins, cand) @ Minv[:3, :3].T + Minv[:3, 3]
+        local_d = directions[cand] @ Minv[:3, :3].T
+        bvh = scene["blas"][k]["bvh"]
+        t, hit = _intersect_batch(bvh, local_o, local_d, t_min, t_best[cand])
+        found = (hit >= 0) & (t < t_best[cand])
+        r = cand[found]
+        t_best[r], instance[r], triangle[r] = t[found], k, bvh["order"][hit[found]]
+    return t_best, instance, triangle
+
+
+def trace(scene, origins, directions, t_min=0.0, t_max=np.inf, batch_size=65536):
+    """
+    Closest hits against a build_scene or build_instanced_scene scene.
+    Returns (distance, object id, unit world normal) arrays; misses have distance inf and object -1.
+    """
+    origins = np.asarray(origins, dtype=np.float64)
+    directions = np.asarray(directions, dtype=np.float64)
+    if not scene.get("instanced"):
+        distance, triangle = intersect(scene["bvh"], origins, directions, t_min, t_max, batch_size)
+        object_ids = np.where(triangle >= 0, scene["object_ids"][np.maximum(triangle, 0)], -1)
+        tris = scene["triangles"][np.maximum(triangle, 0)]
+        normals = np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0])
+    else:
+        n_rays = len(directions)
+        distance = np.full(n_rays, np.inf)
+        object_ids = np.full(n_rays, -1, dtype=np.int64)
+        triangle = np.full(n_rays, -1, dtype=np.int64)
+        for start in range(0, n_rays, batch_size):
+            stop = min(start + batch_size, n_rays)
+            t, inst, tri = _trace_instanced(scene, _rows(origins, slice(start, stop)), directions[start:stop], t_min, t_max)
+            found = inst >= 0
+            distance[start:stop][found] = t[found]
+            object_ids[start:stop][found], triangle[start:stop][found] = inst[found], tri[found]
+        # Local normals go to world space with the inverse transpose.
+        normals = np.zeros((n_rays, 3))
+        for k in np.unique(object_ids[object_ids >= 0]):
+            rows = np.flatnonzero(object_ids == k)
+            tris = scene["blas"][k]["triangles"][triangle[rows]]
+            normals[rows] = np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0]) @ scene["inverse"][k][:3, :3]
+    normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+    return distance, object_ids, normals
+
+
+def load_scene(tug_mesh, ac_mesh, tug_matrix=None, ac_matrix=None, walls=True, tug_name="Tug_t5", ac_name="a3320_ceo", instanced=True,
+               mesh_cache_dir=None):
+    """
+    Builds the headless equivalent of the main.py scene: tug, aircraft and (optionally) the boundary walls.
+    instanced=True keeps per-object BVHs (move objects with set_instance_matrices); False flattens to one BVH.
+    The meshes are read through mesh_utils.load_mesh_cached (mesh_cache_dir, default next to each mesh).
+    """
+    objects = [
+        (tug_name, *mesh_utils.load_mesh_cached(tug_mesh, mesh_cache_dir)[:2], np.identity(4) if tug_matrix is None else tug_matrix),
+        (ac_name, *mesh_utils.load_mesh_cached(ac_mesh, mesh_cache_dir)[:2], np.identity(4) if ac_matrix is None else ac_matrix),
+    ]
+    if walls:
+        objects += mesh_utils.boundary_walls()
+    return build_instanced_scene(objects) if instanced else build_scene(objects)
+
+
+def rotating_ray_chunk(start, stop, xStepDegree, fovX, yStepDegree, fovY):
+    """
+    Rays start..stop of a rotating scan in the scanner's local frame (Blender camera:
+    looking down -Z, +Y up), ordered azimuth-major. Azimuth turns about +Y, elevation tilts about +X.
+    Returns (directions (N,3), azimuth index, elevation index).
+    """
+    n_y = int(fovY / yStepDegree)
+    k = np.arange(start, stop)
+    az_idx, el_idx = k // n_y, k % n_y
+    a = np.radians(-fovX / 2.0 + az_idx * xStepDegree)
+    e = np.radians(-fovY / 2.0 + el_idx * yStepDegree)
+    directions = np.stack([-np.cos(e) * np.sin(a), np.sin(e), -np.cos(e) * np.cos(a)], axis=1)
+    return directions, az_idx, el_idx
+
+
+def rotating_ray_directions(xStepDegree, fovX, yStepDegree, fovY):
+    """The whole ray pattern of a rotating scan (see rotating_ray_chunk)."""
+    n_rays = int(fovX / xStepDegree) * int(fovY / yStepDegree)
+    return rotating_ray_chunk(0, n_rays, xStepDegree, fovX, yStepDegree, fovY)
+
+
+def rays_per_chunk(scene, memory_budget_mb):
+    """
+    Rays traced at once so that one chunk's working set (per-ray traversal stacks, slab
+    distances, hits and the chunk's output columns) stays within memory_budget_mb.
+    """
+    bvhs = [b["bvh"] for b in scene["blas"]] if scene.get("instanced") else [scene["bvh"]]
+    stack = max(bvh["depth"] * (bvh["width"] - 1) + 2 for bvh in bvhs)
+    per_ray = 16 * stack + RAY_BYTES + (24 * len(scene["names"]) if scene.get("instanced") else 0)
+    return max(1024, int(memory_budget_mb * 2 ** 20) // per_ray)
+
+
+def _scan_chunk(scene, M, local, az_idx, el_idx, reflectivityLower, distanceLower, reflectivityUpper, distanceUpper, batch_size):
+    R = M[:3, :3] / np.linalg.norm(M[:3, :3], axis=0)
+    directions = local @ R.T
+    origin = M[:3, 3]
+
+    distance, object_ids, normals = trace(scene, origin, directions, t_min=distanceLower, t_max=distanceUpper, batch_size=batch_size)
+    found = object_ids >= 0
+    distance, object_ids, normals, directions = distance[found], object_ids[found], normals[found], directions[found]
+    az_idx, el_idx = az_idx[found], el_idx[found]
+
+    # Same distance-dependent reflectivity threshold as range_scanner.
+    span = max(distanceUpper - distanceLower, 1e-12)
+    required = reflectivityLower + (reflectivityUpper - reflectivityLower) * (distance - distanceLower) / span
+    reflectivity = scene["reflectivity"][object_ids]
+    keep = reflectivity >= required
+    distance, object_ids, normals, directions = distance[keep], object_ids[keep], normals[keep], directions[keep]
+    az_idx, el_idx = az_idx[keep], el_idx[keep]
+
+    cos_incidence = np.abs(np.einsum("ij,ij->i", normals, directions))
+    points = origin + directions * distance[:, None]
+
+    return {
+        "categoryID": object_ids,
+        "partID": object_ids,
+        "X": points[:, 0],
+        "Y": points[:, 1],
+        "Z": points[:, 2],
+        "distance": distance,
+        "intensity": scene["reflectivity"][object_ids] * cos_incidence,
+        "azimuthIndex": az_idx,
+        "elevationIndex": el_idx,
+        "names": scene["names"],
+    }
+
+
+def scan_rotating_chunks(scene, scanner_matrix,
+                         xStepDegree=_DEFAULTS["xStepDegree"], fovX=_DEFAULTS["fovX"],
+                         yStepDegree=_DEFAULTS["yStepDegree"], fovY=_DEFAULTS["fovY"],
+                         reflectivityLower=_DEFAULTS["reflectivityLower"], distanceLower=_DEFAULTS["distanceLower"],
+                         reflectivityUpper=_DEFAULTS["reflectivityUpper"], distanceUpper=_DEFAULTS["distanceUpper"],
+                         maxReflectionDepth=_DEFAULTS["maxReflectionDepth"], batch_size=65536, memory_budget_mb=None, rays=None):
+    """
+    scan_rotating as a generator of partial scans. With memory_budget_mb, ray directions are
+    generated and traced rays_per_chunk rays at a time; without, the whole pattern is one chunk.
+    rays: a precomputed (directions, azimuth index, elevation index) table in the scanner frame
+    (sensor_models.ray_table) traced instead of the uniform xStepDegree/yStepDegree pattern.
+    """
+    M = np.asarray(scanner_matrix, dtype=np.float64)
+    n_rays = len(rays[0]) if rays is not None else int(fovX / xStepDegree) * int(fovY / yStepDegree)
+    chunk = n_rays if memory_budget_mb is None else rays_per_chunk(scene, memory_budget_mb)
+    batch = batch_size if memory_budget_mb is None else chunk
+    for start in range(0, n_rays, max(chunk, 1)):
+        stop = min(start + chunk, n_rays)
+        if rays is None:
+            local, az_idx, el_idx = rotating_ray_chunk(start, stop, xStepDegree, fovX, yStepDegree, fovY)
+        else:
+            local, az_idx, el_idx = (column[start:stop] for column in rays)
+        yield _scan_chunk(scene, M, local, az_idx, el_idx, reflectivityLower, distanceLower, reflectivityUpper, distanceUpper, batch)
+
+
+def concat_scans(scans):
+    """Joins partial scans of one scan (e.g. scan_rotating_chunks) into one scan dict."""
+    if len(scans) == 1:
+        return scans[0]
+    joined = {k: np.concatenate([s[k] for s in scans]) for k in scans[0] if k != "names"}
+    joined["names"] = scans[0]["names"]
+    return joined
+
+
+def scan_rotating(scene, scanner_matrix,
+                  xStepDegree=_DEFAULTS["xStepDegree"], fovX=_DEFAULTS["fovX"],
+                  yStepDegree=_DEFAULTS["yStepDegree"], fovY=_DEFAULTS["fovY"],
+                  reflectivityLower=_DEFAULTS["reflectivityLower"], distanceLower=_DEFAULTS["distanceLower"],
+                  reflectivityUpper=_DEFAULTS["reflectivityUpper"], distanceUpper=_DEFAULTS["distanceUpper"],
+                  maxReflectionDepth=_DEFAULTS["maxReflectionDepth"], batch_size=65536, memory_budget_mb=None, rays=None):
+    """
+    Headless counterpart of range_scanner.ui.user_interface.scan_rotating.
+    Takes the same pattern and range parameters and returns a dict with the CSV columns
+    plus the azimuth/elevation index of every returned ray.
+    Only primary returns are traced: the headless scene has no mirror/glass
+    materials, so maxReflectionDepth has nothing to follow.
+    memory_budget_mb bounds the ray working set (only the hits are kept in full).
+    rays replaces the uniform pattern with a sensor model's ray table (see scan_rotating_chunks).
+    """
+    return concat_scans(list(scan_rotating_chunks(
+        scene, scanner_matrix, xStepDegree, fovX, yStepDegree, fovY, reflectivityLower, distanceLower,
+        reflectivityUpper, distanceUpper, maxReflectionDepth, batch_size, memory_budget_mb, rays)))
+
+
+def stream_scan(scene, scanner_matrix, sink, memory_budget_mb=256, measure_memory=True, **scan_params):
+    """
+    Scans chunk by chunk within memory_budget_mb and hands every partial scan to sink(chunk)
+    (e.g. scan_io.ScanStreamWriter.append or a fusion_utils.VoxelFusion), keeping no points itself.
+    Returns stats: rays, points, chunks, rays_per_chunk and peak_mb, the peak traced allocation
+    during the scan, sink included (measured with tracemalloc, which costs ~10% of the scan time;
+    None with measure_memory=False).
+    """
+    if scan_params.get("rays") is not None:
+        n_rays = len(scan_params["rays"][0])
+    else:
+        n_rays = int(scan_params.get("fovX", 360.0) / scan_params.get("xStepDegree", 0.4)) * \
+            int(scan_params.get("fovY", 270.0) / scan_params.get("yStepDegree", 0.33))
+    stats = {"rays": n_rays, "points": 0, "chunks": 0, "rays_per_chunk": rays_per_chunk(scene, memory_budget_mb), "peak_mb": None}
+    with instrumentation.peak_memory() if measure_memory else contextlib.nullcontext() as memory:
+        for chunk in scan_rotating_chunks(scene, scanner_matrix, memory_budget_mb=memory_budget_mb, **scan_params):
+            sink(chunk)
+            stats["points"] += len(chunk["X"])
+            stats["chunks"] += 1
+    if memory is not None:
+        stats["peak_mb"] = memory.peak_bytes / 2 ** 20
+    return stats
+
+
+def scan_frames(scene, frames, **scan_params):
+    """
+    Scans of several frames (tug yaws, animation frames) of one instanced scene. Every frame is
+    a dict with the scanner's 4x4 "scanner" matrix and optional "instances" ({name: matrix_world});
+    between frames only the top level is refitted. Returns one scan dict per frame.
+    """
+    scans = []
+    for frame in frames:
+        if frame.get("instances"):
+            set_instance_matrices(scene, frame["instances"])
+        scans.append(scan_rotating(scene, frame["scanner"], **scan_params))
+    return scans
+
+
+def _csv_table(scan):
+    names = np.asarray(scan["names"], dtype=object)
+    rows = np.empty((len(scan["X"]), len(CSV_COLUMNS)), dtype=object)
+    rows[:, 0] = names[scan["categoryID"]]
+    rows[:, 1] = names[scan["partID"]]
+    for i, col in enumerate(CSV_COLUMNS[2:], start=2):
+        rows[:, i] = scan[col]
+    return rows
+
+
+def write_csv(scan, output_dir, output_filename):
+    """Writes a scan dict as a semicolon-separated CSV (range_scanner column layout). Returns the file path."""
+    path = os.path.join(output_dir, f"{output_filename}.csv")
+    np.savetxt(path, _csv_table(scan), fmt=CSV_FORMAT, header=";".join(CSV_COLUMNS), comments="")
+    return path
+
+
+def encode_csv(scan, header=True):
+    """The bytes write_csv would write (without the header line for header=False)."""
+    buffer = io.BytesIO()
+    np.savetxt(buffer, _csv_table(scan), fmt=CSV_FORMAT, header=";".join(CSV_COLUMNS) if header else "", comments="")
+    return buffer.getvalue()
+
+
+def read_csv(path):
+    """Reads a semicolon-separated scan CSV (headless or range_scanner export, optionally .csv.gz) back into a scan dict."""
+    with (gzip.open(path, "rt") if path.endswith(".gz") else open(path)) as f:
+        header = f.readline().strip().split(";")
+    missing = [c for c in CSV_COLUMNS if c not in header]
+    if missing:
+        raise ValueError(f"{path}: missing columns {missing}.")
+    cols = [header.index(c) for c in CSV_COLUMNS]
+    rows = np.loadtxt(path, delimiter=";", skiprows=1, usecols=cols, dtype=str, ndmin=2)
+    names, ids = np.unique(rows[:, 0:2], return_inverse=True)
+    ids = ids.reshape(-1, 2)
+    scan = {c: rows[:, i + 2].astype(np.float64) for i, c in enumerate(CSV_COLUMNS[2:])}
+    scan["categoryID"], scan["partID"] = ids[:, 0], ids[:, 1]
+    scan["names"] = [str(n) for n in names]
+    return scan
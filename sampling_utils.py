@@ -0,0 +1,260 @@
+#
+# FILE: sampling_utils.py
+#
+# Candidate lidar positions on arbitrary triangulated mounting surfaces:
+# regular grids, area-weighted random samples and Poisson-disk samples, with
+# up-facing, edge-margin and normal-offset filters. Everything is NumPy, so the
+# same code runs on Blender plates (blender_utils.get_sampled_points) and on
+# meshes loaded with mesh_utils.
+#
+import numpy as np
+
+
+def transform_points(points, matrix):
+    """Applies a 4x4 matrix to (N,3) points."""
+    M = np.asarray(matrix, dtype=np.float64)
+    return np.asarray(points, dtype=np.float64) @ M[:3, :3].T + M[:3, 3]
+
+
+def triangle_normals(vertices, faces):
+    """(unit normals (F,3), areas (F,)) of every triangle."""
+    tris = np.asarray(vertices, dtype=np.float64)[faces]
+    n = np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0])
+    length = np.linalg.norm(n, axis=1)
+    return n / np.where(length > 0, length, 1.0)[:, None], 0.5 * length
+
+
+def up_facing(vertices, faces, up=(0, 0, 1), min_dot=0.9):
+    """Mask of the faces whose normal is within acos(min_dot) of up."""
+    normals, areas = triangle_normals(vertices, faces)
+    up = np.asarray(up, dtype=np.float64)
+    return (normals @ (up / np.linalg.norm(up)) >= min_dot) & (areas > 0)
+
+
+def boundary_edges(faces):
+    """(E,2) vertex pairs of the edges used by exactly one face."""
+    edges = np.sort(np.asarray(faces)[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+    unique, counts = np.unique(edges, axis=0, return_counts=True)
+    return unique[counts == 1]
+
+
+def distance_to_edges(points, vertices, edges, chunk=4096):
+    """Distance of every point to the nearest of the given edges (segments)."""
+    points = np.asarray(points, dtype=np.float64)
+    a = np.asarray(vertices, dtype=np.float64)[edges[:, 0]]
+    ab = np.asarray(vertices, dtype=np.float64)[edges[:, 1]] - a
+    ab_len2 = np.maximum(np.einsum("ij,ij->i", ab, ab), 1e-24)
+    out = np.full(len(points), np.inf)
+    for start in range(0, len(points), chunk):
+        p = points[start:start + chunk, None, :]
+        t = np.clip(np.einsum("pej,ej->pe", p - a, ab) / ab_len2, 0.0, 1.0)
+        d = p - (a + t[:, :, None] * ab)
+        out[start:start + chunk] = np.sqrt(np.einsum("pej,pej->pe", d, d).min(axis=1))
+    return out
+
+
+def _plane_axes(up):
+    up = np.asarray(up, dtype=np.float64)
+    up = up / np.linalg.norm(up)
+    ref = np.array([1.0, 0.0, 0.0]) if abs(up[0]) < 0.9 else np.array([0.0, 1.0, 0.0])
+    e1 = ref - (ref @ up) * up
+    e1 /= np.linalg.norm(e1)
+    return e1, np.cross(up, e1), up
+
+
+def _ragged_arange(counts):
+    """Concatenation of arange(c) for every c in counts."""
+    counts = np.asarray(counts, dtype=np.int64)
+    ends = np.cumsum(counts)
+    return np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - counts, counts)
+
+
+def sample_grid(vertices, faces, spacing, up=(0, 0, 1)):
+    """
+    Regular grid (spacing in meters) projected along up onto the mesh; where several faces
+    cover a grid node, the highest one (along up) is kept. Returns (points, face ids).
+    """
+    vertices = np.asarray(vertices, dtype=np.float64)
+    faces = np.asarray(faces)
+    e1, e2, up = _plane_axes(up)
+    uv = np.stack([vertices @ e1, vertices @ e2], axis=1)
+    height = vertices @ up
+
+    tri_uv = uv[faces]
+    origin = tri_uv.reshape(-1, 2).min(axis=0)
+    extent = tri_uv.reshape(-1, 2).max(axis=0) - origin
+    origin = origin + 0.5 * (extent - np.floor(extent / spacing) * spacing)  # center the grid
+    lo = np.ceil((tri_uv.min(axis=1) - origin) / spacing - 1e-9).astype(np.int64)
+    hi = np.floor((tri_uv.max(axis=1) - origin) / spacing + 1e-9).astype(np.int64)
+    n = np.maximum(hi - lo + 1, 0)
+    counts = n[:, 0] * n[:, 1]
+
+    tri = np.repeat(np.arange(len(faces)), counts)
+    k = _ragged_arange(counts)
+    ij = lo[tri] + np.stack([k % n[tri, 0], k // n[tri, 0]], axis=1)
+    p = origin + ij * spacing
+
+    # 2D barycentric coordinates of every node in its candidate triangle
+    a, b, c = tri_uv[tri, 0], tri_uv[tri, 1], tri_uv[tri, 2]
+    v0, v1, v2 = b - a, c - a, p - a
+    den = v0[:, 0] * v1[:, 1] - v1[:, 0] * v0[:, 1]
+    ok = np.abs(den) > 1e-12
+    den = np.where(ok, den, 1.0)
+    w1 = (v2[:, 0] * v1[:, 1] - v1[:, 0] * v2[:, 1]) / den
+    w2 = (v0[:, 0] * v2[:, 1] - v2[:, 0] * v0[:, 1]) / den
+    inside = ok & (w1 >= -1e-9) & (w2 >= -1e-9) & (w1 + w2 <= 1 + 1e-9)
+    tri, ij, p, w1, w2 = tri[inside], ij[inside], p[inside], w1[inside], w2[inside]
+    h = height[faces[tri, 0]] * (1 - w1 - w2) + height[faces[tri, 1]] * w1 + height[faces[tri, 2]] * w2
+
+    # one point per grid node: the highest face
+    key = ij[:, 0] * (int(ij[:, 1].max(initial=0)) + 1) + ij[:, 1]
+    order = np.lexsort((h, key))
+    last = np.r_[key[order][1:] != key[order][:-1], True]
+    keep = order[last]
+    points = p[keep, 0:1] * e1 + p[keep, 1:2] * e2 + h[keep, None] * up
+    return points, tri[keep]
+
+
+def sample_random(vertices, faces, count, seed=0):
+    """count area-weighted uniform samples on the mesh. Returns (points, face ids)."""
+    rng = np.random.default_rng(seed)
+    tris = np.asarray(vertices, dtype=np.float64)[faces]
+    _, areas = triangle_normals(vertices, faces)
+    cdf = np.cumsum(areas)
+    face_ids = np.minimum(np.searchsorted(cdf, rng.random(count) * cdf[-1], side="right"), len(faces) - 1)
+    r1 = np.sqrt(rng.random(count))
+    r2 = rng.random(count)
+    w = np.stack([1 - r1, r1 * (1 - r2), r1 * r2], axis=1)
+    return np.einsum("nk,nkd->nd", w, tris[face_ids]), face_ids
+
+
+def neighbor_pairs(points, radius):
+    """
+    All (i, j), i != j, with |p_i - p_j| < radius (both orders), found by hashing points into
+    radius-sized cells and comparing each cell with itself and 13 of its neighbours.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    cells = np.floor((points - points.min(axis=0)) / radius).astype(np.int64) + 1
+    dims = cells.max(axis=0) + 2
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    order = np.argsort(keys, kind="stable")
+    sorted_points = points[order]
+    cell_keys, cell_start, point_cell, cell_count = np.unique(
+        keys[order], return_index=True, return_inverse=True, return_counts=True)
+
+    offsets = [(dx * dims[1] + dy) * dims[2] + dz for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)]
+    pairs_i, pairs_j = [], []
+    for offset in offsets[13:]:  # self + half of the neighbours, the other half is symmetric
+        target = cell_keys + offset
+        pos = np.minimum(np.searchsorted(cell_keys, target), len(cell_keys) - 1)
+        found = cell_keys[pos] == target
+        counts = np.where(found, cell_count[pos], 0)[point_cell]
+        i = np.repeat(np.arange(len(points)), counts)
+        j = np.repeat(cell_start[pos][point_cell], counts) + _ragged_arange(counts)
+        d = sorted_points[i] - sorted_points[j]
+        close = np.einsum("ij,ij->i", d, d) < radius * radius
+        if offset == 0:
+            close &= i < j
+        pairs_i.append(i[close])
+        pairs_j.append(j[close])
+    i, j = np.concatenate(pairs_i), np.concatenate(pairs_j)
+    return order[np.r_[i, j]], order[np.r_[j, i]]
+
+
+def poisson_disk(points, min_spacing, seed=0):
+    """
+    Indices of a maximal subset of points with no two closer than min_spacing (Poisson-disk
+    sample elimination). Resolved in parallel rounds: an undecided point is kept when it has the
+    highest random priority among its undecided neighbours, and its neighbours are dropped.
+    """
+    n = len(points)
+    priority = np.random.default_rng(seed).permutation(n)
+    a, b = neighbor_pairs(points, min_spacing)
+    state = np.zeros(n, dtype=np.int8)  # 0 undecided, 1 kept, -1 dropped
+    while True:
+        undecided = state == 0
+        if not undecided.any():
+            break
+        live = undecided[a] & undecided[b]
+        best = np.full(n, -1, dtype=np.int64)
+        np.maximum.at(best, a[live], priority[b[live]])
+        keep = undecided & (priority > best)
+        state[keep] = 1
+        drop = np.zeros(n, dtype=bool)
+        drop[b[keep[a]]] = True
+        state[drop & (state == 0)] = -1
+    return np.flatnonzero(state == 1)
+
+
+def sample_poisson(vertices, faces, min_spacing, oversample=6.0, seed=0):
+    """Poisson-disk samples with min_spacing (m), eliminated from area-weighted random candidates."""
+    _, areas = triangle_normals(vertices, faces)
+    count = int(oversample * areas.sum() / (min_spacing * min_spacing)) + 1
+    points, face_ids = sample_random(vertices, faces, count, seed)
+    keep = poisson_disk(points, min_spacing, seed)
+    return points[keep], face_ids[keep]
+
+
+def sample_candidates(vertices, faces, matrix=None, method="grid", spacing=0.1, count=1000,
+                      margin=0.10, normal_offset=0.03, up=(0, 0, 1), min_up_dot=0.9, seed=0):
+    """
+    World-space lidar candidates on a mounting mesh.
+      method: "grid" (regular, spacing apart), "random" (count area-weighted samples) or
+              "poisson" (no two closer than spacing).
+      margin: minimum distance (m) to the open edges of the sampled surface.
+      normal_offset: distance (m) the points are lifted along their face normal.
+      min_up_dot: only faces with normal . up >= min_up_dot are sampled (None for all faces).
+    Returns a dict with points (N,3), normals (N,3) and face_ids (N,).
+    """
+    vertices = np.asarray(vertices, dtype=np.float64)
+    if matrix is not None:
+        vertices = transform_points(vertices, matrix)
+    faces = np.asarray(faces)
+    face_index = np.arange(len(faces))
+    if min_up_dot is not None:
+        face_index = np.flatnonzero(up_facing(vertices, faces, up, min_up_dot))
+        faces = faces[face_index]
+    if len(faces) == 0:
+        return {"points": np.zeros((0, 3)), "normals": np.zeros((0, 3)), "face_ids": np.zeros(0, dtype=np.int64)}
+
+    if method == "grid":
+        points, face_ids = sample_grid(vertices, faces, spacing, up)
+    elif method == "random":
+        points, face_ids = sample_random(vertices, faces, count, seed)
+    elif method == "poisson":
+        points, face_ids = sample_poisson(vertices, faces, spacing, seed=seed)
+    else:
+        raise ValueError(f"Unknown sampling method '{method}'.")
+
+    if margin:
+        edges = boundary_edges(faces)
+        if len(edges):
+            inside = distance_to_edges(points, vertices, edges) >= margin
+            points, face_ids = points[inside], face_ids[inside]
+
+    normals, _ = triangle_normals(vertices, faces)
+    normals = normals[face_ids]
+    return {"points": points + normal_offset * normals, "normals": normals, "face_ids": face_index[face_ids]}
+
+
+def quad_grid(corners, nx=1, ny=2, margin=0.10, height_offset=0.03):
+    """
+    nx x ny lattice inside a quad (4 world corners in any order), as blender_utils.get_grid_points lays
+    it out on a plate's top face: the corners are sorted counter-clockwise about their centre (seen from +Z),
+    u/v run from margin to 1 - margin (the middle for a single point) and the points are lifted by
+    height_offset along the quad normal. Returns (points (nx*ny,3), [(i, j)] lattice indices), v-major.
+    """
+    corners = np.asarray(corners, dtype=np.float64).reshape(4, 3)
+    d = corners - corners.mean(axis=0)
+    p0, p1, p2, p3 = corners[np.argsort(np.arctan2(d[:, 1], d[:, 0]), kind="stable")]
+    normal = np.cross(p1 - p0, p3 - p0)
+    if np.linalg.norm(normal) == 0:
+        raise RuntimeError("Degenerate plate: cannot compute normal.")
+    normal /= np.linalg.norm(normal)
+    us = np.linspace(margin, 1.0 - margin, nx) if nx > 1 else np.array([0.5])
+    vs = np.linspace(margin, 1.0 - margin, ny) if ny > 1 else np.array([0.5])
+    v, u = np.meshgrid(vs, us, indexing="ij")
+    u, v = u.reshape(-1, 1), v.reshape(-1, 1)
+    a, b = p0 + u * (p1 - p0), p3 + u * (p2 - p3)
+    points = a + v * (b - a) + height_offset * normal
+    return points, [(i, j) for j in range(len(vs)) for i in range(len(us))]
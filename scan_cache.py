@@ -0,0 +1,164 @@
+#
+# FILE: scan_cache.py
+#
+# Content-addressed on-disk cache of scan results. The key is a hash of the
+# scene geometry (mesh content + object transforms), the exact lidar pose and
+# the full scan parameter set, so a scan is only redone when one of them changes.
+#
+import os
+import json
+import hashlib
+import numpy as np
+
+import file_utils
+
+file_hash = file_utils.file_hash
+
+
+def _matrix_bytes(matrix):
+    """Matrix bytes rounded to 1e-9 so float noise from recomputed poses does not change keys."""
+    return np.round(np.asarray(matrix, dtype=np.float64), 9).tobytes()
+
+
+def scene_fingerprint(objects):
+    """
+    Hash of a scene given as (name, source, matrix_world) tuples, where source is
+    a mesh file path or a (vertices, faces) pair.
+    """
+    h = hashlib.sha256()
+    for name, source, matrix in sorted(objects, key=lambda o: o[0]):
+        h.update(name.encode())
+        if isinstance(source, (str, os.PathLike)):
+            h.update(file_hash(source).encode())
+        else:
+            for array in source:
+                array = np.ascontiguousarray(array)
+                h.update(str(array.dtype).encode() + str(array.shape).encode())
+                h.update(array.tobytes())
+        h.update(_matrix_bytes(matrix))
+    return h.hexdigest()
+
+
+def scan_key(scene_fp, scanner_matrix, scan_params):
+    """Cache key of one scan."""
+    h = hashlib.sha256(scene_fp.encode())
+    h.update(_matrix_bytes(scanner_matrix))
+    h.update(json.dumps(scan_params, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+class ScanCache:
+    """
+    Size-bounded LRU cache of scan dicts (raycast_utils.scan_rotating layout) stored as .npz files.
+    Recency is the file mtime, refreshed on every hit.
+    Several processes may share a cache directory (the scheduler's workers do): an entry another
+    process evicts in the meantime is a miss, never an error. Each instance keeps a running size
+    total and only walks the directory to evict when that total crosses max_bytes, so with several
+    writers the cache can overshoot by what the others added since the last eviction.
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._total = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.npz")
+
+    def get(self, key):
+        """Returns the cached scan for key, or None."""
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                scan = {name: data[name] for name in data.files}
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass  # evicted by another process after it was read; the scan itself is complete
+        scan["names"] = [str(n) for n in scan["names"]]
+        return scan
+
+    def put(self, key, scan):
+        """Stores a scan atomically and evicts least recently used entries once the cache exceeds max_bytes."""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self._total is None:
+            self._total = self.size()
+        arrays = {k: np.asarray(v) for k, v in scan.items() if k != "names"}
+        arrays["names"] = np.asarray(scan["names"], dtype=str)
+        tmp_path = f"{path}.{file_utils.temp_tag()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        added = os.path.getsize(tmp_path)
+        try:
+            added -= os.path.getsize(path)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, path)
+        self._total += added
+        if self._total > self.max_bytes:
+            self.evict()
+
+    def get_or_scan(self, key, scan_fn):
+        """Cached scan for key, running scan_fn() and storing its result on a miss."""
+        scan = self.get(key)
+        if scan is None:
+            scan = scan_fn()
+            self.put(key, scan)
+        return scan
+
+    def entries(self):
+        """(mtime, size, path) of every cached scan, oldest first."""
+        found = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".npz"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue  # removed by another process during the walk
+                    found.append((st.st_mtime, st.st_size, path))
+        return sorted(found)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, max_bytes=None):
+        """Deletes least recently used scans until the cache fits in max_bytes."""
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= limit:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # already evicted by another process
+            total -= size
+        self._total = total
+
+    def invalidate(self, key):
+        """Drops one cached scan. Returns True if it existed."""
+        path = self.path(key)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        if self._total is not None:
+            self._total -= size
+        return True
+
+    def clear(self):
+        """Drops every cached scan."""
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._total = 0
@@ -0,0 +1,275 @@
+#
+# FILE: scan_catalog.py
+#
+# SQLite catalog of scan runs. Every scan is recorded when it runs: its tags
+# (yaw, surface, grid index), scanner pose, sensor model and parameters,
+# point count, timing, output file, and summary statistics of the point
+# data (bounding box, hit count per scene object). Sweeps of tens of
+# thousands of scans are then filtered and ranked with indexed queries
+# instead of globbing Outputs/ and re-reading every file.
+#
+#   with scan_catalog.ScanCatalog("Outputs/scan_catalog.sqlite") as catalog:
+#       catalog.best_per_surface(target="a3320_ceo", yaw_deg=45)
+#       catalog.find(surface="Cube", min_hits=10000, target="a3320_ceo", order_by="seconds", limit=20)
+#
+import os
+import re
+import glob
+import json
+import time
+import sqlite3
+import numpy as np
+
+import raycast_utils
+import scan_io
+import instrumentation
+
+log = instrumentation.get_logger(__name__)
+
+CATALOG_NAME = "scan_catalog.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    output_name TEXT,
+    path TEXT,
+    yaw_deg REAL,
+    surface TEXT,
+    grid_index INTEGER,
+    x REAL, y REAL, z REAL,
+    sensor_model TEXT,
+    backend TEXT,
+    points INTEGER,
+    seconds REAL,
+    peak_mb REAL,
+    min_x REAL, min_y REAL, min_z REAL,
+    max_x REAL, max_y REAL, max_z REAL,
+    recorded REAL,
+    metadata TEXT
+);
+CREATE TABLE IF NOT EXISTS hits (
+    scan_id INTEGER NOT NULL REFERENCES scans(id) ON DELETE CASCADE,
+    object TEXT NOT NULL,
+    hits INTEGER NOT NULL,
+    PRIMARY KEY (scan_id, object)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS scans_yaw_surface ON scans (yaw_deg, surface, grid_index);
+CREATE INDEX IF NOT EXISTS scans_surface ON scans (surface, grid_index);
+CREATE INDEX IF NOT EXISTS scans_sensor ON scans (sensor_model);
+CREATE INDEX IF NOT EXISTS hits_object ON hits (object, hits);
+"""
+
+# find() filters: name -> (SQL expression, operator)
+_FILTERS = {
+    "yaw_deg": ("s.yaw_deg", "="),
+    "surface": ("s.surface", "="),
+    "grid_index": ("s.grid_index", "="),
+    "sensor_model": ("s.sensor_model", "="),
+    "backend": ("s.backend", "="),
+    "output_name": ("s.output_name", "="),
+    "min_points": ("s.points", ">="),
+    "max_seconds": ("s.seconds", "<="),
+    "min_hits": ("h.hits", ">="),
+}
+_ORDER = {"points", "seconds", "peak_mb", "yaw_deg", "surface", "grid_index", "recorded", "hits", "id"}
+_OUTPUT_NAME = re.compile(r"yaw_(-?\d+(?:p\d+)?)_(.+)_scan_(\d+)$")
+
+
+class ScanSummary:
+    """
+    Summary statistics of a scan built up chunk by chunk (streamed scans never exist in one piece):
+    point count, bounding box and the number of hits on every scene object.
+    """
+
+    def __init__(self):
+        self.points = 0
+        self.lo = np.full(3, np.inf)
+        self.hi = np.full(3, -np.inf)
+        self.hits = {}
+
+    def add(self, scan):
+        """Adds a scan dict (raycast_utils layout) or one chunk of it. Returns self."""
+        n = len(scan["X"])
+        if not n:
+            return self
+        xyz = np.stack([scan["X"], scan["Y"], scan["Z"]], axis=1)
+        self.lo = np.minimum(self.lo, xyz.min(axis=0))
+        self.hi = np.maximum(self.hi, xyz.max(axis=0))
+        self.points += n
+        counts = np.bincount(np.asarray(scan["categoryID"], dtype=np.int64))
+        names = list(scan.get("names", []))
+        for k in np.flatnonzero(counts):
+            name = names[k] if k < len(names) else str(k)
+            self.hits[name] = self.hits.get(name, 0) + int(counts[k])
+        return self
+
+    def result(self):
+        """JSON-friendly dict: points, lo/hi (None for an empty scan) and hits {object name: count}."""
+        empty = self.points == 0
+        return {"points": self.points, "lo": None if empty else self.lo.tolist(), "hi": None if empty else self.hi.tolist(),
+                "hits": dict(self.hits)}
+
+
+def scan_summary(scan):
+    """ScanSummary of a whole scan dict, as a dict."""
+    return ScanSummary().add(scan).result()
+
+
+def _output_name(path):
+    """yaw_045_Cube.001_scan_001 from .../yaw_045_Cube.001_scan_001.lscan(.gz)."""
+    name = os.path.basename(path)
+    return os.path.splitext(name[:-len(".gz")] if name.endswith(".gz") else name)[0]
+
+
+def _location(metadata):
+    """scan_io.scanner_location, NULL columns when the metadata has none."""
+    return scan_io.scanner_location(metadata) or [None, None, None]
+
+
+class ScanCatalog:
+    """
+    One SQLite file of scan records (tables scans and hits). Safe to share between processes:
+    writers wait for each other (WAL journal, busy timeout). Every record() is its own transaction,
+    so a killed sweep keeps everything recorded before it died.
+    """
+
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=timeout)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        self.connection.executescript(_SCHEMA)
+
+    def record(self, metadata, summary, path=None, seconds=None, peak_mb=None, backend=None, key=None, output_name=None):
+        """
+        Records one scan and returns its row id. metadata is the scan's header metadata
+        (scan_scheduler.job_metadata or lidar_utils.scan_metadata), summary a scan_summary dict.
+        key identifies the scan slot (default: the output path, else the job_id): recording the same key again
+        replaces the earlier row, like the rerun scan replaces its file.
+        """
+        output_name = output_name or (_output_name(path) if path else None)
+        key = key or path or metadata.get("job_id") or output_name
+        if key is None:
+            raise ValueError("A scan record needs a key, a job_id, a path or an output name.")
+        lo, hi = summary.get("lo") or [None] * 3, summary.get("hi") or [None] * 3
+        row = (key, output_name, path, metadata.get("yaw_deg"), metadata.get("surface"), metadata.get("index"), *_location(metadata),
+               metadata.get("sensor_model"), backend, int(summary["points"]), seconds, peak_mb, *lo, *hi, time.time(),
+               json.dumps(metadata))
+        with self.connection:
+            self.connection.execute("DELETE FROM scans WHERE key = ?", (key,))
+            scan_id = self.connection.execute(
+                "INSERT INTO scans (key, output_name, path, yaw_deg, surface, grid_index, x, y, z, sensor_model, backend, points, "
+                "seconds, peak_mb, min_x, min_y, min_z, max_x, max_y, max_z, recorded, metadata) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row).lastrowid
+            self.connection.executemany("INSERT INTO hits (scan_id, object, hits) VALUES (?, ?, ?)",
+                                        [(scan_id, name, int(n)) for name, n in summary.get("hits", {}).items()])
+        return scan_id
+
+    def record_scan(self, scan, metadata, **kwargs):
+        """record() with the summary computed from a scan dict."""
+        return self.record(metadata, scan_summary(scan), **kwargs)
+
+    def find(self, target=None, order_by="id", descending=False, limit=None, **filters):
+        """
+        Scan rows (dicts) matching the filters, e.g. find(yaw_deg=45, surface=["Cube", "Cube.001"]).
+        Filters: yaw_deg, surface, grid_index, sensor_model, backend, output_name (a value or a list
+        of values), min_points, max_seconds, and min_hits, which needs target. With a target object
+        name every row carries its "hits" on it (0 when it missed it) and can be ordered by them.
+        """
+        unknown = set(filters) - set(_FILTERS)
+        if unknown:
+            raise ValueError(f"Unknown catalog filter(s) {sorted(unknown)}, known: {sorted(_FILTERS)}")
+        if order_by not in _ORDER:
+            raise ValueError(f"Cannot order by '{order_by}', choose one of {sorted(_ORDER)}")
+        if target is None and ("min_hits" in filters or order_by == "hits"):
+            raise ValueError("min_hits and order_by='hits' need a target object.")
+        sql = "SELECT s.*" + (", COALESCE(h.hits, 0) AS hits FROM scans s LEFT JOIN hits h ON h.scan_id = s.id AND h.object = ?"
+                              if target is not None else " FROM scans s")
+        where, params = self._where(filters)
+        params = ([target] if target is not None else []) + params
+        order = "hits" if order_by == "hits" else f"s.{order_by}"
+        sql += where + f" ORDER BY {order} {'DESC' if descending else 'ASC'}, s.id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return [dict(row) for row in self.connection.execute(sql, params)]
+
+    def best_per_surface(self, target="a3320_ceo", n=1, **filters):
+        """
+        The n scans with the most hits on target for every surface (and yaw when several match),
+        e.g. best_per_surface(yaw_deg=45): {(yaw_deg, surface): [rows, best first]}.
+        """
+        where, params = self._where(filters)
+        sql = ("SELECT * FROM (SELECT s.*, COALESCE(h.hits, 0) AS hits, ROW_NUMBER() OVER "
+               "(PARTITION BY s.yaw_deg, s.surface ORDER BY COALESCE(h.hits, 0) DESC, s.id) AS rank "
+               "FROM scans s LEFT JOIN hits h ON h.scan_id = s.id AND h.object = ?" + where + ") WHERE rank <= ? "
+               "ORDER BY yaw_deg, surface, rank")
+        best = {}
+        for row in self.connection.execute(sql, [target] + params + [int(n)]):
+            best.setdefault((row["yaw_deg"], row["surface"]), []).append(dict(row))
+        return best
+
+    def hits(self, scan_id):
+        """{object name: hit count} of one scan."""
+        return {row["object"]: row["hits"] for row in self.connection.execute("SELECT object, hits FROM hits WHERE scan_id = ?", (scan_id,))}
+
+    def query(self, sql, params=()):
+        """Raw read-only SQL on the scans/hits tables, as a list of dicts."""
+        return [dict(row) for row in self.connection.execute(sql, params)]
+
+    def _where(self, filters):
+        clauses, params = [], []
+        for name, value in filters.items():
+            if value is None:
+                continue
+            column, op = _FILTERS[name]
+            if isinstance(value, (list, tuple, set)) and op == "=":
+                clauses.append(f"{column} IN ({', '.join('?' * len(value))})")
+                params += list(value)
+            else:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM scans").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def index_outputs(catalog, output_dir, pattern="*", refresh=False):
+    """
+    Records the scan files of output_dir that the catalog does not know yet (scans from before the
+    catalog existed; refresh=True re-reads all). .lscan files bring their header metadata; for CSV
+    files the yaw/surface/index come from the output name (yaw_045_Cube_scan_001).
+    Returns the number of files recorded.
+    """
+    paths = sorted(glob.glob(os.path.join(output_dir, pattern + scan_io.EXTENSION)) + glob.glob(os.path.join(output_dir, pattern + ".csv")))
+    if not refresh:
+        known = {row["key"] for row in catalog.query("SELECT key FROM scans")}
+        paths = [path for path in paths if path not in known]
+    for path in paths:
+        with instrumentation.span("catalog_index", path=os.path.basename(path)):
+            if path.endswith(scan_io.EXTENSION):
+                header, columns = scan_io.read_scan(path)
+                metadata = header["metadata"]
+                scan = {"X": columns["x"], "Y": columns["y"], "Z": columns["z"], "categoryID": columns["object"], "names": header["names"]}
+            else:
+                scan = raycast_utils.read_csv(path)
+                match = _OUTPUT_NAME.match(_output_name(path))
+                metadata = {"yaw_deg": float(match[1].replace("p", ".")), "surface": match[2], "index": int(match[3])} if match else {}
+            catalog.record(metadata, scan_summary(scan), path=path)
+    log.info(f"Indexed {len(paths)} scan files of {output_dir} into {catalog.path}")
+    return len(paths)
@@ -0,0 +1,220 @@
+#
+# FILE: scan_io.py
+#
+# Compact binary scan files (.lscan) with a memory-mapped, zero-copy reader.
+#
+# Layout: 8-byte magic, uint32 header length, JSON header, then one
+# fixed-dtype column after another, each starting on a 64-byte boundary.
+# The header holds the scan metadata (yaw, surface, pose, params, object
+# names) and the dtype/offset of every column.
+#
+import os
+import json
+import glob
+import gzip
+import struct
+import shutil
+import numpy as np
+
+import file_utils
+import raycast_utils
+
+MAGIC = b"LSCAN\x00\x01\x00"
+EXTENSION = ".lscan"
+ALIGN = 64
+NO_INDEX = np.iinfo(np.uint16).max
+
+# column name -> (scan dict key, dtype)
+COLUMNS = {
+    "x": ("X", "<f4"),
+    "y": ("Y", "<f4"),
+    "z": ("Z", "<f4"),
+    "distance": ("distance", "<f4"),
+    "intensity": ("intensity", "<f4"),
+    "object": ("categoryID", "<u2"),
+    "azimuth_index": ("azimuthIndex", "<u2"),
+    "elevation_index": ("elevationIndex", "<u2"),
+}
+
+
+def _padding(offset):
+    return (-offset) % ALIGN
+
+
+def _column_arrays(scan):
+    """Scan dict -> fixed-dtype column arrays (ray indices default to NO_INDEX when unknown)."""
+    n = len(scan["X"])
+    arrays = {}
+    for column, (key, dtype) in COLUMNS.items():
+        values = scan.get(key)
+        arrays[column] = np.full(n, NO_INDEX, dtype=dtype) if values is None else np.ascontiguousarray(values, dtype=dtype)
+    return arrays
+
+
+def _header_bytes(arrays, metadata, names):
+    """JSON header; column offsets are relative to the start of the (aligned) data section."""
+    columns, offset = [], 0
+    for column, array in arrays.items():
+        columns.append({"name": column, "dtype": array.dtype.str, "offset": offset})
+        offset += array.nbytes + _padding(array.nbytes)
+    header = {"n_points": len(arrays["x"]), "names": list(names), "metadata": metadata or {}, "columns": columns}
+    return json.dumps(header).encode()
+
+
+def _data_offset(header_length):
+    start = len(MAGIC) + 4 + header_length
+    return start + _padding(start)
+
+
+def encode_scan(scan, metadata=None):
+    """The complete .lscan file of a scan dict as bytes."""
+    arrays = _column_arrays(scan)
+    encoded = _header_bytes(arrays, metadata, scan.get("names", []))
+    parts = [MAGIC, struct.pack("<I", len(encoded)), encoded]
+    parts.append(b"\0" * (_data_offset(len(encoded)) - len(MAGIC) - 4 - len(encoded)))
+    for array in arrays.values():
+        parts += [array.tobytes(), b"\0" * _padding(array.nbytes)]
+    return b"".join(parts)
+
+
+def write_scan(scan, output_dir, output_filename, metadata=None):
+    """Writes a scan dict as <output_filename>.lscan (atomically, encode_scan's bytes). Returns the file path."""
+    path = os.path.join(output_dir, f"{output_filename}{EXTENSION}")
+    tmp_path = f"{path}.{file_utils.temp_tag()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(encode_scan(scan, metadata))
+    os.replace(tmp_path, path)
+    return path
+
+
+class ScanStreamWriter:
+    """
+    Writes one scan that arrives in chunks (raycast_utils.stream_scan) without holding it in memory.
+    Binary: every column is spilled to its own temporary file and the .lscan is assembled on close().
+    CSV: rows are appended to a temporary file. Either way the final file appears atomically on close().
+    """
+
+    def __init__(self, output_dir, output_filename, metadata=None, export_format="binary"):
+        self.export_format = export_format
+        self.metadata = metadata
+        self.names = None
+        self.n_points = 0
+        extension = EXTENSION if export_format == "binary" else ".csv"
+        self.path = os.path.join(output_dir, f"{output_filename}{extension}")
+        self._tmp = f"{self.path}.{file_utils.temp_tag()}.tmp"
+        if export_format == "binary":
+            self._spills = {column: open(f"{self._tmp}.{column}", "wb") for column in COLUMNS}
+        else:
+            self._spills = {"csv": open(self._tmp, "wb")}
+
+    def append(self, chunk):
+        """Adds one partial scan dict."""
+        if self.names is None:
+            self.names = list(chunk.get("names", []))
+        if self.export_format == "binary":
+            for column, array in _column_arrays(chunk).items():
+                self._spills[column].write(array.tobytes())
+        else:
+            self._spills["csv"].write(raycast_utils.encode_csv(chunk, header=not self._spills["csv"].tell()))
+        self.n_points += len(chunk["X"])
+
+    def close(self):
+        """Finishes the file and returns its path."""
+        for f in self._spills.values():
+            f.close()
+        if self.export_format == "binary":
+            # zero-stride stand-ins: the header only needs each column's dtype and size
+            arrays = {column: np.broadcast_to(np.zeros(1, dtype=dtype), self.n_points) for column, (_, dtype) in COLUMNS.items()}
+            encoded = _header_bytes(arrays, self.metadata, self.names or [])
+            with open(self._tmp, "wb") as out:
+                out.write(MAGIC + struct.pack("<I", len(encoded)) + encoded)
+                out.write(b"\0" * (_data_offset(len(encoded)) - out.tell()))
+                for column, array in arrays.items():
+                    with open(f"{self._tmp}.{column}", "rb") as spill:
+                        shutil.copyfileobj(spill, out)
+                    out.write(b"\0" * _padding(array.nbytes))
+                    os.remove(f"{self._tmp}.{column}")
+        elif os.path.getsize(self._tmp) == 0:
+            with open(self._tmp, "wb") as out:
+                out.write((";".join(raycast_utils.CSV_COLUMNS) + "\n").encode())
+        os.replace(self._tmp, self.path)
+        return self.path
+
+    def abort(self):
+        """Drops everything written so far."""
+        for f in self._spills.values():
+            f.close()
+        for path in [self._tmp] + [f"{self._tmp}.{column}" for column in COLUMNS]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _open(path):
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def read_header(path):
+    """Reads only the JSON header of a .lscan (or gzipped .lscan.gz) file."""
+    with _open(path) as f:
+        magic = f.read(len(MAGIC))
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a .lscan file.")
+        (length,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(length))
+    header["data_offset"] = _data_offset(length)
+    return header
+
+
+def read_scan(path):
+    """
+    Memory-maps a .lscan file. Returns (header, columns) where every column is a
+    read-only NumPy view into the mapping: nothing is copied or parsed up front.
+    A gzipped .lscan.gz is decompressed into memory instead.
+    """
+    header = read_header(path)
+    n = header["n_points"]
+    if path.endswith(".gz"):
+        with _open(path) as f:
+            mapped = np.frombuffer(f.read(), dtype=np.uint8)
+    else:
+        mapped = np.memmap(path, dtype=np.uint8, mode="r")
+    columns = {}
+    for c in header["columns"]:
+        dtype = np.dtype(c["dtype"])
+        start = header["data_offset"] + c["offset"]
+        columns[c["name"]] = mapped[start:start + n * dtype.itemsize].view(dtype)
+    return header, columns
+
+
+def scanner_location(metadata):
+    """Scanner location recorded in scan metadata: job "location" or Blender "matrix_world"; None without either."""
+    if "location" in metadata:
+        return [float(v) for v in metadata["location"]]
+    if "matrix_world" in metadata:
+        return [float(row[3]) for row in metadata["matrix_world"][:3]]
+    return None
+
+
+def points(columns):
+    """(N,3) float32 xyz from a read_scan column dict (this one does copy)."""
+    return np.stack([columns["x"], columns["y"], columns["z"]], axis=1)
+
+
+def load_sweep(directory, pattern="*"):
+    """
+    Reads every .lscan (or gzipped .lscan.gz) file of a sweep: {output_name: (header, columns)}.
+    When a scan exists in both forms, the uncompressed file is memory-mapped.
+    """
+    paths = {}
+    for extension in (EXTENSION + ".gz", EXTENSION):
+        for path in glob.glob(os.path.join(directory, pattern + extension)):
+            paths[os.path.basename(path)[:-len(extension)]] = path
+    return {name: read_scan(paths[name]) for name in sorted(paths)}
+
+
+def convert_csv(csv_path, metadata=None):
+    """Converts an exported scan CSV (or gzipped .csv.gz) into a .lscan file next to it."""
+    scan = raycast_utils.read_csv(csv_path)
+    base = csv_path[:-len(".gz")] if csv_path.endswith(".gz") else csv_path
+    output_dir, filename = os.path.split(os.path.splitext(base)[0])
+    return write_scan(scan, output_dir, filename, metadata)
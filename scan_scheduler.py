@@ -0,0 +1,544 @@
+#
+# FILE: scan_scheduler.py
+#
+# Parallel, resumable scheduler for the orientation x grid-point sweep.
+# The sweep is expanded into a manifest of self-contained scan jobs, jobs run
+# on a process pool (headless ray caster) or on several background Blender
+# processes, and every finished job is appended to completed.jsonl so a
+# killed run resumes where it stopped.
+#
+# Headless:  python scan_scheduler.py --manifest Outputs/scan_manifest.jsonl --output-dir Outputs --shard 0/4
+# Blender:   python scan_scheduler.py --manifest ... --backend blender --blend-file scene4.blend
+# Search:    python scan_scheduler.py --manifest ... --search surrogate --max-scans 60 (scans only the promising jobs)
+# LOD:       python scan_scheduler.py --manifest ... --lod (coarser tug/aircraft meshes where the sensor cannot tell)
+# Manifests are written from main.py (WRITE_SCAN_MANIFEST) or with expand_manifest().
+#
+import os
+import sys
+import json
+import math
+import time
+import hashlib
+import argparse
+import contextlib
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import file_utils
+import mesh_utils
+import mesh_lod
+import raycast_utils
+import scan_cache
+import scan_io
+import sensor_models
+import adaptive_scan
+import scan_catalog
+import instrumentation
+
+log = instrumentation.get_logger(__name__)
+
+SCAN_DONE_MARKER = "SCAN_DONE "
+
+
+def job_id(job):
+    """Stable id of a job: hash of everything that defines the scan (not of its id field)."""
+    content = {k: v for k, v in job.items() if k != "job_id"}
+    return hashlib.sha1(json.dumps(content, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def yaw_tag(yaw_deg):
+    """Orientation tag of output names: yaw_045 for whole degrees, yaw_000p50 for fractions (to 0.01 deg)."""
+    yaw = round(float(yaw_deg), 2)
+    if yaw == int(yaw):
+        return f"yaw_{int(yaw):03d}"
+    return "yaw_" + f"{yaw:06.2f}".replace(".", "p")
+
+
+def expand_manifest(yaws_deg, plate_points, scan_params=None, tug_location=(0, 0, 0),
+                    aircraft_location=(0, 0, 0), z_offset=0.1, rotation_degrees=(90, 0, 90), sensor_model=None):
+    """
+    Expands a sweep into a list of scan jobs, one per (yaw, surface, grid point).
+    plate_points maps each surface name to grid points in the tug frame (tug at yaw 0);
+    they are rotated with the tug like the plates parented to it in main.py.
+    aircraft_location is a fixed location or a callable yaw_deg -> aligned aircraft location.
+    sensor_model scans every job with a sensor_models model instead of the uniform detailed pattern.
+    """
+    base_params = raycast_utils.DETAILED_SCAN_PARAMS if sensor_model is None else sensor_models.scan_params(sensor_model)
+    params = dict(base_params, **(scan_params or {}))
+    tug_location = np.asarray(tug_location, dtype=float)
+    jobs = []
+    for yaw_deg in yaws_deg:
+        yaw = math.radians(yaw_deg)
+        Rz = np.array([[math.cos(yaw), -math.sin(yaw), 0], [math.sin(yaw), math.cos(yaw), 0], [0, 0, 1]])
+        ac_location = aircraft_location(yaw_deg) if callable(aircraft_location) else aircraft_location
+        idx = 0
+        for surface, points in plate_points.items():
+            for point in points:
+                idx += 1
+                location = tug_location + Rz @ np.asarray(point, dtype=float) + (0, 0, z_offset)
+                job = {
+                    "yaw_deg": yaw_deg,
+                    "surface": surface,
+                    "index": idx,
+                    "tug_location": [float(v) for v in tug_location],
+                    "aircraft_location": [float(v) for v in ac_location],
+                    "location": [float(v) for v in location],
+                    "rotation_degrees": list(rotation_degrees),
+                    "scan_params": params,
+                    "output_name": f"{yaw_tag(yaw_deg)}_{surface}_scan_{idx:03d}",
+                }
+                if sensor_model is not None:
+                    job["sensor_model"] = sensor_model
+                job["job_id"] = job_id(job)
+                jobs.append(job)
+    return jobs
+
+
+def write_manifest(jobs, path):
+    """Writes jobs as JSON lines."""
+    with open(path, "w") as f:
+        for job in jobs:
+            f.write(json.dumps(job) + "\n")
+    log.info(f"Wrote {len(jobs)} scan jobs to {path}")
+
+
+def load_manifest(path):
+    """Reads a JSON-lines manifest."""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def shard(jobs, shard_index=0, shard_count=1):
+    """Deterministic round-robin slice of the manifest for one machine."""
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"Invalid shard {shard_index}/{shard_count}.")
+    return [job for k, job in enumerate(jobs) if k % shard_count == shard_index]
+
+
+def completed_jobs(completed_path):
+    """Ids of jobs recorded as finished. A torn last line from a killed run is ignored."""
+    done = set()
+    if not os.path.exists(completed_path):
+        return done
+    with open(completed_path) as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["job_id"])
+            except (ValueError, KeyError):
+                continue
+    return done
+
+
+def record_completed(completed_path, result):
+    """Appends one finished job and forces it to disk before the next one is started."""
+    with open(completed_path, "a") as f:
+        f.write(json.dumps(result) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def scanner_matrix(job):
+    """World matrix of the lidar for a job (rotation in degrees, like blender_utils.create_camera)."""
+    return mesh_utils.transform_matrix(job["location"], [math.radians(a) for a in job["rotation_degrees"]])
+
+
+def aircraft_matrix(job, scene_spec=None):
+    """
+    World matrix of the aircraft for a job: its aligned location with the scene spec's
+    "aircraft_rotation_degrees" and "aircraft_scale" (the model's pose in the blend file, default none).
+    """
+    spec = scene_spec or {}
+    rotation = [math.radians(a) for a in spec.get("aircraft_rotation_degrees") or (0, 0, 0)]
+    return mesh_utils.transform_matrix(job["aircraft_location"], rotation, spec.get("aircraft_scale") or (1, 1, 1))
+
+
+# --- headless workers ---------------------------------------------------------
+
+_WORKER = {}
+
+
+def _init_headless_worker(scene_spec):
+    """Loads the meshes once per worker process."""
+    _WORKER["spec"] = scene_spec
+    _WORKER["tug"] = mesh_utils.load_mesh_cached(scene_spec["tug_mesh"])[:2]
+    _WORKER["aircraft"] = mesh_utils.load_mesh_cached(scene_spec["aircraft_mesh"])[:2]
+    _WORKER["scene_key"] = None
+    _WORKER["scene"] = None
+    _WORKER["cache"] = scan_cache.ScanCache(scene_spec["cache_dir"]) if scene_spec.get("cache_dir") else None
+    _WORKER["lods"], _WORKER["blas"], _WORKER["levels"] = {}, {}, {}
+    if scene_spec.get("lod"):
+        _WORKER["lods"] = {"Tug_t5": mesh_lod.load_lods(scene_spec["tug_mesh"]),
+                           "a3320_ceo": mesh_lod.load_lods(scene_spec["aircraft_mesh"])}
+
+
+def _worker_scene(job):
+    """
+    Objects and fingerprint of the job's tug yaw/aircraft placement, refreshed only when the placement
+    changes. The per-object BVHs are built lazily by _worker_bvh_scene, so cache hits never pay for them;
+    later placements only move the instances.
+    """
+    key = (job["yaw_deg"], tuple(job["tug_location"]), tuple(job["aircraft_location"]))
+    if _WORKER["scene_key"] != key:
+        tug_matrix = mesh_utils.transform_matrix(job["tug_location"], (0, 0, math.radians(job["yaw_deg"])))
+        spec = _WORKER["spec"]
+        ac_matrix = aircraft_matrix(job, spec)
+        objects = [("Tug_t5", *_WORKER["tug"], tug_matrix), ("a3320_ceo", *_WORKER["aircraft"], ac_matrix)]
+        sources = [("Tug_t5", spec["tug_mesh"], tug_matrix), ("a3320_ceo", spec["aircraft_mesh"], ac_matrix)]
+        if spec.get("walls", True):
+            walls = mesh_utils.boundary_walls()
+            objects += walls
+            sources += [(name, (v, f), M) for name, v, f, M in walls]
+        _WORKER["objects"] = objects
+        if _WORKER["scene"] is not None:
+            # Same meshes, new placement: refit the top level instead of rebuilding the BVHs.
+            raycast_utils.set_instance_matrices(_WORKER["scene"], {name: M for name, _, _, M in objects})
+        _WORKER["scene_fp"] = scan_cache.scene_fingerprint(sources)
+        _WORKER["scene_key"] = key
+    return _WORKER["scene_fp"]
+
+
+def _worker_bvh_scene(levels=None):
+    """The placement's instanced scene with the tug/aircraft at the given mesh_lod levels ({name: level}, default full resolution)."""
+    scene = _WORKER["scene"]
+    if scene is None:
+        # Built straight at the first levels: a full-resolution BVH no scan needs is never made.
+        first = {name: (levels or {}).get(name, 0) for name in _WORKER["lods"]}
+        objects = [(name, _WORKER["lods"][name][first[name]]["vertices"], _WORKER["lods"][name][first[name]]["faces"], M)
+                   if name in first else (name, v, f, M) for name, v, f, M in _WORKER["objects"]]
+        scene = _WORKER["scene"] = raycast_utils.build_instanced_scene(objects)
+        for name, level in first.items():
+            _WORKER["blas"][(name, level)] = scene["blas"][scene["names"].index(name)]
+        _WORKER["levels"] = first
+    swap = {name: level for name, level in (levels or {}).items() if _WORKER["levels"].get(name, 0) != level}
+    if swap:
+        raycast_utils.set_instance_meshes(scene, {name: _worker_blas(name, level) for name, level in swap.items()})
+        _WORKER["levels"].update(swap)
+    return scene
+
+
+def _worker_blas(name, level):
+    """BVH of one mesh_lod level, built on first use and kept for the worker's lifetime."""
+    key = (name, level)
+    if key not in _WORKER["blas"]:
+        lod = _WORKER["lods"][name][level]
+        _WORKER["blas"][key] = raycast_utils.mesh_blas(lod["vertices"], lod["faces"])
+    return _WORKER["blas"][key]
+
+
+def _job_levels(job, matrix, params):
+    """
+    mesh_lod levels of the tug and aircraft for a job's sensor at matrix ({} without spec "lod"):
+    the sensor model's angular resolution and range noise, or the scan params' finest step and the
+    spec's "range_noise" (mesh_lod.DEFAULT_RANGE_NOISE) for the uniform pattern.
+    """
+    if not _WORKER["lods"]:
+        return {}
+    if job.get("sensor_model"):
+        step = sensor_models.angular_resolution(job["sensor_model"])
+        noise = sensor_models.get_sensor(job["sensor_model"]).get("range_noise", mesh_lod.DEFAULT_RANGE_NOISE)
+    else:
+        step = min(params["xStepDegree"], params["yStepDegree"])
+        noise = _WORKER["spec"].get("range_noise") or mesh_lod.DEFAULT_RANGE_NOISE
+    matrices = {name: M for name, _, _, M in _WORKER["objects"]}
+    return mesh_lod.select_levels(_WORKER["lods"], matrices, matrix[:3, 3], step, noise)
+
+
+def job_metadata(job):
+    """Header metadata of a job's binary scan file."""
+    return {k: job[k] for k in ("job_id", "yaw_deg", "surface", "index", "tug_location", "aircraft_location",
+                                "location", "rotation_degrees", "scan_params", "sensor_model") if k in job}
+
+
+def result_metadata(job, result):
+    """job_metadata plus the mesh_lod error bounds the scan was traced at, for the catalog."""
+    metadata = job_metadata(job)
+    if "lod" in result:
+        metadata["lod"] = result["lod"]
+    return metadata
+
+
+def _run_headless_job(job, output_dir):
+    """
+    Scans one job (or takes it from the scan cache) and writes its file atomically (temp file + rename).
+    With a memory budget and no cache, the scan streams chunk by chunk straight into the file.
+    The result records the job's peak traced memory (MB).
+    Jobs with a sensor model trace its cached ray table from the mounted optical centre.
+    With spec targets, only the rays that can reach those objects are traced (adaptive_scan).
+    The result also carries the scan's run time and its scan_catalog summary for the catalog.
+    With spec "lod", the tug and aircraft are traced at the levels _job_levels picks; their error bounds
+    (m) go into the cache key, the file header and the result ("lod").
+    """
+    start = time.perf_counter()
+    scene_fp = _worker_scene(job)
+    matrix = scanner_matrix(job)
+    params, key_params = dict(job["scan_params"]), job["scan_params"]
+    if job.get("sensor_model"):
+        matrix = sensor_models.mounted_matrix(matrix, job["sensor_model"])
+        params["rays"] = sensor_models.ray_table(job["sensor_model"])
+        key_params = dict(key_params, sensor_model=sensor_models.model_fingerprint(job["sensor_model"]))
+    targets = _WORKER["spec"].get("targets")
+    if targets:
+        key_params = dict(key_params, targets=sorted(targets))
+    metadata = dict(job_metadata(job), aircraft_matrix=aircraft_matrix(job, _WORKER["spec"]).tolist())
+    levels = _job_levels(job, matrix, params)
+    if levels:
+        metadata["lod"] = {name: _WORKER["lods"][name][level]["error"] for name, level in levels.items()}
+        key_params = dict(key_params, lod=metadata["lod"])
+    budget = _WORKER["spec"].get("memory_budget_mb")
+    export_format = _WORKER["spec"].get("format", "csv")
+    if budget and _WORKER["cache"] is None and not targets:
+        writer = scan_io.ScanStreamWriter(output_dir, job["output_name"], metadata, export_format)
+        summary = scan_catalog.ScanSummary()
+
+        def sink(chunk):
+            summary.add(chunk)
+            writer.append(chunk)
+
+        try:
+            stats = raycast_utils.stream_scan(_worker_bvh_scene(levels), matrix, sink, budget, **params)
+        except BaseException:
+            writer.abort()
+            raise
+        result = {"job_id": job["job_id"], "output": writer.close(), "points": stats["points"], "peak_mb": round(stats["peak_mb"], 1),
+                  "seconds": round(time.perf_counter() - start, 3), "summary": summary.result()}
+        return dict(result, lod=metadata["lod"]) if levels else result
+
+    if targets:
+        scan_fn = lambda: adaptive_scan.scan_targeted(_worker_bvh_scene(levels), matrix, targets, **params)[0]
+    else:
+        scan_fn = lambda: raycast_utils.scan_rotating(_worker_bvh_scene(levels), matrix, memory_budget_mb=budget, **params)
+    with instrumentation.peak_memory() as memory:
+        if _WORKER["cache"] is None:
+            scan = scan_fn()
+        else:
+            scan = _WORKER["cache"].get_or_scan(scan_cache.scan_key(scene_fp, matrix, key_params), scan_fn)
+        if export_format == "binary":
+            path = scan_io.write_scan(scan, output_dir, job["output_name"], metadata)
+        else:
+            tmp_name = f".{job['output_name']}.{file_utils.temp_tag()}.tmp"
+            tmp_path = raycast_utils.write_csv(scan, output_dir, tmp_name)
+            path = os.path.join(output_dir, f"{job['output_name']}.csv")
+            os.replace(tmp_path, path)
+    result = {"job_id": job["job_id"], "output": path, "points": int(len(scan["X"])), "peak_mb": round(memory.peak_bytes / 2 ** 20, 1),
+              "seconds": round(time.perf_counter() - start, 3), "summary": scan_catalog.scan_summary(scan)}
+    return dict(result, lod=metadata["lod"]) if levels else result
+
+
+def _run_headless(jobs, output_dir, completed_path, workers, scene_spec, catalog=None):
+    """Runs the jobs on a process pool; returns the number of jobs that failed."""
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_headless_worker, initargs=(scene_spec,)) as pool:
+        futures = {pool.submit(_run_headless_job, job, output_dir): job for job in jobs}
+        for n, future in enumerate(as_completed(futures), start=1):
+            job = futures[future]
+            try:
+                result = future.result()
+            except Exception:
+                log.exception(f"Job {job['output_name']} failed.")
+                failed += 1
+                continue
+            if catalog is not None:
+                catalog.record(result_metadata(job, result), result["summary"], path=result["output"], seconds=result["seconds"],
+                               peak_mb=result["peak_mb"], backend="headless")
+            record_completed(completed_path, result)
+            log.info(f"[{n}/{len(jobs)}] {job['output_name']}: {result['points']} points, peak {result['peak_mb']} MB")
+    return failed
+
+
+# --- Blender workers ----------------------------------------------------------
+
+def _run_blender(jobs, output_dir, completed_path, workers, blend_file, blender, export_format="csv", catalog_path=None):
+    """
+    Runs one background Blender per worker, each on a round-robin share of the jobs.
+    The workers record their scans in the catalog at catalog_path themselves; their other output is
+    passed through. Returns the number of jobs no worker reported done.
+    """
+    lock = threading.Lock()
+    done = []
+
+    def pump(proc):
+        for line in proc.stdout:
+            if line.startswith(SCAN_DONE_MARKER):
+                result = json.loads(line[len(SCAN_DONE_MARKER):])
+                with lock:
+                    record_completed(completed_path, result)
+                    done.append(result["job_id"])
+                log.info(f"[{len(done)}/{len(jobs)}] done: {result['output']}")
+            else:
+                sys.stdout.write(line)
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    bootstrap = (f"import sys; sys.path.insert(0, {here!r}); import scan_scheduler; "
+                 "scan_scheduler.main(sys.argv[sys.argv.index('--') + 1:])")
+    procs, threads, shares = [], [], []
+    for w in range(min(workers, len(jobs))):
+        share_path = os.path.join(output_dir, f".scheduler_worker_{w}.jsonl")
+        write_manifest(jobs[w::workers], share_path)
+        shares.append(share_path)
+        cmd = [blender, "-b", blend_file, "--python-expr", bootstrap, "--",
+               "--blender-worker", "--manifest", share_path, "--output-dir", output_dir, "--format", export_format]
+        cmd += ["--catalog", catalog_path] if catalog_path else ["--no-catalog"]
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+        thread = threading.Thread(target=pump, args=(proc,), daemon=True)
+        thread.start()
+        procs.append(proc)
+        threads.append(thread)
+    for proc, thread in zip(procs, threads):
+        proc.wait()
+        thread.join()
+        if proc.returncode:
+            log.warning(f"Blender worker exited with code {proc.returncode}")
+    for share_path in shares:
+        os.remove(share_path)
+    return len(jobs) - len(done)
+
+
+def _blender_worker_main(manifest_path, output_dir, export_format="csv", catalog_path=None):
+    """
+    Runs a share of the jobs inside a background Blender started by _run_blender. A job is reported
+    done (SCAN_DONE_MARKER with its output path) only once its export file exists; jobs that fail or
+    write nothing stay pending and make the worker exit with code 1.
+    """
+    import bpy
+    import blender_utils
+    import lidar_utils
+
+    lidar_utils.enable_scanner_addon()
+    tug_obj = bpy.data.objects.get("Tug_t5")
+    ac_obj = bpy.data.objects.get("a3320_ceo")
+    if not tug_obj or not ac_obj:
+        log.error("Could not find 'Tug_t5' and 'a3320_ceo' in the blend file.")
+        sys.exit(1)
+
+    catalog = scan_catalog.ScanCatalog(catalog_path) if catalog_path else None
+    lidar_cam = None
+    failed = 0
+    for job in load_manifest(manifest_path):
+        tug_obj.location = job["tug_location"]
+        tug_obj.rotation_euler = (0.0, 0.0, math.radians(job["yaw_deg"]))
+        ac_obj.location = job["aircraft_location"]
+        if lidar_cam is None:
+            lidar_cam = blender_utils.create_camera("lidar", job["location"], job["rotation_degrees"], scale=(0.15, 0.15, 0.15))
+        blender_utils.set_transform(lidar_cam.name, job["location"], job["rotation_degrees"])
+        lidar_cam["sensor_model"] = job.get("sensor_model", "")
+        bpy.context.view_layer.update()
+        start = math.floor(time.time())  # file mtimes can be coarser than time.time()
+        try:
+            scan = lidar_utils.run_detailed_rotating_scan(lidar_cam.name, output_dir, job["output_name"], export=True, add_mesh_to_scene=False,
+                                                          export_format=export_format, metadata=job_metadata(job), catalog=catalog)
+        except Exception:
+            log.exception(f"Job {job['output_name']} failed.")
+            failed += 1
+            continue
+        path = lidar_utils.exported_file(output_dir, job["output_name"], export_format, since=start)
+        if path is None:
+            log.error(f"Job {job['output_name']} wrote no {export_format} export; it stays pending.")
+            failed += 1
+            continue
+        result = {"job_id": job["job_id"], "output": path, "points": None if scan is None else int(len(scan["X"]))}
+        print(SCAN_DONE_MARKER + json.dumps(result), flush=True)  # protocol line for _run_blender, not a log message
+    if catalog is not None:
+        catalog.close()
+    if failed:
+        sys.exit(1)
+
+
+# --- entry point --------------------------------------------------------------
+
+def run_jobs(jobs, output_dir, workers=None, backend="headless", scene_spec=None,
+             blend_file=None, blender="blender", shard_index=0, shard_count=1, catalog=True):
+    """
+    Runs this shard's unfinished jobs. Completed jobs are kept in
+    <output_dir>/completed.jsonl, so calling this again after a crash resumes the sweep.
+    Every finished scan is recorded in a scan_catalog: catalog=True uses <output_dir>/scan_catalog.sqlite,
+    a path another file (shards can share one), False records nothing.
+    Returns the number of jobs that failed (0 when every pending job finished).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    completed_path = os.path.join(output_dir, "completed.jsonl")
+    mine = shard(jobs, shard_index, shard_count)
+    done = completed_jobs(completed_path)
+    pending = [job for job in mine if job["job_id"] not in done]
+    log.info(f"Shard {shard_index}/{shard_count}: {len(mine)} jobs, {len(mine) - len(pending)} already done, "
+             f"{len(pending)} to run on {workers} {backend} workers.")
+    if not pending:
+        return 0
+    catalog_path = os.path.join(output_dir, scan_catalog.CATALOG_NAME) if catalog is True else catalog or None
+    if backend == "headless":
+        with (scan_catalog.ScanCatalog(catalog_path) if catalog_path else contextlib.nullcontext()) as opened:
+            failed = _run_headless(pending, output_dir, completed_path, workers, scene_spec, opened)
+    elif backend == "blender":
+        failed = _run_blender(pending, output_dir, completed_path, workers, blend_file, blender, (scene_spec or {}).get("format", "csv"), catalog_path)
+    else:
+        raise ValueError(f"Unknown backend '{backend}'.")
+    if failed:
+        log.error(f"{failed} of {len(pending)} jobs failed; rerun to retry them.")
+    return failed
+
+
+def main(argv):
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Run a lidar placement sweep manifest.")
+    parser.add_argument("--manifest", required=True)
+    parser.add_argument("--output-dir", default=os.path.join(here, "Outputs"))
+    parser.add_argument("--shard", default="0/1", help="index/count, e.g. 2/8")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--backend", choices=("headless", "blender"), default="headless")
+    parser.add_argument("--tug-mesh", default=os.path.join(here, "Tugs", "t5.ply"))
+    parser.add_argument("--aircraft-mesh", default=os.path.join(here, "AC", "a320_ceo.stl"))
+    parser.add_argument("--aircraft-rotation", type=float, nargs=3, default=None, metavar=("RX", "RY", "RZ"),
+                        help="aircraft rotation in degrees, as in the blend file")
+    parser.add_argument("--aircraft-scale", type=float, nargs=3, default=None, metavar=("SX", "SY", "SZ"))
+    parser.add_argument("--no-walls", action="store_true")
+    parser.add_argument("--format", choices=("csv", "binary"), default="csv", help="binary writes memory-mappable .lscan files")
+    parser.add_argument("--cache-dir", default=None, help="reuse scans from this scan_cache directory")
+    parser.add_argument("--memory-budget-mb", type=float, default=None,
+                        help="trace rays in chunks within this budget per worker (streams to the output file without --cache-dir)")
+    parser.add_argument("--targets", nargs="+", default=None,
+                        help="trace only the rays that can reach these objects, e.g. a3320_ceo (coarse-to-fine targeted scan)")
+    parser.add_argument("--lod", action="store_true",
+                        help="trace the tug/aircraft at the coarsest mesh level each sensor cannot tell apart (mesh_lod)")
+    parser.add_argument("--range-noise", type=float, default=None,
+                        help="--lod: range noise (m) of jobs without a sensor model (default mesh_lod.DEFAULT_RANGE_NOISE)")
+    parser.add_argument("--catalog", default=None, help="scan catalog file (default: <output-dir>/scan_catalog.sqlite)")
+    parser.add_argument("--no-catalog", action="store_true", help="do not record the scans in a scan catalog")
+    parser.add_argument("--search", choices=("grid", "surrogate"), default="grid",
+                        help="surrogate: scan only the jobs a coverage surrogate picks (headless, ignores --shard)")
+    parser.add_argument("--max-scans", type=int, default=60, help="surrogate search: scan budget")
+    parser.add_argument("--initial-scans", type=int, default=12, help="surrogate search: spread-out scans before the model takes over")
+    parser.add_argument("--min-gain", type=float, default=0.002, help="surrogate search: stop below this expected gain (fraction of the best coverage)")
+    parser.add_argument("--blend-file", default=os.path.join(here, "scene4.blend"))
+    parser.add_argument("--blender", default="blender")
+    parser.add_argument("--blender-worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--log-level", default="INFO", choices=("DEBUG", "INFO", "WARNING", "ERROR"))
+    args = parser.parse_args(argv)
+    instrumentation.configure(args.log_level)
+
+    catalog = False if args.no_catalog else args.catalog or True
+    if args.blender_worker:
+        _blender_worker_main(args.manifest, args.output_dir, args.format, catalog if isinstance(catalog, str) else None)
+        return
+    shard_index, shard_count = (int(v) for v in args.shard.split("/"))
+    scene_spec = {"tug_mesh": args.tug_mesh, "aircraft_mesh": args.aircraft_mesh, "walls": not args.no_walls,
+                  "aircraft_rotation_degrees": args.aircraft_rotation, "aircraft_scale": args.aircraft_scale,
+                  "cache_dir": args.cache_dir, "format": args.format, "memory_budget_mb": args.memory_budget_mb, "targets": args.targets,
+                  "lod": args.lod, "range_noise": args.range_noise}
+    if args.search == "surrogate":
+        if args.backend != "headless":
+            parser.error("--search surrogate needs --backend headless")
+        import surrogate_search
+        surrogate_search.search_jobs(load_manifest(args.manifest), args.output_dir, scene_spec, args.workers, args.initial_scans,
+                                     args.max_scans, args.min_gain, catalog=catalog)
+        return
+    failed = run_jobs(load_manifest(args.manifest), args.output_dir, args.workers, args.backend, scene_spec,
+                      args.blend_file, args.blender, shard_index, shard_count, catalog)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,166 @@
+#
+# FILE: sensor_models.py
+#
+# Registry of lidar sensor models for the headless scans. A model is a dict
+# with its channel elevations, azimuth resolution and field of view, range
+# limits and noise and the mounting offset of its optical centre in the scanner
+# object's frame (+Y up, looking down -Z, as in raycast_utils). The ray
+# table of a model (directions, azimuth/elevation index) is generated once
+# per process and shared read-only by every scan that uses it.
+#
+# Scanner objects select a model by name: blender_utils.create_camera(...,
+# sensor_model="vlp16") and the "sensor_model" key of scan_scheduler jobs.
+#
+import json
+import hashlib
+import numpy as np
+
+import mesh_utils
+import raycast_utils
+import instrumentation
+
+log = instrumentation.get_logger(__name__)
+
+
+def sensor_model(elevations_deg, azimuth_step_deg, fov_azimuth_deg=360.0, range_m=(0.0, 99999.9),
+                 mount_offset=(0.0, 0.0, 0.0), mount_rotation_deg=(0.0, 0.0, 0.0), description="", range_noise_m=0.02):
+    """
+    Model dict from its channel elevations (deg, one per laser), azimuth step and field of view
+    (deg, centred on the scanner's -Z axis), range limits (m), mounting offset of the optical
+    centre in the scanner frame (m, XYZ Euler degrees) and range noise (1 sigma, m; bounds the
+    mesh_lod error a scan may use).
+    """
+    return {
+        "elevations": [float(e) for e in np.sort(np.asarray(elevations_deg, dtype=float))],
+        "azimuth_step": float(azimuth_step_deg),
+        "fov_azimuth": float(fov_azimuth_deg),
+        "range": [float(range_m[0]), float(range_m[1])],
+        "mount_offset": [float(v) for v in mount_offset],
+        "mount_rotation": [float(v) for v in mount_rotation_deg],
+        "range_noise": float(range_noise_m),
+        "description": description,
+    }
+
+
+def _detailed_model():
+    """The uniform pattern of raycast_utils.DETAILED_SCAN_PARAMS as a sensor model."""
+    p = raycast_utils.DETAILED_SCAN_PARAMS
+    n_y = int(p["fovY"] / p["yStepDegree"])
+    return sensor_model(-p["fovY"] / 2.0 + np.arange(n_y) * p["yStepDegree"], p["xStepDegree"], p["fovX"],
+                        (p["distanceLower"], p["distanceUpper"]), description="uniform 0.4 x 0.33 deg dome (default)",
+                        range_noise_m=0.01)
+
+
+# Nominal datasheet figures; register a measured model (register_sensor) where exact values matter.
+SENSOR_MODELS = {
+    "detailed": _detailed_model(),
+    "vlp16": sensor_model(np.arange(-15.0, 16.0, 2.0), 0.2, range_m=(0.5, 100.0), mount_offset=(0.0, 0.0377, 0.0),
+                          description="16-channel spinning, +-15 deg, 10 Hz", range_noise_m=0.03),
+    "hdl32e": sensor_model(np.linspace(-30.67, 10.67, 32), 0.16, range_m=(1.0, 100.0), mount_offset=(0.0, 0.0717, 0.0),
+                           description="32-channel spinning, -30.67..+10.67 deg, 10 Hz", range_noise_m=0.02),
+    "os1_64": sensor_model(np.linspace(-22.5, 22.5, 64), 360.0 / 1024, range_m=(0.3, 120.0), mount_offset=(0.0, 0.0362, 0.0),
+                           description="64-channel spinning, 45 deg vertical FOV, 1024 columns", range_noise_m=0.03),
+    # Approximates the VLS-128 layout: a fine band around the horizon, coarser channels above and below.
+    "vls128": sensor_model(np.r_[np.linspace(-25.0, -6.0, 32), np.linspace(-5.75, 5.75, 80), np.linspace(6.5, 15.0, 16)],
+                           0.2, range_m=(1.0, 245.0), mount_offset=(0.0, 0.0826, 0.0),
+                           description="128-channel spinning, non-uniform -25..+15 deg", range_noise_m=0.03),
+    "solid_state_120x25": sensor_model(np.linspace(-12.7, 12.7, 128), 0.2, fov_azimuth_deg=120.0, range_m=(0.5, 150.0),
+                                       description="forward-facing 120 x 25.4 deg raster", range_noise_m=0.03),
+}
+
+_RAY_TABLES = {}
+
+
+def register_sensor(name, model):
+    """Adds or replaces a model (a sensor_model dict) under name."""
+    SENSOR_MODELS[name] = model
+    _RAY_TABLES.pop(name, None)
+
+
+def get_sensor(name):
+    """The registered model dict; KeyError listing the known names otherwise."""
+    try:
+        return SENSOR_MODELS[name]
+    except KeyError:
+        raise KeyError(f"Unknown sensor model '{name}', known: {', '.join(sorted(SENSOR_MODELS))}") from None
+
+
+def model_fingerprint(name):
+    """Short hash of a model's definition (goes into scan cache keys and scan headers)."""
+    return hashlib.sha1(json.dumps(get_sensor(name), sort_keys=True).encode()).hexdigest()[:16]
+
+
+def angular_resolution(name):
+    """Finest angle (deg) between neighbouring rays of a model: its azimuth step or its closest channel spacing."""
+    model = get_sensor(name)
+    spacing = np.diff(model["elevations"])
+    return float(min(model["azimuth_step"], spacing.min() if len(spacing) else np.inf))
+
+
+def azimuths(model):
+    """Azimuth of every column (deg): -fov/2 + k * step, like range_scanner's rotating pattern."""
+    return -model["fov_azimuth"] / 2.0 + np.arange(int(model["fov_azimuth"] / model["azimuth_step"])) * model["azimuth_step"]
+
+
+def ray_table(name):
+    """
+    (directions (N,3), azimuth index, elevation index) of the model's full pattern in the scanner
+    frame, azimuth-major like raycast_utils.rotating_ray_chunk. Built on first use and cached;
+    the arrays are read-only because every scan of the process shares them.
+    """
+    model = get_sensor(name)
+    cached = _RAY_TABLES.get(name)
+    if cached is not None and cached[0] is model:
+        return cached[1]
+    with instrumentation.span("ray_table", sensor=name):
+        elevations = np.asarray(model["elevations"])
+        n_y = len(elevations)
+        k = np.arange(len(azimuths(model)) * n_y)
+        az_idx, el_idx = k // n_y, k % n_y
+        a = np.radians(azimuths(model)[az_idx])
+        e = np.radians(elevations[el_idx])
+        directions = np.stack([-np.cos(e) * np.sin(a), np.sin(e), -np.cos(e) * np.cos(a)], axis=1)
+    table = (directions, az_idx, el_idx)
+    for column in table:
+        column.flags.writeable = False
+    _RAY_TABLES[name] = (model, table)
+    log.debug(f"Ray table of '{name}': {len(directions)} rays")
+    return table
+
+
+def mounted_matrix(scanner_matrix, name):
+    """
+    World matrix of the model's optical centre on a scanner object: the mounting offset applied in
+    the scanner's rotated frame (the object's scale, e.g. the 0.15 lidar gizmo, is ignored).
+    """
+    model = get_sensor(name)
+    M = np.asarray(scanner_matrix, dtype=np.float64)
+    R = M[:3, :3] / np.linalg.norm(M[:3, :3], axis=0)
+    mount = mesh_utils.transform_matrix(model["mount_offset"], np.radians(model["mount_rotation"]))
+    mounted = np.identity(4)
+    mounted[:3, :3] = R @ mount[:3, :3]
+    mounted[:3, 3] = M[:3, 3] + R @ mount[:3, 3]
+    return mounted
+
+
+def scan_params(name):
+    """
+    Range and pattern parameters of a model in the DETAILED_SCAN_PARAMS layout. Headless scans only
+    use the range limits (the pattern comes from ray_table); for range_scanner, which only knows
+    symmetric uniform patterns, the pattern keys span the model's elevations at its finest channel
+    spacing (exact for "detailed", an approximation for every other model).
+    """
+    model = get_sensor(name)
+    elevations = np.asarray(model["elevations"])
+    spacing = np.diff(elevations)
+    y_step = float(spacing.min()) if len(spacing) else 1.0
+    return dict(raycast_utils.DETAILED_SCAN_PARAMS,
+                xStepDegree=model["azimuth_step"], fovX=model["fov_azimuth"],
+                yStepDegree=round(y_step, 6), fovY=round(2 * float(np.abs(elevations).max()), 6),
+                distanceLower=model["range"][0], distanceUpper=model["range"][1])
+
+
+def scan_sensor(scene, scanner_matrix, name, memory_budget_mb=None, batch_size=65536):
+    """raycast_utils.scan_rotating with the model's ray table, range limits and mounting offset."""
+    return raycast_utils.scan_rotating(scene, mounted_matrix(scanner_matrix, name), rays=ray_table(name),
+                                       batch_size=batch_size, memory_budget_mb=memory_budget_mb, **scan_params(name))
@@ -0,0 +1,265 @@
+#
+# FILE: surrogate_search.py
+#
+# Surrogate-guided placement search. Instead of scanning every point of a
+# dense plate lattice at every yaw, a Gaussian process is fitted to the
+# coverage scores of the scans done so far (features: lidar position in the
+# tug frame and the tug yaw on the unit circle). The next candidates to scan
+# are the ones with the largest expected improvement over the best score, and
+# the search stops once no candidate is predicted to improve it by more than
+# min_gain (relative to the best score).
+#
+#   result = surrogate_search.search(features, evaluate, max_scans=60)
+#   python scan_scheduler.py --manifest dense_manifest.jsonl --search surrogate --max-scans 60
+#
+import math
+import os
+import numpy as np
+
+import coverage_utils
+import raycast_utils
+import scan_io
+import instrumentation
+
+log = instrumentation.get_logger(__name__)
+
+# Kernel length scales tried when fitting: position (m) and yaw (chord of the unit circle, 0.5 ~ 29 deg).
+POSITION_SCALES = (0.15, 0.3, 0.6, 1.2)
+YAW_SCALES = (0.25, 0.5, 1.0, 2.0)
+# Noise levels (variance, in units of the score variance) tried when fitting.
+NOISE_LEVELS = (1e-3, 1e-2, 0.1)
+
+_erf = np.vectorize(math.erf, otypes=[float])
+
+
+def features(locations, yaws_deg):
+    """(N,5) candidate features: lidar location in the tug frame (m) and (cos, sin) of the tug yaw."""
+    locations = np.asarray(locations, dtype=np.float64).reshape(-1, 3)
+    yaws = np.radians(np.asarray(yaws_deg, dtype=np.float64).reshape(-1))
+    return np.column_stack([locations, np.cos(yaws), np.sin(yaws)])
+
+
+def job_features(jobs):
+    """features() of scan_scheduler jobs: their location brought back into the tug frame at yaw 0."""
+    locations = []
+    for job in jobs:
+        yaw = math.radians(job["yaw_deg"])
+        offset = np.asarray(job["location"], dtype=float) - np.asarray(job["tug_location"], dtype=float)
+        locations.append([math.cos(yaw) * offset[0] + math.sin(yaw) * offset[1], -math.sin(yaw) * offset[0] + math.cos(yaw) * offset[1], offset[2]])
+    return features(locations, [job["yaw_deg"] for job in jobs])
+
+
+def _kernel(A, B, length):
+    """Matern 5/2 kernel: coverage changes quickly with position near edges of the visible skin."""
+    r = np.sqrt(5.0 * (((A[:, None, :] - B[None, :, :]) / length) ** 2).sum(axis=2))
+    return (1.0 + r + r ** 2 / 3.0) * np.exp(-r)
+
+
+def _length(position_scale, yaw_scale):
+    return np.array([position_scale] * 3 + [yaw_scale] * 2)
+
+
+def fit_gp(X, y, noise=NOISE_LEVELS, position_scales=POSITION_SCALES, yaw_scales=YAW_SCALES):
+    """
+    Gaussian process (Matern 5/2 kernel) on standardized scores. The length scales and noise level are
+    the combination of position_scales x yaw_scales x noise with the highest log marginal likelihood.
+    """
+    X, y = np.asarray(X, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    if len(y) >= 4:
+        # Blocked positions (a lidar inside the tug scores ~0) would dominate the fit: only the high scores matter.
+        q1, q3 = np.percentile(y, [25, 75])
+        y = np.maximum(y, q1 - 1.5 * (q3 - q1))
+    y_mean, y_std = float(y.mean()), float(y.std()) or 1.0
+    z = (y - y_mean) / y_std
+    best = None
+    for p in position_scales:
+        for s in yaw_scales:
+            length = _length(p, s)
+            K = _kernel(X, X, length)
+            for n in np.atleast_1d(noise):
+                try:
+                    L = np.linalg.cholesky(K + n * np.identity(len(X)))
+                except np.linalg.LinAlgError:
+                    continue
+                alpha = np.linalg.solve(L.T, np.linalg.solve(L, z))
+                log_likelihood = -0.5 * z @ alpha - np.log(np.diag(L)).sum()
+                if best is None or log_likelihood > best["log_likelihood"]:
+                    best = {"X": X, "L": L, "alpha": alpha, "length": length, "noise": float(n), "log_likelihood": float(log_likelihood)}
+    if best is None:
+        raise np.linalg.LinAlgError("No length scale gave a positive definite kernel; increase noise.")
+    best.update(y_mean=y_mean, y_std=y_std)
+    return best
+
+
+def predict(gp, X):
+    """(mean, standard deviation) of the score at (M,5) features."""
+    k = _kernel(np.asarray(X, dtype=np.float64), gp["X"], gp["length"])
+    mean = k @ gp["alpha"]
+    v = np.linalg.solve(gp["L"], k.T)
+    var = np.maximum(1.0 - (v ** 2).sum(axis=0), 0.0)
+    return gp["y_mean"] + gp["y_std"] * mean, gp["y_std"] * np.sqrt(var)
+
+
+def expected_improvement(mean, std, best, xi=0.0):
+    """Expected gain over best of every candidate (same unit as the scores)."""
+    gain = mean - best - xi
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(std > 0, gain / std, 0.0)
+    cdf = 0.5 * (1.0 + _erf(z / math.sqrt(2.0)))
+    pdf = np.exp(-0.5 * z ** 2) / math.sqrt(2.0 * math.pi)
+    return np.where(std > 0, gain * cdf + std * pdf, np.maximum(gain, 0.0))
+
+
+def initial_design(X, n, exclude=(), iterations=10):
+    """
+    n representative candidates: k-means of the (standardized) candidate features, seeded by farthest-point
+    sampling, then the candidate nearest to every cluster centre. Unlike farthest-point sampling alone, which
+    only picks corners of the plates, this also samples their interior. exclude: candidates already scanned.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    scale = X.std(axis=0)
+    Z = X / np.where(scale > 0, scale, 1.0)
+    n = min(n, len(Z) - len(exclude))
+    if n <= 0:
+        return []
+    centres = [Z.mean(axis=0)] + [Z[int(i)] for i in exclude]
+    distance = np.min([((Z - c) ** 2).sum(axis=1) for c in centres], axis=0)
+    seeds = []
+    for _ in range(n):
+        seeds.append(int(np.argmax(distance)))
+        distance = np.minimum(distance, ((Z - Z[seeds[-1]]) ** 2).sum(axis=1))
+    centres = Z[seeds]
+    for _ in range(iterations):
+        label = np.argmin(((Z[:, None, :] - centres[None]) ** 2).sum(axis=2), axis=1)
+        centres = np.array([Z[label == k].mean(axis=0) if np.any(label == k) else centres[k] for k in range(n)])
+    free = np.setdiff1d(np.arange(len(Z)), np.asarray(exclude, dtype=np.int64))
+    picked = []
+    for c in centres:
+        order = free[np.argsort(((Z[free] - c) ** 2).sum(axis=1))]
+        picked.append(int(next(i for i in order if i not in picked)))
+    return picked
+
+
+def search(X, evaluate, n_initial=12, max_scans=60, min_gain=0.002, patience=3, batch_size=1, xi=0.0, observed=None):
+    """
+    Surrogate-guided maximization of a score over a finite candidate set.
+      X: (N,5) candidate features (features / job_features).
+      evaluate: callable(list of candidate indices) -> their scores (e.g. coverage fractions); it runs the scans.
+      n_initial: candidates scanned before the first fit (at least 1 unless observed has scores).
+      observed: {index: score} of candidates scanned earlier (a resumed search); they count towards max_scans.
+      batch_size: candidates picked per round (for parallel scanning): after each pick the model is told
+                  its predicted score ("kriging believer") so the batch spreads out.
+    Stops when the largest expected improvement drops below min_gain times the best score (a relative
+    gain: 0.002 stops once no candidate is expected to beat the best by 0.2%) in patience rounds in a row
+    (a model fitted to a handful of scans is often overconfident), after max_scans scans, or when every
+    candidate is scanned. Returns a dict: best (index), best_score, scores {index: score} in scan order,
+    rounds [(scans so far, best score, largest expected improvement)], stop (reason) and the final model.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    scores = dict(observed or {})
+    if not scores and (n_initial < 1 or max_scans < 1):
+        raise ValueError("search needs n_initial >= 1 and max_scans >= 1 when no scores are observed.")
+    first = initial_design(X, max(n_initial - len(scores), 0), exclude=list(scores))[:max(max_scans - len(scores), 0)]
+    if first:
+        with instrumentation.span("surrogate_initial", scans=len(first)):
+            scores.update(zip(first, (float(s) for s in evaluate(first))))
+    rounds, stop, gp, quiet = [], "max_scans", None, 0
+    while len(scores) < min(max_scans, len(X)):
+        done = np.fromiter(scores, dtype=np.int64)
+        y = np.array([scores[i] for i in done])
+        best = float(y.max())
+        with instrumentation.span("surrogate_fit", scans=len(done)):
+            gp = fit_gp(X[done], y)
+            open_ = np.setdiff1d(np.arange(len(X)), done)
+            mean, std = predict(gp, X[open_])
+            ei = expected_improvement(mean, std, best, xi)
+        rounds.append((len(done), best, float(ei.max())))
+        log.debug(f"Surrogate round {len(rounds)}: {len(done)} scans, best {best:.4f}, largest expected gain {ei.max():.5f}")
+        quiet = quiet + 1 if ei.max() < min_gain * abs(best) else 0
+        if quiet >= patience:
+            stop = "min_gain"
+            break
+        batch, believed = [], (gp, done, y)
+        for _ in range(min(batch_size, max_scans - len(done), len(open_))):
+            k = int(np.argmax(ei))
+            batch.append(int(open_[k]))
+            ei[k] = -np.inf
+            if len(batch) < batch_size:
+                _, d, yb = believed
+                d, yb = np.r_[d, open_[k]], np.r_[yb, mean[k]]
+                believed = (fit_gp(X[d], yb, gp["noise"], gp["length"][:1], gp["length"][3:4]), d, yb)
+                m, s = predict(believed[0], X[open_])
+                ei = np.where(np.isfinite(ei), expected_improvement(m, s, best, xi), -np.inf)
+        with instrumentation.span("surrogate_scan", scans=len(batch)):
+            scores.update(zip(batch, (float(s) for s in evaluate(batch))))
+    else:
+        stop = "exhausted" if len(scores) >= len(X) else "max_scans"
+    best_index = max(scores, key=scores.get)
+    log.info(f"Surrogate search: {len(scores)} of {len(X)} candidates scanned ({stop}), best {best_index} at {scores[best_index]:.4f}")
+    return {"best": best_index, "best_score": scores[best_index], "scores": scores, "rounds": rounds, "stop": stop, "model": gp}
+
+
+# --- scan_scheduler jobs ------------------------------------------------------
+
+def score_output(model, path, job, region=None, target="a3320_ceo", scene_spec=None):
+    """
+    Coverage score of a job's exported scan (.lscan or CSV): overall or one region's covered fraction.
+    The aircraft is placed like the scheduler's workers place it (scan_scheduler.aircraft_matrix).
+    """
+    import scan_scheduler
+
+    matrix = scan_scheduler.aircraft_matrix(job, scene_spec)
+    if path.endswith(scan_io.EXTENSION):
+        header, columns = scan_io.read_scan(path)
+        score = coverage_utils.score_lscan(model, header, columns, target, matrix)
+    else:
+        score = coverage_utils.score_scan(model, raycast_utils.read_csv(path), matrix, target)
+    return score["coverage"] if region is None else score["regions"][region]["coverage"]
+
+
+def search_jobs(jobs, output_dir, scene_spec, workers=None, n_initial=12, max_scans=60, min_gain=0.002,
+                voxel_size=0.1, region=None, catalog=True):
+    """
+    Surrogate search over a dense scan_scheduler manifest (headless backend): only the jobs the search
+    picks are scanned, batch_size = workers at a time. Scans finished earlier (completed.jsonl with their
+    files still in output_dir) are scored and seed the model, so a killed search resumes.
+    Returns the search() result with best_job (the winning job) added.
+    """
+    import scan_scheduler
+    import scan_catalog
+    from concurrent.futures import ProcessPoolExecutor
+
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    model = coverage_utils.load_aircraft_model(scene_spec["aircraft_mesh"], voxel_size, lod=scene_spec.get("lod", False))
+    completed_path = os.path.join(output_dir, "completed.jsonl")
+    outputs = {}
+    if os.path.exists(completed_path):
+        outputs = {r["job_id"]: r["output"] for r in scan_scheduler.load_manifest(completed_path) if os.path.exists(r.get("output", ""))}
+    observed = {i: score_output(model, outputs[job["job_id"]], job, region, scene_spec=scene_spec) for i, job in enumerate(jobs) if job["job_id"] in outputs}
+    catalog_path = os.path.join(output_dir, scan_catalog.CATALOG_NAME) if catalog is True else catalog or None
+    opened = scan_catalog.ScanCatalog(catalog_path) if catalog_path else None
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=scan_scheduler._init_headless_worker, initargs=(scene_spec,)) as pool:
+        def evaluate(indices):
+            results = list(pool.map(scan_scheduler._run_headless_job, [jobs[i] for i in indices], [output_dir] * len(indices)))
+            scores = []
+            for i, result in zip(indices, results):
+                if opened is not None:
+                    opened.record(scan_scheduler.result_metadata(jobs[i], result), result["summary"], path=result["output"], seconds=result["seconds"],
+                                  peak_mb=result["peak_mb"], backend="headless")
+                scan_scheduler.record_completed(completed_path, result)
+                scores.append(score_output(model, result["output"], jobs[i], region, scene_spec=scene_spec))
+                log.info(f"[{len(observed) + len(scores)}] {jobs[i]['output_name']}: coverage {scores[-1]:.4f}")
+            observed.update(zip(indices, scores))
+            return scores
+
+        try:
+            result = search(job_features(jobs), evaluate, n_initial, max_scans, min_gain, batch_size=workers, observed=dict(observed))
+        finally:
+            if opened is not None:
+                opened.close()
+    result["best_job"] = jobs[result["best"]]
+    log.info(f"Best of {len(result['scores'])}/{len(jobs)} scans: {result['best_job']['output_name']} "
+          f"(coverage {result['best_score']:.4f}, stopped: {result['stop']})")
+    return result
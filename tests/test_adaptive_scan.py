@@ -0,0 +1,58 @@
+#
+# FILE: tests/test_adaptive_scan.py
+#
+import numpy as np
+import pytest
+
+import adaptive_scan
+import mesh_utils
+import raycast_utils
+
+PARAMS = dict(xStepDegree=1.0, fovX=360.0, yStepDegree=1.0, fovY=180.0)
+
+
+def box(size):
+    """Triangulated axis-aligned box centred on the origin."""
+    h = np.asarray(size, dtype=np.float64) / 2.0
+    vertices = np.array([[x, y, z] for x in (-h[0], h[0]) for y in (-h[1], h[1]) for z in (-h[2], h[2])])
+    quads = [(0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1), (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)]
+    return vertices, np.array([t for a, b, c, d in quads for t in ((a, b, c), (a, c, d))])
+
+
+def scene():
+    aircraft = box((4.0, 3.0, 1.5))
+    tug = box((1.0, 1.0, 0.5))
+    return raycast_utils.build_instanced_scene([
+        ("a3320_ceo", *aircraft, mesh_utils.transform_matrix((6.0, 1.0, 0.5))),
+        ("Tug_t5", *tug, mesh_utils.transform_matrix((-2.0, 0.0, 0.0))),
+    ] + mesh_utils.boundary_walls())
+
+
+def target_hits(scan, name="a3320_ceo"):
+    keep = np.asarray(scan["names"])[scan["categoryID"]] == name
+    return {key: np.asarray(scan[key])[keep] for key in ("X", "Y", "Z", "distance", "azimuthIndex", "elevationIndex")}
+
+
+@pytest.mark.parametrize("refine", [False, True])
+def test_targeted_scan_keeps_every_target_hit_of_the_full_scan(refine):
+    s = scene()
+    scanner = mesh_utils.transform_matrix((0.0, 0.0, 1.0), (np.pi / 2, 0.0, np.pi / 2))
+    full = raycast_utils.scan_rotating(s, scanner, **PARAMS)
+
+    targeted, stats = adaptive_scan.scan_targeted(s, scanner, ["a3320_ceo"], refine=refine, **PARAMS)
+
+    expected, got = target_hits(full), target_hits(targeted)
+    assert len(expected["X"]) > 100
+    for key in expected:
+        np.testing.assert_array_equal(got[key], expected[key])
+    assert stats["rays"] == 360 * 180
+    assert stats["traced"] < 0.05 * stats["rays"]
+
+
+def test_unknown_target_traces_nothing(caplog):
+    s = scene()
+
+    targeted, stats = adaptive_scan.scan_targeted(s, np.identity(4), ["no_such_object"], **PARAMS)
+
+    assert len(targeted["X"]) == 0 and stats["traced"] == 0
+    assert "no_such_object" in caplog.text
@@ -0,0 +1,82 @@
+#
+# FILE: tests/test_alignment_utils.py
+#
+import math
+import numpy as np
+import pytest
+
+import alignment_utils
+import urdf_utils
+
+TUG = """<?xml version="1.0"?>
+<robot name="tug">
+  <link name="base"/>
+  <link name="caster"/>
+  <joint name="base_caster" type="fixed">
+    <parent link="base"/><child link="caster"/><origin xyz="1.5 0 0.2" rpy="0 0 0"/>
+  </joint>
+</robot>
+"""
+
+AIRCRAFT = """<?xml version="1.0"?>
+<robot name="aircraft">
+  <link name="fuselage"/>
+  <link name="towbar"/>
+  <joint name="fuselage_towbar" type="fixed">
+    <parent link="fuselage"/><child link="towbar"/><origin xyz="-4 0 -1" rpy="0 0 0"/>
+  </joint>
+</robot>
+"""
+
+
+def load_models(tmp_path):
+    (tmp_path / "tug.urdf").write_text(TUG)
+    (tmp_path / "aircraft.urdf").write_text(AIRCRAFT)
+    return urdf_utils.load_urdf(str(tmp_path / "tug.urdf")), urdf_utils.load_urdf(str(tmp_path / "aircraft.urdf"))
+
+
+def towbar_world(alignment, k):
+    return (alignment["aircraft_matrix"][k] @ np.array([-4.0, 0.0, -1.0, 1.0]))[:3]
+
+
+def test_towbar_sits_on_the_caster_at_every_yaw(tmp_path):
+    tug, aircraft = load_models(tmp_path)
+    yaws = [0.0, 45.0, 90.0, 210.0]
+
+    alignment = alignment_utils.align_aircraft(tug, aircraft, yaws, tug_location=(2, 3, 0))
+
+    for k, yaw in enumerate(yaws):
+        caster = np.array([2 + 1.5 * math.cos(math.radians(yaw)), 3 + 1.5 * math.sin(math.radians(yaw)), 0.2])
+        np.testing.assert_allclose(alignment["hitch"][k], caster, atol=1e-12)
+        np.testing.assert_allclose(towbar_world(alignment, k), caster, atol=1e-12)
+    # Without a tow-bar angle the aircraft keeps its rotation and only translates.
+    np.testing.assert_allclose(alignment["aircraft_matrix"][:, :3, :3], np.tile(np.identity(3), (4, 1, 1)), atol=1e-12)
+    np.testing.assert_allclose(alignment["aircraft_location"][0], (3.5 + 4, 3, 1.2), atol=1e-12)
+
+
+def test_towbar_angle_turns_the_aircraft_about_the_hitch(tmp_path):
+    tug, aircraft = load_models(tmp_path)
+
+    alignment = alignment_utils.align_aircraft(tug, aircraft, [30.0, 30.0], towbar_deg=[0.0, 20.0])
+
+    np.testing.assert_allclose(towbar_world(alignment, 1), alignment["hitch"][1], atol=1e-12)
+    assert alignment["aircraft_rotation"][1, 2] == pytest.approx(math.radians(20.0))
+    expected = urdf_utils.rpy_matrices(alignment["aircraft_rotation"][1:])[0]
+    np.testing.assert_allclose(alignment["aircraft_matrix"][1, :3, :3], expected, atol=1e-12)
+
+
+def test_sweep_and_lookup(tmp_path):
+    tug, aircraft = load_models(tmp_path)
+    yaws, towbar = alignment_utils.sweep(0, 90, 30, towbar_deg=(0.0, 10.0))
+    assert list(zip(yaws, towbar)) == [(0, 0), (0, 10), (30, 0), (30, 10), (60, 0), (60, 10)]
+
+    alignment = alignment_utils.align_aircraft(tug, aircraft, [0.0, 0.5, 90.0])
+    lookup = alignment_utils.alignment_lookup(alignment)
+    assert list(lookup) == [0.0, 0.5, 90.0]
+    np.testing.assert_allclose(lookup[90.0], alignment["aircraft_location"][2])
+
+
+def test_unknown_link_is_rejected(tmp_path):
+    tug, aircraft = load_models(tmp_path)
+    with pytest.raises(ValueError):
+        alignment_utils.align_aircraft(tug, aircraft, [0.0], tug_link="hook")
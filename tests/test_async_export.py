@@ -0,0 +1,76 @@
+#
+# FILE: tests/test_async_export.py
+#
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+
+import async_export
+import file_utils
+import raycast_utils
+import scan_io
+
+
+def dead_pid():
+    """PID of a process that has exited."""
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def touch(directory, name, age=0.0):
+    path = os.path.join(directory, name)
+    with open(path, "wb") as f:
+        f.write(b"partial")
+    if age:
+        os.utime(path, (time.time() - age, time.time() - age))
+    return path
+
+
+def test_remove_stale_temp(tmp_path):
+    d = str(tmp_path)
+    host, dead, alive = file_utils.HOST, dead_pid(), os.getpid()
+    removed = {
+        touch(d, f"a.lscan.{host}-{dead}.tmp"),                  # local writer gone
+        touch(d, f"b.csv.{host}-{dead}-123.tmp"),                # write_atomic of a dead thread pool
+        touch(d, f".c.{host}-{dead}.tmp.csv"),                   # scheduler CSV temp
+        touch(d, f"d.lscan.{host}-{dead}.tmp.x"),                # stream spill
+        touch(d, f"e.lscan.otherhost-{alive}.tmp", age=2 * 24 * 3600),
+    }
+    kept = {
+        touch(d, f"f.lscan.{host}-{alive}.tmp"),                 # this process is writing it
+        touch(d, f"g.lscan.otherhost-{dead}.tmp"),               # PID of another machine: cannot be checked
+        touch(d, f"h.lscan.{dead}.tmp"),                         # old name without host
+        touch(d, "yaw_045_top_scan_001.lscan"),
+    }
+
+    assert set(async_export.remove_stale_temp(d)) == removed
+    assert set(os.path.join(d, n) for n in os.listdir(d)) == kept
+
+
+def test_temp_names_match_the_cleanup_pattern():
+    match = async_export.TEMP_NAME.search(f"x.lscan.{file_utils.temp_tag()}-77.tmp")
+
+    assert match[1] == file_utils.HOST
+    assert int(match[2]) == os.getpid()
+
+
+def test_writer_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 100
+    scan = {"X": rng.normal(size=n), "Y": rng.normal(size=n), "Z": rng.normal(size=n), "distance": rng.uniform(1, 5, n),
+            "intensity": rng.uniform(0, 1, n), "categoryID": np.zeros(n, dtype=np.int64), "partID": np.zeros(n, dtype=np.int64),
+            "names": ["a3320_ceo"]}
+    with async_export.ScanWriter(workers=2, max_pending=2, compress="gzip") as writer:
+        binary = writer.submit(scan, str(tmp_path), "scan", "binary", {"index": 1})
+        text = writer.submit(scan, str(tmp_path), "scan", "csv")
+        writer.flush()
+
+    assert binary.result().endswith(".lscan.gz") and text.result().endswith(".csv.gz")
+    header, columns = scan_io.read_scan(binary.result())
+    assert header["metadata"] == {"index": 1}
+    np.testing.assert_allclose(columns["x"], scan["X"].astype(np.float32))
+    np.testing.assert_allclose(raycast_utils.read_csv(text.result())["distance"], scan["distance"], atol=1e-6)
+    assert not [name for name in os.listdir(tmp_path) if ".tmp" in name]
@@ -0,0 +1,38 @@
+#
+# FILE: tests/test_benchmarks.py
+#
+import json
+
+import benchmarks
+
+
+def test_regressions_compare_with_the_best_run_on_this_machine():
+    history = [
+        {"machine": "m", "quick": False, "results": {"a": {"median": 1.0}, "b": {"median": 2.0}}},
+        {"machine": "m", "quick": False, "results": {"a": {"median": 0.8}, "b": {"skipped": "no mesh"}}},
+        {"machine": "other", "quick": False, "results": {"a": {"median": 0.1}}},
+        {"machine": "m", "quick": True, "results": {"a": {"median": 0.2}}},
+    ]
+    results = {"a": {"median": 1.1}, "b": {"median": 2.1}, "c": {"median": 5.0}, "d": {"skipped": "no mesh"}}
+
+    assert benchmarks.regressions(results, history, "m", False, 1.25) == [("a", 1.1, 0.8)]
+    assert benchmarks.regressions(results, history, "m", False, 1.5) == []
+
+
+def test_main_records_history_and_flags_regressions(tmp_path):
+    history = tmp_path / "history.jsonl"
+    argv = ["--only", "sampling.grid", "--repeat", "1", "--history", str(history)]
+
+    assert benchmarks.main(argv) == 0
+    entry = json.loads(history.read_text())
+    assert list(entry["results"]) == ["sampling.grid_1cm"] and entry["regressions"] == []
+
+    entry["results"]["sampling.grid_1cm"]["median"] = 1e-9  # an impossibly fast earlier run
+    history.write_text(json.dumps(entry) + "\n")
+    assert benchmarks.main(argv + ["--no-record"]) == 1
+    assert len(history.read_text().splitlines()) == 1
+
+
+def test_core_modules_import_without_blender():
+    setup = next(fn for name, _, fn in benchmarks.BENCHMARKS if name == "startup.core_imports")
+    setup({})()  # raises CalledProcessError when a core module imports bpy
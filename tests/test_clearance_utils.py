@@ -0,0 +1,67 @@
+#
+# FILE: tests/test_clearance_utils.py
+#
+import numpy as np
+
+import clearance_utils
+import mesh_utils
+
+
+def box(size):
+    """Triangulated axis-aligned box centred on the origin."""
+    h = np.asarray(size, dtype=np.float64) / 2.0
+    vertices = np.array([[x, y, z] for x in (-h[0], h[0]) for y in (-h[1], h[1]) for z in (-h[2], h[2])])
+    quads = [(0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1), (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)]
+    return vertices, np.array([t for a, b, c, d in quads for t in ((a, b, c), (a, c, d))])
+
+
+def checker(**kwargs):
+    """A 0.5 m tug cube (plus a plate on top) against a 4 x 2 x 2 m aircraft box at the origin."""
+    tug, plate = box((0.5, 0.5, 0.5)), box((0.3, 0.3, 0.02))
+    parts = [("Tug_t5", *tug, np.identity(4)), ("plate", *plate, mesh_utils.transform_matrix((0, 0, 0.26)))]
+    return clearance_utils.ClearanceChecker(parts, *box((4.0, 2.0, 2.0)), **kwargs)
+
+
+def tug_at(x):
+    return mesh_utils.transform_matrix((x, 0.0, 0.0))
+
+
+def test_distances_follow_the_gap():
+    c = checker()
+    gaps = np.array([1.0, 0.10, 0.04, -0.05])  # tug face to aircraft face along +x
+
+    result = c.check(np.stack([tug_at(2.25 + g) for g in gaps]), np.identity(4), clearance=0.05)
+
+    assert result["min_distance"][0] == c.band and result["closest_part"][0] == -1
+    np.testing.assert_allclose(result["min_distance"][1:], gaps[1:], atol=c.voxel_size / 2)
+    assert result["feasible"].tolist() == [True, True, False, False]
+    assert c.part_names[result["closest_part"][1]] == "Tug_t5"
+
+
+def test_aircraft_pose_is_applied():
+    c = checker()
+    aircraft = mesh_utils.transform_matrix((0.0, 0.0, 5.0))
+
+    result = c.check(np.stack([tug_at(2.35), mesh_utils.transform_matrix((2.35, 0.0, 5.0))]), aircraft)
+
+    assert result["feasible"].tolist() == [True, True]
+    assert result["min_distance"][0] == c.band
+    assert result["min_distance"][1] < c.band
+
+
+def test_excluded_region_is_ignored():
+    c = checker(exclude=[((1.8, -0.5, -0.5), (2.2, 0.5, 0.5))])
+
+    result = c.check(tug_at(2.25)[None], np.identity(4))  # touching, but inside the cradle box
+
+    assert result["feasible"][0]
+
+
+def test_feasible_yaws_drops_colliding_orientations():
+    alignment = {"yaw_deg": np.array([0.0, 90.0]), "tug_matrix": np.stack([tug_at(3.0), tug_at(2.2)]),
+                 "aircraft_matrix": np.tile(np.identity(4), (2, 1, 1))}
+
+    feasible, result = clearance_utils.feasible_yaws(checker(), alignment, 0.05)
+
+    assert list(feasible) == [0.0]
+    assert result["min_distance"][1] < 0
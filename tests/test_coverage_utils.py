@@ -0,0 +1,77 @@
+#
+# FILE: tests/test_coverage_utils.py
+#
+import logging
+import numpy as np
+
+import coverage_utils
+import mesh_utils
+import scan_io
+
+
+def plate_model():
+    """Voxel model of a 2 x 1 m plate in the z = 0 plane."""
+    vertices = np.array([[0, 0, 0], [2, 0, 0], [2, 1, 0], [0, 1, 0]], dtype=np.float64)
+    faces = np.array([[0, 1, 2], [0, 2, 3]])
+    return vertices, coverage_utils.voxelize_aircraft(vertices, faces, voxel_size=0.1)
+
+
+def plate_scan(points, names=("Tug_t5", "a3320_ceo"), object_id=1):
+    n = len(points)
+    return {"X": points[:, 0], "Y": points[:, 1], "Z": points[:, 2], "distance": np.full(n, 5.0),
+            "intensity": np.ones(n), "categoryID": np.full(n, object_id), "names": list(names)}
+
+
+def grid(x_max, y_max, step=0.05):
+    x, y = np.meshgrid(np.arange(step / 2, x_max, step), np.arange(step / 2, y_max, step))
+    return np.stack([x.ravel(), y.ravel(), np.zeros(x.size)], axis=1)
+
+
+def test_half_plate_scores_half():
+    _, model = plate_model()
+
+    half = coverage_utils.score_scan(model, plate_scan(grid(1.0, 1.0)))
+    full = coverage_utils.score_scan(model, plate_scan(grid(2.0, 1.0)))
+
+    assert abs(half["coverage"] / full["coverage"] - 0.5) < 0.05
+    assert half["hits"] == len(grid(1.0, 1.0))
+
+
+def test_scan_without_target_scores_zero(caplog):
+    _, model = plate_model()
+    scan = plate_scan(grid(2.0, 1.0), names=("Tug_t5", "ground"))
+
+    with caplog.at_level(logging.WARNING):
+        score = coverage_utils.score_scan(model, scan)
+
+    assert score["coverage"] == 0.0
+    assert "a3320_ceo" in caplog.text
+
+
+def test_other_objects_hits_are_ignored():
+    _, model = plate_model()
+
+    score = coverage_utils.score_scan(model, plate_scan(grid(2.0, 1.0), object_id=0))
+
+    assert score["coverage"] == 0.0
+
+
+def test_lscan_uses_the_recorded_aircraft_pose(tmp_path):
+    _, model = plate_model()
+    pose = mesh_utils.transform_matrix((10, -3, 1), (0, 0, np.pi / 2), (1, 1, 1))
+    local = grid(2.0, 1.0)
+    world = local @ pose[:3, :3].T + pose[:3, 3]
+    scan = plate_scan(world)
+
+    moved = scan_io.write_scan(scan, str(tmp_path), "moved", {"aircraft_location": [10, -3, 1], "aircraft_matrix": pose.tolist()})
+    located = scan_io.write_scan(scan, str(tmp_path), "located", {"aircraft_location": [10, -3, 1]})
+
+    full = coverage_utils.score_lscan(model, *scan_io.read_scan(moved))
+    translated = coverage_utils.score_lscan(model, *scan_io.read_scan(located))
+    explicit = coverage_utils.score_lscan(model, *scan_io.read_scan(located), aircraft_matrix=pose)
+
+    unmoved = coverage_utils.score_scan(model, plate_scan(local))
+    assert abs(full["coverage"] - unmoved["coverage"]) < 0.01
+    assert explicit["coverage"] == full["coverage"]
+    assert translated["coverage"] < full["coverage"]
+    assert coverage_utils.score_scan(model, scan, pose)["coverage"] == full["coverage"]
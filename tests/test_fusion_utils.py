@@ -0,0 +1,60 @@
+#
+# FILE: tests/test_fusion_utils.py
+#
+import json
+import os
+import time
+import numpy as np
+
+import fusion_utils
+import raycast_utils
+import scan_io
+
+
+def make_scan(n, seed):
+    rng = np.random.default_rng(seed)
+    return {"X": rng.uniform(0, 2, n), "Y": rng.uniform(0, 2, n), "Z": rng.uniform(0, 2, n),
+            "distance": rng.uniform(1, 10, n), "intensity": np.ones(n), "categoryID": rng.integers(0, 2, n),
+            "partID": np.zeros(n, dtype=np.int64), "names": ["Tug_t5", "a3320_ceo"]}
+
+
+def test_fusion_matches_direct_voxel_statistics():
+    scans = [make_scan(3000, seed) for seed in range(3)]
+    fusion = fusion_utils.VoxelFusion(voxel_size=0.25, merge_rows=2000)
+    for k, scan in enumerate(scans):
+        fusion.add_scan(scan, f"s{k}")
+    fused = fusion.result()
+
+    points = np.concatenate([np.stack([s["X"], s["Y"], s["Z"]], axis=1) for s in scans])
+    distance = np.concatenate([s["distance"] for s in scans])
+    ijk = np.floor(points / 0.25).astype(np.int64)
+    keys, inverse, counts = np.unique(fusion_utils.pack_voxels(ijk), return_inverse=True, return_counts=True)
+    np.testing.assert_array_equal(fused["key"], keys)
+    np.testing.assert_array_equal(fused["count"], counts)
+    np.testing.assert_array_equal(fused["ijk"], fusion_utils.unpack_voxels(keys))
+    sums = np.stack([np.bincount(inverse, points[:, i]) for i in range(3)], axis=1)
+    np.testing.assert_allclose(fused["centroid"], sums / counts[:, None], rtol=1e-6)
+    min_distance = np.full(len(keys), np.inf)
+    np.minimum.at(min_distance, inverse, distance)
+    np.testing.assert_allclose(fused["min_distance"], min_distance, rtol=1e-6)
+    assert fused["n_sensors"].max() == 3
+
+
+def test_scan_files_ignore_leftovers(tmp_path):
+    d = str(tmp_path)
+    raycast_utils.write_csv(make_scan(10, 0), d, "yaw_045_top_scan_000")  # earlier CSV run
+    old = os.path.join(d, "yaw_045_top_scan_000.csv")
+    os.utime(old, (time.time() - 60, time.time() - 60))
+    new = scan_io.write_scan(make_scan(10, 1), d, "yaw_045_top_scan_000")
+    side = scan_io.write_scan(make_scan(10, 2), d, "yaw_045_side_scan_001")
+    scan_io.write_scan(make_scan(10, 3), d, "yaw_045_fused")
+    scan_io.write_scan(make_scan(10, 4), d, "yaw_-10_top_scan_000")
+
+    assert fusion_utils._scan_files(d, "yaw_045") == [
+        ("yaw_045_side_scan_001", side), ("yaw_045_top_scan_000", new)]
+    assert fusion_utils._scan_files(d, "yaw_045", "top") == [("yaw_045_top_scan_000", new)]
+    assert [name for name, _ in fusion_utils._scan_files(d)][0] == "yaw_-10_top_scan_000"
+
+    with open(os.path.join(d, "completed.jsonl"), "w") as f:
+        f.write(json.dumps({"job_id": "a", "output": side}) + "\n")
+    assert fusion_utils._scan_files(d) == [("yaw_045_side_scan_001", side)]
@@ -0,0 +1,81 @@
+#
+# FILE: tests/test_instrumentation.py
+#
+import io
+import json
+import logging
+import numpy as np
+import pytest
+
+import instrumentation
+
+
+@pytest.fixture
+def recording():
+    """configure(trace=True) for one test; the pipeline logger and span state are restored afterwards."""
+    root = logging.getLogger(instrumentation.ROOT_LOGGER)
+    saved = (root.level, list(root.handlers), root.propagate, dict(instrumentation._STATE))
+    stream = io.StringIO()
+    instrumentation.configure("DEBUG", trace=True, stream=stream)
+    yield stream
+    root.setLevel(saved[0])
+    root.handlers[:] = saved[1]
+    root.propagate = saved[2]
+    instrumentation._STATE.update(saved[3])
+
+
+def test_spans_nest_and_record_errors(recording):
+    with instrumentation.span("outer", yaw=45) as outer:
+        with instrumentation.span("inner"):
+            pass
+        outer.set(points=np.array([1, 2]))
+    with pytest.raises(KeyError):
+        with instrumentation.span("failing"):
+            raise KeyError("x")
+
+    events = {e["name"]: e for e in instrumentation.events()}
+    assert [e["name"] for e in instrumentation.events()] == ["inner", "outer", "failing"]
+    assert (events["outer"]["depth"], events["inner"]["depth"]) == (0, 1)
+    assert events["outer"]["start"] <= events["inner"]["start"]
+    assert events["outer"]["duration"] >= events["inner"]["duration"]
+    assert events["failing"]["metadata"] == {"error": "KeyError"}
+    assert "outer" in recording.getvalue()
+
+
+def test_traced_decorator_and_summary(recording):
+    @instrumentation.traced()
+    def step(x):
+        return x * 2
+
+    assert [step(i) for i in range(3)] == [0, 2, 4]
+    stats = instrumentation.summary()
+    assert stats["step"]["count"] == 3
+    assert stats["step"]["mean"] == pytest.approx(stats["step"]["total"] / 3)
+    assert "step" in instrumentation.summary_table()
+
+
+def test_run_report_writes_a_chrome_trace(recording, tmp_path):
+    with instrumentation.span("scan", matrix=np.identity(2), surface="top"):
+        pass
+
+    path = instrumentation.write_run_report(str(tmp_path), "run")
+
+    trace = json.load(open(path))["traceEvents"]
+    assert trace[0]["name"] == "scan" and trace[0]["ph"] == "X"
+    assert trace[0]["args"] == {"matrix": [[1.0, 0.0], [0.0, 1.0]], "surface": "top"}
+    assert json.load(open(tmp_path / "run_summary.json"))["scan"]["count"] == 1
+
+
+def test_spans_are_free_when_recording_is_off():
+    if instrumentation.enabled():
+        pytest.skip("recording was turned on outside the tests")
+    assert instrumentation.span("a") is instrumentation.span("b")
+    with instrumentation.span("a") as span:
+        span.set(ignored=True)
+
+
+def test_peak_memory_measures_the_block():
+    with instrumentation.peak_memory() as memory:
+        block = np.ones(2 ** 20)
+        del block
+    assert memory.peak_bytes >= 8 * 2 ** 20
@@ -0,0 +1,80 @@
+#
+# FILE: tests/test_labeling_utils.py
+#
+import logging
+import math
+import numpy as np
+
+import labeling_utils
+import mesh_utils
+import scan_io
+import urdf_utils
+
+PLANE = """<?xml version="1.0"?>
+<robot name="plane">
+  <link name="body">
+    <collision><geometry><box size="4 2 2"/></geometry></collision>
+  </link>
+  <link name="wheel">
+    <collision><origin xyz="0 0 0" rpy="1.5707963 0 0"/><geometry><cylinder radius="0.5" length="0.4"/></geometry></collision>
+  </link>
+  <link name="towbar"/>
+  <joint name="body_wheel" type="fixed">
+    <parent link="body"/><child link="wheel"/><origin xyz="1 0 -1" rpy="0 0 0"/>
+  </joint>
+  <joint name="body_towbar" type="fixed">
+    <parent link="body"/><child link="towbar"/><origin xyz="3 0 0" rpy="0 0 0"/>
+  </joint>
+</robot>
+"""
+
+
+def load_plane(tmp_path):
+    path = tmp_path / "plane.urdf"
+    path.write_text(PLANE)
+    model = urdf_utils.load_urdf(str(path))
+    return model, labeling_utils.link_volumes(model, point_radius=0.3)
+
+
+def test_smallest_volume_wins(tmp_path):
+    model, volumes = load_plane(tmp_path)
+    placed = labeling_utils.world_volumes(volumes, urdf_utils.link_positions(model))
+    points = [[0, 0, 0], [1, 0, -1.2], [3.1, 0, 0], [1, 0.6, -1.4], [10, 0, 0]]
+
+    labels = labeling_utils.label_points(placed, points, margin=0.0)
+
+    names = [None if i < 0 else volumes["link_names"][i] for i in labels]
+    assert names == ["body", "wheel", "towbar", None, None]
+
+
+def scan_of(points, names, object_id):
+    points = np.asarray(points, dtype=np.float64)
+    n = len(points)
+    return {"X": points[:, 0], "Y": points[:, 1], "Z": points[:, 2], "distance": np.ones(n), "intensity": np.ones(n),
+            "categoryID": np.full(n, object_id), "names": names}
+
+
+def test_scan_without_target_labels_nothing(tmp_path, caplog):
+    model, volumes = load_plane(tmp_path)
+    placed = labeling_utils.world_volumes(volumes, urdf_utils.link_positions(model))
+    scan = scan_of([[0, 0, 0], [1, 0, -1.2]], ["Tug_t5", "wall_0"], 0)
+
+    with caplog.at_level(logging.WARNING):
+        labels = labeling_utils.label_scan(placed, scan)
+
+    assert labels.tolist() == [-1, -1]
+    assert "a3320_ceo" in caplog.text
+    assert labeling_utils.label_scan(placed, scan_of([[0, 0, 0]], ["Tug_t5", "a3320_ceo"], 1)).tolist() == [0]
+
+
+def test_placement_hits_use_the_recorded_aircraft_pose(tmp_path):
+    model, volumes = load_plane(tmp_path)
+    pose = mesh_utils.transform_matrix((20, 5, 0), (0, 0, math.pi / 2))
+    local = np.array([[1, 0, -1.2], [3.1, 0, 0], [0, 0.5, 0.5]])
+    world = local @ pose[:3, :3].T + pose[:3, 3]
+    scan = scan_of(world, ["a3320_ceo"], 0)
+    path = scan_io.write_scan(scan, str(tmp_path), "rotated", {"aircraft_location": [20, 5, 0], "aircraft_matrix": pose.tolist()})
+
+    hits = labeling_utils.placement_link_hits(model, volumes, {"rotated": scan_io.read_scan(path)}, margin=0.0)
+
+    assert hits == {"rotated": {"body": 1, "wheel": 1, "towbar": 1}}
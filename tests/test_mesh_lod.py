@@ -0,0 +1,75 @@
+#
+# FILE: tests/test_mesh_lod.py
+#
+import numpy as np
+import pytest
+
+import mesh_lod
+import mesh_utils
+
+
+def uv_sphere(radius=1.0, n_lat=40, n_lon=80):
+    lat = np.linspace(0, np.pi, n_lat + 1)[1:-1]
+    lon = np.linspace(0, 2 * np.pi, n_lon, endpoint=False)
+    ring = np.stack([np.outer(np.sin(lat), np.cos(lon)), np.outer(np.sin(lat), np.sin(lon)),
+                     np.repeat(np.cos(lat)[:, None], n_lon, axis=1)], axis=2).reshape(-1, 3)
+    vertices = radius * np.vstack([[0, 0, 1], ring, [0, 0, -1]])
+    index = 1 + np.arange(len(ring)).reshape(len(lat), n_lon)
+    right = np.roll(index, -1, axis=1)
+    faces = [np.stack([np.zeros(n_lon, int), index[0], right[0]], axis=1),
+             np.stack([np.full(n_lon, len(vertices) - 1), right[-1], index[-1]], axis=1)]
+    for i in range(len(lat) - 1):
+        faces += [np.stack([index[i], index[i + 1], right[i]], axis=1), np.stack([right[i], index[i + 1], right[i + 1]], axis=1)]
+    return vertices, np.concatenate(faces)
+
+
+def nearest(points, reference):
+    return np.sqrt(((points[:, None] - reference[None]) ** 2).sum(axis=2)).min(axis=1)
+
+
+@pytest.mark.parametrize("max_error", [0.01, 0.03, 0.1])
+def test_simplify_displacement_within_max_error(max_error):
+    vertices, faces = uv_sphere()
+
+    v, f, error = mesh_lod.simplify(vertices, faces, max_error)
+
+    assert error <= max_error
+    assert len(f) < len(faces)
+    assert f.min() >= 0 and f.max() < len(v)
+    # Every kept vertex stands for a cluster of source vertices it is within max_error of.
+    assert nearest(v.astype(np.float64), vertices).max() <= max_error + 1e-6
+    # ... so the simplified surface stays on the sphere to within the bound.
+    assert np.abs(np.linalg.norm(v, axis=1) - 1).max() <= max_error + 1e-6
+
+
+def test_simplify_drops_degenerate_and_duplicate_faces():
+    vertices, faces = uv_sphere(n_lat=20, n_lon=40)
+
+    _, f, _ = mesh_lod.simplify(vertices, faces, 0.2)
+
+    assert np.all((f[:, 0] != f[:, 1]) & (f[:, 1] != f[:, 2]) & (f[:, 0] != f[:, 2]))
+    assert len(np.unique(np.sort(f, axis=1), axis=0)) == len(f)
+
+
+def test_build_lods_bounds_and_level_selection():
+    vertices, faces = uv_sphere()
+
+    lods = mesh_lod.build_lods(vertices, faces, errors=(0.005, 0.02, 0.08))
+
+    assert [lod["error"] for lod in lods] == [0.0, 0.005, 0.02, 0.08]
+    assert all(lod["measured"] <= lod["error"] for lod in lods)
+    assert all(len(a["faces"]) >= len(b["faces"]) for a, b in zip(lods, lods[1:]))
+    assert mesh_lod.level_within(lods, 0.03) == 2
+    assert mesh_lod.level_within(lods, 0.03, scale=2.0) == 1
+    assert mesh_lod.level_within(lods, 0.001) == 0
+
+
+def test_nearest_distance_is_a_lower_bound():
+    vertices, faces = uv_sphere()
+    lods = mesh_lod.build_lods(vertices, faces, errors=(0.05,))
+    lods[-1]["spheres"] = mesh_lod._face_spheres(lods[-1]["vertices"], lods[-1]["faces"])
+    matrix = mesh_utils.transform_matrix((5, 0, 0), (0, 0, 0), (2, 2, 2))
+
+    bound = mesh_lod.nearest_distance(lods, matrix, (0, 0, 0))
+
+    assert 0 < bound <= 3.0
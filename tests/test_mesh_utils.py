@@ -0,0 +1,94 @@
+#
+# FILE: tests/test_mesh_utils.py
+#
+import math
+import logging
+import numpy as np
+import pytest
+
+import mesh_utils
+import raycast_utils
+
+VERTICES = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0]], dtype=np.float32)
+
+
+def write_ply(path, faces, before=(), after=()):
+    """Binary PLY with extra (name, count, property lines, payload) elements around vertex/face."""
+    vertex = ("vertex", len(VERTICES), ["property float x", "property float y", "property float z"], VERTICES.astype("<f4").tobytes())
+    face_bytes = b"".join(bytes([len(f)]) + np.asarray(f, dtype="<i4").tobytes() for f in faces)
+    face = ("face", len(faces), ["property list uchar int vertex_indices"], face_bytes)
+    header, body = "ply\nformat binary_little_endian 1.0\n", b""
+    for name, count, props, payload in [*before, vertex, face, *after]:
+        header += f"element {name} {count}\n" + "".join(p + "\n" for p in props)
+        body += payload
+    path.write_bytes((header + "end_header\n").encode() + body)
+    return str(path)
+
+
+def write_stl(path, faces, trailer=b""):
+    """Binary STL of VERTICES triangles, followed by trailer bytes."""
+    record = np.dtype([("normal", "<f4", 3), ("v", "<f4", (3, 3)), ("attr", "<u2")])
+    block = np.zeros(len(faces), dtype=record)
+    block["v"] = VERTICES[np.asarray(faces)]
+    path.write_bytes(b"\0" * 80 + np.uint32(len(faces)).tobytes() + block.tobytes() + trailer)
+    return str(path)
+
+
+def test_load_ply_triangles(tmp_path):
+    vertices, faces = mesh_utils.load_ply(write_ply(tmp_path / "m.ply", [[0, 1, 2], [0, 2, 3]]))
+
+    np.testing.assert_array_equal(vertices, VERTICES)
+    np.testing.assert_array_equal(faces, [[0, 1, 2], [0, 2, 3]])
+
+
+def test_load_ply_fan_triangulates_polygons(tmp_path):
+    _, faces = mesh_utils.load_ply(write_ply(tmp_path / "m.ply", [[0, 1, 2, 3]]))
+
+    np.testing.assert_array_equal(faces, [[0, 1, 2], [0, 2, 3]])
+
+
+def test_load_ply_skips_unused_elements(tmp_path):
+    material = ("material", 2, ["property uchar red", "property float specular"], b"\x01" + bytes(4) + b"\x02" + bytes(4))
+    edge = ("edge", 1, ["property list uchar int vertex_indices"], b"\x02" + bytes(8))
+    path = write_ply(tmp_path / "m.ply", [[0, 1, 2]], before=[material], after=[edge, material])
+
+    vertices, faces = mesh_utils.load_ply(path)
+
+    np.testing.assert_array_equal(vertices, VERTICES)
+    np.testing.assert_array_equal(faces, [[0, 1, 2]])
+
+
+def test_load_ply_rejects_list_element_before_mesh(tmp_path):
+    edge = ("edge", 1, ["property list uchar int vertex_indices"], b"\x02" + bytes(8))
+    with pytest.raises(ValueError, match="edge"):
+        mesh_utils.load_ply(write_ply(tmp_path / "m.ply", [[0, 1, 2]], before=[edge]))
+
+
+def test_transform_matrix_order():
+    M = mesh_utils.transform_matrix((1, 2, 3), (0, 0, math.pi / 2), (2, 1, 1))
+
+    np.testing.assert_allclose(M @ [1, 0, 0, 1], [1, 4, 3, 1], atol=1e-12)
+
+
+def test_load_stl_ignores_trailing_bytes(tmp_path, caplog):
+    exact = mesh_utils.load_stl(write_stl(tmp_path / "exact.stl", [[0, 1, 2], [0, 2, 3]]))
+    with caplog.at_level(logging.WARNING):
+        padded = mesh_utils.load_stl(write_stl(tmp_path / "padded.stl", [[0, 1, 2], [0, 2, 3]], b"\0" * 7))
+    assert "7 bytes" in caplog.text
+    for a, b in zip(exact, padded):
+        np.testing.assert_array_equal(a, b)
+
+    truncated = tmp_path / "truncated.stl"
+    truncated.write_bytes((tmp_path / "exact.stl").read_bytes()[:-10])
+    with pytest.raises(ValueError):
+        mesh_utils.load_stl(str(truncated))
+
+
+def test_load_scene_uses_mesh_cache(tmp_path):
+    tug = write_ply(tmp_path / "tug.ply", [[0, 1, 2], [0, 2, 3]])
+    aircraft = write_stl(tmp_path / "aircraft.stl", [[0, 1, 2]])
+    cache_dir = tmp_path / "cache"
+
+    raycast_utils.load_scene(tug, aircraft, walls=False, mesh_cache_dir=str(cache_dir))
+
+    assert sorted(p.name.split("-")[0] for p in cache_dir.iterdir()) == ["aircraft.stl", "tug.ply"]
@@ -0,0 +1,118 @@
+#
+# FILE: tests/test_placement_optimizer.py
+#
+import itertools
+import numpy as np
+import pytest
+
+import coverage_utils
+import placement_optimizer
+import scan_io
+
+
+def random_instance(seed, n_candidates=9, n_elements=150):
+    rng = np.random.default_rng(seed)
+    rows = [np.flatnonzero(rng.random(n_elements) < rng.uniform(0.05, 0.4)) for _ in range(n_candidates)]
+    groups = [f"plate_{c % 3}" for c in range(n_candidates)]
+    locations = rng.uniform(0, 10, (n_candidates, 3))
+    return rows, placement_optimizer.visibility_matrix(rows, n_elements, groups=groups, locations=locations)
+
+
+def union_size(rows, selection):
+    return len(set().union(*(set(rows[c].tolist()) for c in selection))) if selection else 0
+
+
+def plain_greedy(rows, k, allowed=lambda selection, c: True):
+    """Textbook greedy max coverage on Python sets (lowest index wins ties, like the heap)."""
+    selection = []
+    for _ in range(k):
+        gains = [(union_size(rows, selection + [c]) - union_size(rows, selection), -c)
+                 for c in range(len(rows)) if c not in selection and allowed(selection, c)]
+        if not gains or max(gains)[0] < 1:
+            break
+        selection.append(-max(gains)[1])
+    return selection
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_coverage_matches_set_union(seed):
+    rows, vis = random_instance(seed)
+    np.testing.assert_array_equal(placement_optimizer.row_counts(vis), [len(r) for r in rows])
+    for selection in ([], [0], [1, 4], [0, 2, 5, 8]):
+        assert placement_optimizer.coverage(vis, selection) == pytest.approx(union_size(rows, selection) / 150)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_greedy_matches_brute_force(seed):
+    rows, vis = random_instance(seed)
+
+    result = placement_optimizer.select_greedy(vis, 3)
+
+    assert result["selected"] == plain_greedy(rows, 3)
+    assert result["coverage"][-1] == pytest.approx(union_size(rows, result["selected"]) / 150)
+    best_single = max(len(r) for r in rows)
+    best_three = max(union_size(rows, list(s)) for s in itertools.combinations(range(len(rows)), 3))
+    assert result["gains"][0] == best_single
+    assert union_size(rows, result["selected"]) >= (1 - 1 / np.e) * best_three
+
+
+def test_greedy_picks_the_optimum_of_a_tiny_instance():
+    # Two disjoint halves and a decoy overlapping both: greedy and brute force agree on {0, 1}.
+    rows = [np.arange(0, 40), np.arange(40, 80), np.arange(20, 59)]
+    vis = placement_optimizer.visibility_matrix(rows, 80)
+
+    result = placement_optimizer.select_greedy(vis, 2)
+
+    best = max(itertools.combinations(range(3), 2), key=lambda s: union_size(rows, list(s)))
+    assert sorted(result["selected"]) == sorted(best)
+    assert result["coverage"][-1] == 1.0
+
+
+def test_greedy_respects_group_and_baseline_constraints():
+    rows, vis = random_instance(7)
+
+    result = placement_optimizer.select_greedy(vis, 3, max_per_group=1, min_baseline=2.0)
+
+    groups = [vis["groups"][c] for c in result["selected"]]
+    assert len(set(groups)) == len(groups)
+    for a, b in itertools.combinations(result["selected"], 2):
+        assert np.linalg.norm(vis["locations"][a] - vis["locations"][b]) >= 2.0
+
+    def allowed(selection, c):
+        return vis["groups"][c] not in {vis["groups"][s] for s in selection} and \
+            all(np.linalg.norm(vis["locations"][s] - vis["locations"][c]) >= 2.0 for s in selection)
+    assert result["selected"] == plain_greedy(rows, 3, allowed)
+
+
+def plate_sweep(tmp_path, metadatas):
+    """Model of a 1 x 1 m plate and a load_sweep-like dict of one full-plate scan per metadata."""
+    vertices = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0]], dtype=np.float64)
+    model = coverage_utils.voxelize_aircraft(vertices, np.array([[0, 1, 2], [0, 2, 3]]), voxel_size=0.1)
+    x, y = np.meshgrid(np.arange(0.025, 1, 0.05), np.arange(0.025, 1, 0.05))
+    n = x.size
+    scan = {"X": x.ravel(), "Y": y.ravel(), "Z": np.zeros(n), "distance": np.ones(n), "intensity": np.ones(n),
+            "categoryID": np.zeros(n, dtype=np.int64), "names": ["a3320_ceo"]}
+    sweep = {}
+    for k, metadata in enumerate(metadatas):
+        path = scan_io.write_scan(scan, str(tmp_path), f"scan_{k}", metadata)
+        sweep[f"scan_{k}"] = scan_io.read_scan(path)
+    return model, sweep
+
+
+def test_build_visibility_reads_blender_scanner_locations(tmp_path):
+    near = np.identity(4)
+    near[:3, 3] = (0.1, 0, 0)
+    model, sweep = plate_sweep(tmp_path, [{"location": [0, 0, 0]}, {"matrix_world": near.tolist()}])
+
+    vis = placement_optimizer.build_visibility(model, sweep)
+
+    np.testing.assert_allclose(vis["locations"], [[0, 0, 0], [0.1, 0, 0]])
+    assert not placement_optimizer._allowed(vis, 1, [0], {}, None, min_baseline=0.5)
+    assert placement_optimizer._allowed(vis, 1, [0], {}, None, min_baseline=0.05)
+
+
+def test_build_visibility_rejects_scans_without_location(tmp_path):
+    model, sweep = plate_sweep(tmp_path, [{"yaw_deg": 45.0}])
+
+    with pytest.raises(ValueError, match="scan_0"):
+        placement_optimizer.build_visibility(model, sweep)
@@ -0,0 +1,101 @@
+#
+# FILE: tests/test_raycast_utils.py
+#
+import numpy as np
+import pytest
+
+import mesh_utils
+import raycast_utils
+
+
+def brute_force(triangles, origins, directions):
+    """Closest two-sided Moller-Trumbore hit of every ray against every triangle: (distance, index)."""
+    a, b, c = (triangles[None, :, k] for k in range(3))
+    o, d = origins[:, None], directions[:, None]
+    e1, e2 = b - a, c - a
+    p = np.cross(d, e2)
+    det = np.einsum("rtk,rtk->rt", e1, p)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = o - a
+        u = np.einsum("rtk,rtk->rt", s, p) / det
+        q = np.cross(s, e1)
+        v = np.einsum("rtk,rtk->rt", d, q) / det
+        t = np.einsum("rtk,rtk->rt", e2, q) / det
+        ok = (np.abs(det) > 1e-12) & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > 0)
+    t = np.where(ok, t, np.inf)
+    index = np.argmin(t, axis=1)
+    distance = t[np.arange(len(t)), index]
+    return distance, np.where(np.isfinite(distance), index, -1)
+
+
+def random_rays(rng, n, spread=4.0):
+    origins = rng.uniform(-spread, spread, (n, 3))
+    directions = rng.normal(size=(n, 3))
+    return origins, directions / np.linalg.norm(directions, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("leaf_size,width", [(1, 2), (4, 4), (8, 8)])
+def test_intersect_matches_brute_force(leaf_size, width):
+    rng = np.random.default_rng(1)
+    centers = rng.uniform(-3, 3, (300, 1, 3))
+    triangles = centers + rng.normal(scale=0.4, size=(300, 3, 3))
+    origins, directions = random_rays(rng, 2000)
+
+    distance, triangle = raycast_utils.intersect(raycast_utils.build_bvh(triangles, leaf_size, width), origins, directions)
+    expected_distance, expected_triangle = brute_force(triangles, origins, directions)
+
+    assert np.isfinite(expected_distance).sum() > 200
+    np.testing.assert_array_equal(np.isfinite(distance), np.isfinite(expected_distance))
+    hit = np.isfinite(expected_distance)
+    np.testing.assert_allclose(distance[hit], expected_distance[hit], rtol=1e-9)
+    # Ties (rays through shared points) may resolve to another triangle at the same distance.
+    same = triangle[hit] == expected_triangle[hit]
+    assert same.mean() > 0.99
+
+
+def test_refit_follows_moved_triangles():
+    rng = np.random.default_rng(2)
+    triangles = rng.uniform(-2, 2, (120, 3, 3))
+    bvh = raycast_utils.build_bvh(triangles)
+    moved = triangles + np.array([0.5, -1.0, 0.25])
+    raycast_utils.refit_bvh(bvh, moved)
+    origins, directions = random_rays(rng, 500)
+
+    distance, _ = raycast_utils.intersect(bvh, origins, directions)
+    expected, _ = brute_force(moved, origins, directions)
+    np.testing.assert_allclose(distance, expected, rtol=1e-9)
+
+
+def test_instanced_scene_matches_flattened_scene():
+    rng = np.random.default_rng(3)
+    box_v = np.array([[x, y, z] for x in (0, 1) for y in (0, 2) for z in (0, 0.5)], dtype=np.float64)
+    box_f = np.array([[0, 1, 3], [0, 3, 2], [4, 6, 7], [4, 7, 5], [0, 4, 5], [0, 5, 1],
+                      [2, 3, 7], [2, 7, 6], [0, 2, 6], [0, 6, 4], [1, 5, 7], [1, 7, 3]])
+    objects = [
+        ("a", box_v, box_f, mesh_utils.transform_matrix((1, 0, 0), (0, 0, 0.3))),
+        ("b", box_v, box_f, mesh_utils.transform_matrix((-2, 1, 0.5), (0.2, 0.1, 1.0), (1.5, 1.0, 2.0))),
+    ]
+    origins, directions = random_rays(rng, 3000)
+
+    flat = raycast_utils.trace(raycast_utils.build_scene(objects), origins, directions)
+    instanced = raycast_utils.trace(raycast_utils.build_instanced_scene(objects), origins, directions)
+
+    hit = np.isfinite(flat[0])
+    assert hit.sum() > 100
+    np.testing.assert_array_equal(np.isfinite(instanced[0]), hit)
+    np.testing.assert_allclose(instanced[0][hit], flat[0][hit], rtol=1e-7)
+    np.testing.assert_array_equal(instanced[1], flat[1])
+
+
+def test_csv_round_trip(tmp_path):
+    rng = np.random.default_rng(4)
+    n = 50
+    scan = {"X": rng.normal(size=n), "Y": rng.normal(size=n), "Z": rng.normal(size=n),
+            "distance": rng.uniform(1, 10, n), "intensity": rng.uniform(0, 1, n),
+            "categoryID": rng.integers(0, 2, n), "partID": rng.integers(0, 2, n), "names": ["Tug_t5", "a3320_ceo"]}
+    path = raycast_utils.write_csv(scan, str(tmp_path), "scan")
+    back = raycast_utils.read_csv(path)
+
+    for key in ("X", "Y", "Z", "distance", "intensity"):
+        np.testing.assert_allclose(back[key], scan[key], atol=1e-6)
+    np.testing.assert_array_equal(np.asarray(back["names"])[back["categoryID"]], np.asarray(scan["names"])[scan["categoryID"]])
@@ -0,0 +1,61 @@
+#
+# FILE: tests/test_sampling_utils.py
+#
+import numpy as np
+import pytest
+
+import sampling_utils
+
+# 2 x 1 m plate at z = 0.5 (two triangles) with a vertical side face.
+PLATE = np.array([[0, 0, 0.5], [2, 0, 0.5], [2, 1, 0.5], [0, 1, 0.5], [0, 0, 0], [2, 0, 0]], dtype=np.float64)
+PLATE_FACES = np.array([[0, 1, 2], [0, 2, 3], [0, 4, 5]])
+
+
+def test_grid_covers_the_top_face_only():
+    result = sampling_utils.sample_candidates(PLATE, PLATE_FACES, method="grid", spacing=0.25, margin=0.1, normal_offset=0.03)
+    points = result["points"]
+
+    assert len(points) > 0
+    np.testing.assert_allclose(points[:, 2], 0.53)
+    assert set(result["face_ids"]) <= {0, 1}
+    assert points[:, 0].min() >= 0.1 - 1e-9 and points[:, 0].max() <= 1.9 + 1e-9
+    assert points[:, 1].min() >= 0.1 - 1e-9 and points[:, 1].max() <= 0.9 + 1e-9
+    # one point per grid node, even on the shared diagonal
+    assert len(np.unique(np.round(points[:, :2] / 0.25).astype(int), axis=0)) == len(points)
+
+
+def test_random_samples_are_area_weighted():
+    vertices = np.array([[0, 0, 0], [3, 0, 0], [3, 1, 0], [0, 1, 0], [3, 0, 0], [4, 0, 0], [4, 1, 0]], dtype=np.float64)
+    faces = np.array([[0, 1, 2], [0, 2, 3], [4, 5, 6]])  # areas 1.5, 1.5 and 0.5
+    points, face_ids = sampling_utils.sample_random(vertices, faces, 20000, seed=1)
+
+    assert np.bincount(face_ids, minlength=3)[2] / len(face_ids) == pytest.approx(0.5 / 3.5, abs=0.01)
+    assert points[:, 0].min() >= 0 and points[:, 0].max() <= 4 and np.all(points[:, 2] == 0)
+
+
+def test_poisson_samples_keep_their_spacing():
+    result = sampling_utils.sample_candidates(PLATE, PLATE_FACES, method="poisson", spacing=0.2, margin=0.0, normal_offset=0.0)
+    points = result["points"]
+
+    d = np.linalg.norm(points[:, None] - points[None], axis=2) + np.identity(len(points)) * 10
+    assert d.min() >= 0.2
+    assert len(points) > 15  # maximal, not merely sparse
+
+
+def test_neighbor_pairs_match_brute_force():
+    points = np.random.default_rng(2).uniform(0, 1, (300, 3))
+    i, j = sampling_utils.neighbor_pairs(points, 0.15)
+
+    d = np.linalg.norm(points[:, None] - points[None], axis=2)
+    expected = {(a, b) for a, b in zip(*np.nonzero(d < 0.15)) if a != b}
+    assert set(zip(i.tolist(), j.tolist())) == expected
+
+
+def test_quad_grid_matches_plate_layout():
+    corners = [(1, 1, 0), (0, 0, 0), (1, 0, 0), (0, 1, 0)]
+    points, lattice = sampling_utils.quad_grid(corners, nx=2, ny=3, margin=0.1, height_offset=0.05)
+
+    assert lattice == [(0, 0), (1, 0), (0, 1), (1, 1), (0, 2), (1, 2)]
+    np.testing.assert_allclose(points[0], (0.1, 0.1, 0.05))
+    np.testing.assert_allclose(points[-1], (0.9, 0.9, 0.05))
+    np.testing.assert_allclose(sampling_utils.quad_grid(corners)[0], [(0.5, 0.1, 0.03), (0.5, 0.9, 0.03)])
@@ -0,0 +1,81 @@
+#
+# FILE: tests/test_scan_cache.py
+#
+import os
+import numpy as np
+
+import mesh_utils
+import scan_cache
+
+
+def make_scan(n, value=0.0):
+    return {"X": np.full(n, value), "Y": np.zeros(n), "Z": np.zeros(n), "distance": np.ones(n),
+            "intensity": np.ones(n), "categoryID": np.zeros(n, dtype=np.int64), "names": ["a3320_ceo"]}
+
+
+def key(i):
+    return scan_cache.scan_key("scene", mesh_utils.transform_matrix((i, 0, 0)), {"xStepDegree": 0.4})
+
+
+def age(cache, k, seconds):
+    """Moves an entry's recency back by seconds."""
+    st = os.stat(cache.path(k))
+    os.utime(cache.path(k), (st.st_atime - seconds, st.st_mtime - seconds))
+
+
+def test_miss_then_hit(tmp_path):
+    cache = scan_cache.ScanCache(str(tmp_path))
+    calls = []
+
+    def scan_fn():
+        calls.append(1)
+        return make_scan(10, 3.0)
+
+    first = cache.get_or_scan(key(0), scan_fn)
+    second = cache.get_or_scan(key(0), scan_fn)
+
+    assert len(calls) == 1
+    np.testing.assert_array_equal(second["X"], first["X"])
+    assert second["names"] == ["a3320_ceo"]
+    assert cache.get(key(1)) is None
+
+
+def test_keys_follow_pose_params_and_scene():
+    M = mesh_utils.transform_matrix((1, 2, 3))
+    base = scan_cache.scan_key("scene", M, {"xStepDegree": 0.4})
+
+    assert scan_cache.scan_key("scene", M + 1e-12, {"xStepDegree": 0.4}) == base
+    assert scan_cache.scan_key("scene", mesh_utils.transform_matrix((1, 2, 3.01)), {"xStepDegree": 0.4}) != base
+    assert scan_cache.scan_key("scene", M, {"xStepDegree": 0.5}) != base
+    assert scan_cache.scan_key("other", M, {"xStepDegree": 0.4}) != base
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    cache = scan_cache.ScanCache(str(tmp_path), max_bytes=10 ** 9)
+    for i in range(4):
+        cache.put(key(i), make_scan(1000, i))
+        age(cache, key(i), 100 - i)  # key(0) oldest
+    entry_size = os.path.getsize(cache.path(key(0)))
+    assert cache.get(key(0)) is not None  # a hit makes key(0) the most recent
+
+    cache.max_bytes = int(2.5 * entry_size)
+    cache.put(key(4), make_scan(1000, 4))
+
+    kept = [i for i in range(5) if os.path.exists(cache.path(key(i)))]
+    assert kept == [0, 4]
+    assert cache.size() <= cache.max_bytes
+
+
+def test_running_size_and_concurrent_removal(tmp_path):
+    cache = scan_cache.ScanCache(str(tmp_path))
+    cache.put(key(0), make_scan(500))
+    cache.put(key(1), make_scan(500))
+    cache.put(key(1), make_scan(500, 1.0))  # replacing an entry does not count it twice
+    assert cache._total == cache.size()
+
+    os.remove(cache.path(key(0)))  # evicted by another process
+    assert cache.get(key(0)) is None
+    assert cache.invalidate(key(0)) is False
+    assert cache.invalidate(key(1)) is True
+    cache.clear()
+    assert cache.size() == 0
@@ -0,0 +1,80 @@
+#
+# FILE: tests/test_scan_catalog.py
+#
+import numpy as np
+import pytest
+
+import raycast_utils
+import scan_catalog
+import scan_io
+
+NAMES = ["Tug_t5", "a3320_ceo", "Floor"]
+
+
+def make_scan(aircraft_hits, other_hits=5):
+    n = aircraft_hits + other_hits
+    xyz = np.random.default_rng(n).uniform(-1, 1, (n, 3))
+    return {"X": xyz[:, 0], "Y": xyz[:, 1], "Z": xyz[:, 2], "distance": np.ones(n), "intensity": np.ones(n),
+            "categoryID": np.r_[np.full(aircraft_hits, 1), np.full(other_hits, 2)], "partID": np.zeros(n, dtype=np.int64),
+            "azimuthIndex": np.arange(n), "elevationIndex": np.zeros(n, dtype=np.int64), "names": NAMES}
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    """Two yaws x two surfaces x three grid points; aircraft hits differ per scan."""
+    with scan_catalog.ScanCatalog(str(tmp_path / scan_catalog.CATALOG_NAME)) as catalog:
+        for yaw in (0.0, 45.0):
+            for surface, hits in (("top", (30, 80, 10)), ("side", (0, 20, 50))):
+                for index, n in enumerate(hits, start=1):
+                    metadata = {"yaw_deg": yaw, "surface": surface, "index": index, "location": [index, 0.0, 1.0]}
+                    catalog.record_scan(make_scan(n + int(yaw)), metadata, seconds=float(index), key=f"{yaw}-{surface}-{index}")
+        yield catalog
+
+
+def test_find_filters_and_orders(catalog):
+    rows = catalog.find(target="a3320_ceo", yaw_deg=45, min_hits=90, order_by="hits", descending=True)
+    assert [(r["surface"], r["grid_index"], r["hits"]) for r in rows] == [("top", 2, 125), ("side", 3, 95)]
+
+    rows = catalog.find(surface=["side"], yaw_deg=0, max_seconds=2.0)
+    assert [r["grid_index"] for r in rows] == [1, 2]
+    assert rows[0]["x"] == 1.0 and rows[0]["points"] == 5
+    assert catalog.find(target="Tug_t5", yaw_deg=0, surface="top", grid_index=1)[0]["hits"] == 0
+    assert len(catalog.find(limit=3)) == 3
+
+    with pytest.raises(ValueError):
+        catalog.find(min_hits=10)
+    with pytest.raises(ValueError):
+        catalog.find(colour="red")
+
+
+def test_best_per_surface(catalog):
+    best = catalog.best_per_surface("a3320_ceo", n=2)
+
+    assert sorted(best) == [(0.0, "side"), (0.0, "top"), (45.0, "side"), (45.0, "top")]
+    assert [(r["grid_index"], r["hits"]) for r in best[(0.0, "top")]] == [(2, 80), (1, 30)]
+    assert [r["grid_index"] for r in catalog.best_per_surface(yaw_deg=45)[(45.0, "side")]] == [3]
+
+
+def test_recording_a_key_again_replaces_the_row(catalog):
+    before = len(catalog)
+    scan_id = catalog.record_scan(make_scan(500), {"yaw_deg": 0.0, "surface": "top", "index": 1}, key="0.0-top-1")
+
+    assert len(catalog) == before
+    assert catalog.hits(scan_id) == {"a3320_ceo": 500, "Floor": 5}
+    assert catalog.best_per_surface(yaw_deg=0, surface="top")[(0.0, "top")][0]["id"] == scan_id
+
+
+def test_index_outputs_reads_names_and_headers(tmp_path):
+    out = tmp_path / "out"
+    out.mkdir()
+    raycast_utils.write_csv(make_scan(12), str(out), "yaw_022p50_top_scan_004")
+    scan_io.write_scan(make_scan(7), str(out), "yaw_090_side_scan_002", {"yaw_deg": 90.0, "surface": "side", "index": 2})
+
+    with scan_catalog.ScanCatalog(str(out / scan_catalog.CATALOG_NAME)) as catalog:
+        assert scan_catalog.index_outputs(catalog, str(out)) == 2
+        assert scan_catalog.index_outputs(catalog, str(out)) == 0
+        rows = {r["output_name"]: r for r in catalog.find(target="a3320_ceo")}
+
+    assert (rows["yaw_022p50_top_scan_004"]["yaw_deg"], rows["yaw_022p50_top_scan_004"]["grid_index"]) == (22.5, 4)
+    assert rows["yaw_022p50_top_scan_004"]["hits"] == 12
+    assert (rows["yaw_090_side_scan_002"]["surface"], rows["yaw_090_side_scan_002"]["hits"]) == ("side", 7)
@@ -0,0 +1,102 @@
+#
+# FILE: tests/test_scan_io.py
+#
+import gzip
+import shutil
+import numpy as np
+
+import raycast_utils
+import scan_io
+
+
+def make_scan(n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        "X": rng.normal(size=n).astype(np.float32), "Y": rng.normal(size=n).astype(np.float32),
+        "Z": rng.normal(size=n).astype(np.float32), "distance": rng.uniform(1, 50, n).astype(np.float32),
+        "intensity": rng.uniform(0, 1, n).astype(np.float32), "categoryID": rng.integers(0, 3, n),
+        "azimuthIndex": rng.integers(0, 900, n), "elevationIndex": rng.integers(0, 818, n),
+        "names": ["Tug_t5", "a3320_ceo", "wall_0"],
+    }
+
+
+def assert_same_scan(header, columns, scan):
+    assert header["n_points"] == len(scan["X"])
+    assert header["names"] == scan["names"]
+    for column, (key, _) in scan_io.COLUMNS.items():
+        np.testing.assert_array_equal(columns[column], scan[key])
+
+
+def test_write_read_round_trip(tmp_path):
+    scan = make_scan()
+    metadata = {"yaw_deg": 45.0, "surface": "top", "aircraft_location": [1.0, 2.0, 0.0]}
+    path = scan_io.write_scan(scan, str(tmp_path), "yaw_045_top_scan_000", metadata)
+
+    header, columns = scan_io.read_scan(path)
+
+    assert_same_scan(header, columns, scan)
+    assert header["metadata"] == metadata
+    assert all(columns[c].ctypes.data % scan_io.ALIGN == 0 for c in columns if len(columns[c]))
+
+
+def test_encode_scan_matches_written_file(tmp_path):
+    scan = make_scan(37)
+    path = scan_io.write_scan(scan, str(tmp_path), "scan", {"index": 3})
+
+    with open(path, "rb") as f:
+        assert f.read() == scan_io.encode_scan(scan, {"index": 3})
+
+
+def test_gzipped_and_empty_scans(tmp_path):
+    scan = make_scan(64)
+    path = scan_io.write_scan(scan, str(tmp_path), "scan")
+    with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    assert_same_scan(*scan_io.read_scan(path + ".gz"), scan)
+
+    empty = make_scan(0)
+    header, columns = scan_io.read_scan(scan_io.write_scan(empty, str(tmp_path), "empty"))
+    assert header["n_points"] == 0
+    assert all(len(v) == 0 for v in columns.values())
+
+
+def test_stream_writer_matches_write_scan(tmp_path):
+    scan = make_scan(300)
+    writer = scan_io.ScanStreamWriter(str(tmp_path), "streamed", {"index": 1}, "binary")
+    for start in range(0, 300, 70):
+        writer.append({k: (v if k == "names" else v[start:start + 70]) for k, v in scan.items()})
+    path = writer.close()
+
+    assert_same_scan(*scan_io.read_scan(path), scan)
+
+
+def test_load_sweep_reads_gzipped_scans(tmp_path):
+    plain, packed, both = make_scan(20, 1), make_scan(30, 2), make_scan(40, 3)
+    scan_io.write_scan(plain, str(tmp_path), "yaw_000_top_scan_001")
+    for name, scan in (("yaw_000_top_scan_002", packed), ("yaw_000_top_scan_003", both)):
+        path = scan_io.write_scan(scan, str(tmp_path), name)
+        with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+    (tmp_path / "yaw_000_top_scan_002.lscan").unlink()
+
+    sweep = scan_io.load_sweep(str(tmp_path), "yaw_000_top_*")
+
+    assert list(sweep) == ["yaw_000_top_scan_001", "yaw_000_top_scan_002", "yaw_000_top_scan_003"]
+    for name, scan in zip(sweep, (plain, packed, both)):
+        assert_same_scan(*sweep[name], scan)
+    assert isinstance(sweep["yaw_000_top_scan_003"][1]["x"].base, np.memmap)
+
+
+def test_convert_gzipped_csv(tmp_path):
+    scan = dict(make_scan(25), partID=np.zeros(25, dtype=np.int64))
+    path = raycast_utils.write_csv(scan, str(tmp_path), "scan")
+    with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+        shutil.copyfileobj(src, dst)
+
+    converted = scan_io.convert_csv(path + ".gz", {"index": 7})
+
+    assert converted == str(tmp_path / "scan.lscan")
+    header, columns = scan_io.read_scan(converted)
+    assert header["metadata"] == {"index": 7}
+    np.testing.assert_allclose(columns["distance"], scan["distance"], rtol=1e-4)
+    np.testing.assert_array_equal(columns["object"], scan["categoryID"])
@@ -0,0 +1,87 @@
+#
+# FILE: tests/test_scan_scheduler.py
+#
+import json
+import os
+import numpy as np
+import pytest
+
+import scan_scheduler
+
+COARSE = {"xStepDegree": 30.0, "fovX": 360.0, "yStepDegree": 30.0, "fovY": 180.0}
+
+
+def write_box_stl(path, size=1.0):
+    """Binary STL of an axis-aligned cube centred on the origin."""
+    h = size / 2.0
+    corners = np.array([[x, y, z] for x in (-h, h) for y in (-h, h) for z in (-h, h)], dtype=np.float32)
+    quads = [(0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1), (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)]
+    triangles = [corners[[a, b, c]] for a, b, c, d in quads] + [corners[[a, c, d]] for a, b, c, d in quads]
+    record = np.dtype([("normal", "<f4", 3), ("v", "<f4", (3, 3)), ("attr", "<u2")])
+    block = np.zeros(len(triangles), dtype=record)
+    block["v"] = triangles
+    path.write_bytes(b"\0" * 80 + np.uint32(len(triangles)).tobytes() + block.tobytes())
+    return str(path)
+
+
+def sweep_jobs(yaws=(0, 90)):
+    plate_points = {"top": [(3.0, 0.0, 0.0), (3.0, 0.5, 0.0)], "side": [(0.0, 3.0, 0.0)]}
+    return scan_scheduler.expand_manifest(yaws, plate_points, scan_params=COARSE, aircraft_location=(0.0, 0.0, 4.0))
+
+
+def test_yaw_tag():
+    assert scan_scheduler.yaw_tag(45) == "yaw_045"
+    assert scan_scheduler.yaw_tag(45.0) == "yaw_045"
+    assert scan_scheduler.yaw_tag(0.5) == "yaw_000p50"
+    assert scan_scheduler.yaw_tag(45.25) == "yaw_045p25"
+    assert scan_scheduler.yaw_tag(-45) == "yaw_-45"
+
+
+def test_expand_manifest_rotates_points_with_the_tug():
+    jobs = sweep_jobs()
+
+    assert [job["output_name"] for job in jobs[:3]] == ["yaw_000_top_scan_001", "yaw_000_top_scan_002", "yaw_000_side_scan_003"]
+    assert len({job["job_id"] for job in jobs}) == len(jobs) == 6
+    np.testing.assert_allclose(jobs[0]["location"], (3.0, 0.0, 0.1), atol=1e-12)
+    np.testing.assert_allclose(jobs[3]["location"], (0.0, 3.0, 0.1), atol=1e-12)
+    assert jobs[0]["scan_params"]["xStepDegree"] == 30.0
+    assert [job["job_id"] for job in sweep_jobs()] == [job["job_id"] for job in jobs]
+
+
+def test_shards_partition_the_manifest():
+    jobs = sweep_jobs((0, 90, 180))
+    shards = [scan_scheduler.shard(jobs, k, 4) for k in range(4)]
+
+    assert sorted(job["job_id"] for part in shards for job in part) == sorted(job["job_id"] for job in jobs)
+    assert max(len(part) for part in shards) - min(len(part) for part in shards) <= 1
+    with pytest.raises(ValueError):
+        scan_scheduler.shard(jobs, 4, 4)
+
+
+def test_run_jobs_skips_completed_jobs(tmp_path, monkeypatch):
+    jobs = sweep_jobs()
+    with open(tmp_path / "completed.jsonl", "w") as f:
+        f.write(json.dumps({"job_id": jobs[0]["job_id"]}) + "\n")
+        f.write(json.dumps({"job_id": jobs[2]["job_id"]}) + "\n")
+        f.write('{"job_id": "torn')  # killed while writing
+    ran = []
+    monkeypatch.setattr(scan_scheduler, "_run_headless", lambda pending, *args: ran.extend(pending) or 0)
+
+    assert scan_scheduler.run_jobs(jobs, str(tmp_path), workers=1, shard_index=0, shard_count=2, catalog=False) == 0
+
+    # Shard 0 holds jobs 0, 2 and 4; only job 4 is left.
+    assert [job["job_id"] for job in ran] == [jobs[4]["job_id"]]
+
+
+def test_headless_sweep_resumes(tmp_path, monkeypatch):
+    spec = {"tug_mesh": write_box_stl(tmp_path / "tug.stl"), "aircraft_mesh": write_box_stl(tmp_path / "aircraft.stl", 2.0), "walls": False}
+    out = tmp_path / "out"
+    jobs = sweep_jobs((0,))
+
+    assert scan_scheduler.run_jobs(jobs, str(out), workers=1, scene_spec=spec, catalog=False) == 0
+    completed = [json.loads(line) for line in open(out / "completed.jsonl")]
+    assert sorted(r["job_id"] for r in completed) == sorted(job["job_id"] for job in jobs)
+    assert all(os.path.exists(r["output"]) and r["points"] > 0 for r in completed)
+
+    monkeypatch.setattr(scan_scheduler, "_run_headless", lambda *args: pytest.fail("finished jobs were rescanned"))
+    assert scan_scheduler.run_jobs(jobs, str(out), workers=1, scene_spec=spec, catalog=False) == 0
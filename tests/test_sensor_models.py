@@ -0,0 +1,66 @@
+#
+# FILE: tests/test_sensor_models.py
+#
+import math
+import numpy as np
+import pytest
+
+import mesh_utils
+import raycast_utils
+import sensor_models
+
+
+@pytest.fixture
+def fan():
+    """A 4-ray horizontal fan (-20..10 deg azimuth) with a 0.5-2.05 m range, registered for one test."""
+    sensor_models.register_sensor("test_fan", sensor_models.sensor_model([0.0], 10.0, 40.0, range_m=(0.5, 2.05), mount_offset=(0.0, 0.1, 0.0)))
+    yield "test_fan"
+    sensor_models.SENSOR_MODELS.pop("test_fan")
+    sensor_models._RAY_TABLES.pop("test_fan", None)
+
+
+def test_detailed_table_matches_the_rotating_pattern():
+    p = raycast_utils.DETAILED_SCAN_PARAMS
+    directions, az, el = sensor_models.ray_table("detailed")
+    expected = raycast_utils.rotating_ray_chunk(0, len(directions), p["xStepDegree"], p["fovX"], p["yStepDegree"], p["fovY"])
+
+    np.testing.assert_allclose(directions, expected[0], atol=1e-12)
+    np.testing.assert_array_equal(az, expected[1])
+    np.testing.assert_array_equal(el, expected[2])
+    assert sensor_models.scan_params("detailed") == p
+
+
+def test_ray_table_is_shared_and_rebuilt_for_a_new_model(fan):
+    table = sensor_models.ray_table(fan)
+    assert sensor_models.ray_table(fan) is table
+    assert not table[0].flags.writeable
+    fingerprint = sensor_models.model_fingerprint(fan)
+
+    sensor_models.register_sensor(fan, sensor_models.sensor_model([-1.0, 0.0, 1.0], 10.0, 40.0))
+
+    assert len(sensor_models.ray_table(fan)[0]) == 12
+    assert sensor_models.model_fingerprint(fan) != fingerprint
+    assert sensor_models.angular_resolution(fan) == 1.0
+    with pytest.raises(KeyError):
+        sensor_models.get_sensor("no_such_lidar")
+
+
+def test_mount_offset_ignores_scanner_scale(fan):
+    scanner = mesh_utils.transform_matrix((1, 2, 3), (math.pi / 2, 0, 0), (0.15, 0.15, 0.15))
+
+    mounted = sensor_models.mounted_matrix(scanner, fan)
+
+    np.testing.assert_allclose(mounted[:3, 3], (1, 2, 3.1), atol=1e-12)  # +Y of the scanner points up after the 90 deg roll
+    np.testing.assert_allclose(mounted[:3, :3] @ mounted[:3, :3].T, np.identity(3), atol=1e-12)
+
+
+def test_scan_sensor_applies_the_range_limits(fan):
+    vertices, faces = mesh_utils.plane_mesh(20)
+    wall = mesh_utils.transform_matrix((0, 0, -2.0), (0, 0, 0))  # 2 m in front of the scanner (-Z)
+    scene = raycast_utils.build_instanced_scene([("wall", vertices, faces, wall)])
+
+    scan = sensor_models.scan_sensor(scene, np.identity(4), fan)
+
+    # Azimuths -20, -10, 0, 10 deg reach the wall at 2 / cos(a); -20 deg (2.13 m) is out of range.
+    assert sorted(scan["azimuthIndex"].tolist()) == [1, 2, 3]
+    np.testing.assert_allclose(np.sort(scan["distance"]), np.sort(2.0 / np.cos(np.radians([-10.0, 0.0, 10.0]))), atol=1e-5)
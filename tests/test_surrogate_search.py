@@ -0,0 +1,61 @@
+#
+# FILE: tests/test_surrogate_search.py
+#
+import numpy as np
+import pytest
+
+import surrogate_search
+
+
+def lattice():
+    """Candidates on two yaws of a 6 x 5 plate lattice, with a smooth score peaking near one corner."""
+    xs, ys = np.meshgrid(np.linspace(0.0, 1.0, 6), np.linspace(0.0, 0.8, 5))
+    points = np.column_stack([xs.ravel(), ys.ravel(), np.full(xs.size, 1.0)])
+    locations = np.vstack([points, points])
+    yaws = np.repeat([0.0, 30.0], len(points))
+    X = surrogate_search.features(locations, yaws)
+    score = 0.05 - 0.02 * ((locations[:, 0] - 0.8) ** 2 + (locations[:, 1] - 0.6) ** 2) - 0.005 * (yaws / 30.0)
+    return X, score
+
+
+def test_search_finds_the_best_candidate_without_scanning_all():
+    X, score = lattice()
+    scanned = []
+
+    def evaluate(indices):
+        scanned.extend(indices)
+        return score[indices]
+
+    result = surrogate_search.search(X, evaluate, n_initial=6, max_scans=len(X), min_gain=0.01)
+    assert result["stop"] == "min_gain"
+    assert len(scanned) == len(set(scanned)) == len(result["scores"]) < len(X)
+    assert result["best_score"] >= np.sort(score)[-3]
+    # Stopped after patience rounds whose largest expected gain was below min_gain times the best score.
+    assert all(ei < 0.01 * best for _, best, ei in result["rounds"][-3:])
+
+
+def test_search_stops_at_max_scans():
+    X, score = lattice()
+    result = surrogate_search.search(X, lambda indices: score[indices], n_initial=4, max_scans=7, min_gain=0.0, patience=100)
+    assert result["stop"] == "max_scans"
+    assert len(result["scores"]) == 7
+
+
+def test_search_resumes_from_observed_scores():
+    X, score = lattice()
+    observed = {i: float(score[i]) for i in (0, 17, 42)}
+    scanned = []
+
+    def evaluate(indices):
+        scanned.extend(indices)
+        return score[indices]
+
+    result = surrogate_search.search(X, evaluate, n_initial=0, max_scans=8, min_gain=0.0, patience=100, observed=observed)
+    assert not set(scanned) & set(observed)
+    assert len(result["scores"]) == 8
+
+
+def test_search_rejects_no_initial_scans():
+    X, score = lattice()
+    with pytest.raises(ValueError):
+        surrogate_search.search(X, lambda indices: score[indices], n_initial=0)
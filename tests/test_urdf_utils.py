@@ -0,0 +1,106 @@
+#
+# FILE: tests/test_urdf_utils.py
+#
+import math
+import numpy as np
+import pytest
+
+import urdf_utils
+
+ARM = """<?xml version="1.0"?>
+<robot name="arm">
+  <link name="base"/>
+  <link name="upper"/>
+  <link name="lower"/>
+  <link name="tool"/>
+  <joint name="shoulder" type="revolute">
+    <parent link="base"/><child link="upper"/>
+    <origin xyz="0 0 1" rpy="0 0 0"/>
+    <axis xyz="0 0 1"/>
+    <limit lower="-3.14" upper="3.14" effort="10" velocity="1"/>
+  </joint>
+  <joint name="elbow" type="revolute">
+    <parent link="upper"/><child link="lower"/>
+    <origin xyz="1 0 0" rpy="0 0 0"/>
+    <axis xyz="0 1 0"/>
+    <limit lower="-3.14" upper="3.14" effort="10" velocity="1"/>
+  </joint>
+  <joint name="slide" type="prismatic">
+    <parent link="lower"/><child link="tool"/>
+    <origin xyz="{tool} 0 0" rpy="0 0 {tool_yaw}"/>
+    <axis xyz="1 0 0"/>
+    <limit lower="0" upper="1" effort="10" velocity="1"/>
+  </joint>
+</robot>
+"""
+
+
+def write_arm(tmp_path, tool=0.5, tool_yaw=0.0):
+    path = tmp_path / "arm.urdf"
+    path.write_text(ARM.format(tool=tool, tool_yaw=tool_yaw))
+    return str(path)
+
+
+def test_fk_matches_known_pose(tmp_path):
+    model = urdf_utils.load_urdf(write_arm(tmp_path))
+    cfg = {"shoulder": math.pi / 2, "elbow": -math.pi / 2, "slide": 0.25}
+
+    poses = urdf_utils.link_positions(model, base_position=(10, 0, 0), cfg=cfg)
+
+    # shoulder turns the arm to +y; elbow (about the rotated y axis, now -x) points the forearm up.
+    np.testing.assert_allclose(poses["base"][:3, 3], (10, 0, 0), atol=1e-12)
+    np.testing.assert_allclose(poses["upper"][:3, 3], (10, 0, 1), atol=1e-12)
+    np.testing.assert_allclose(poses["lower"][:3, 3], (10, 1, 1), atol=1e-12)
+    np.testing.assert_allclose(poses["tool"][:3, 3], (10, 1, 1.75), atol=1e-12)
+    np.testing.assert_allclose(poses["tool"][:3, 0], (0, 0, 1), atol=1e-12)
+
+
+def test_fk_applies_base_rotation(tmp_path):
+    model = urdf_utils.load_urdf(write_arm(tmp_path))
+
+    poses = urdf_utils.link_positions(model, base_rotation=(0, 0, math.pi))
+
+    np.testing.assert_allclose(poses["tool"][:3, 3], (-1.5, 0, 1), atol=1e-12)
+
+
+def test_batched_fk_matches_single_poses(tmp_path):
+    model = urdf_utils.load_urdf(write_arm(tmp_path))
+    rng = np.random.default_rng(0)
+    base_poses = rng.uniform(-1, 1, (5, 6))
+    cfgs = rng.uniform(-1, 1, (5, 3))
+
+    poses, names = urdf_utils.batched_link_fk(model, base_poses, cfgs)
+
+    actuated = urdf_utils.kinematic_tree(model)["actuated"]
+    for n in range(5):
+        single = urdf_utils.link_positions(model, base_poses[n, :3], base_poses[n, 3:], dict(zip(actuated, cfgs[n])))
+        for i, name in enumerate(names):
+            np.testing.assert_allclose(poses[n, i], single[name], atol=1e-12)
+
+
+def test_model_cache_sees_edited_file(tmp_path):
+    path = write_arm(tmp_path, tool=0.5)
+    first = urdf_utils.link_positions(urdf_utils.load_urdf(path))["tool"][:3, 3]
+    write_arm(tmp_path, tool=2.25)
+    second = urdf_utils.link_positions(urdf_utils.load_urdf(path))["tool"][:3, 3]
+
+    np.testing.assert_allclose(first, (1.5, 0, 1))
+    np.testing.assert_allclose(second, (3.25, 0, 1))
+
+
+def test_single_base_matrix_and_shared_joint_row(tmp_path):
+    model = urdf_utils.load_urdf(write_arm(tmp_path))
+    base = np.identity(4)
+    base[:3, 3] = (2, 3, 4)
+
+    np.testing.assert_array_equal(urdf_utils.base_pose_matrices(base), base[None])
+    poses, _ = urdf_utils.batched_link_fk(model, np.stack([base, base]), [0.0, 0.0, 0.5])
+    np.testing.assert_allclose(poses[:, -1, :3, 3], [(4, 3, 5), (4, 3, 5)], atol=1e-12)
+
+
+def test_joint_configs_must_match_actuated_joints(tmp_path):
+    model = urdf_utils.load_urdf(write_arm(tmp_path))
+    with pytest.raises(ValueError):
+        urdf_utils.batched_link_fk(model, np.zeros((2, 3)), np.zeros((2, 2)))
+    with pytest.raises(ValueError):
+        urdf_utils.batched_link_fk(model, np.zeros((2, 3)), np.zeros((3, 3)))
@@ -1,52 +1,276 @@
-
-import urdfpy
 import numpy as np
 import os
 import sys
-import blender_utils 
+import logging
+import xml.etree.ElementTree as ET
+import instrumentation
+import file_utils
+
+log = instrumentation.get_logger(__name__)
+
+JOINT_FIXED, JOINT_REVOLUTE, JOINT_PRISMATIC = 0, 1, 2
+_JOINT_CODES = {"revolute": JOINT_REVOLUTE, "continuous": JOINT_REVOLUTE, "prismatic": JOINT_PRISMATIC}
+_MODEL_CACHE = {}
+
+
+def _floats(text, default):
+    return np.array([float(v) for v in text.split()], dtype=float) if text else np.array(default, dtype=float)
+
 
-np.float = float    
-np.int = int   
-np.object = object    
-np.bool = bool
+def _origin_matrix(element):
+    """4x4 transform of an <origin xyz rpy> element (identity when missing)."""
+    M = np.identity(4)
+    if element is not None:
+        M[:3, :3] = rpy_matrices(_floats(element.get("rpy"), (0, 0, 0)))[0]
+        M[:3, 3] = _floats(element.get("xyz"), (0, 0, 0))
+    return M
+
+
+def _link_geometry(link):
+    """
+    Visual and collision shapes of a <link>: dicts with source ("visual"/"collision"), type
+    (box, cylinder, sphere, mesh), origin (4x4, in the link frame) and the shape's parameters.
+    """
+    shapes = []
+    for source in ("visual", "collision"):
+        for element in link.findall(source):
+            geometry = element.find("geometry")
+            if geometry is None or not len(geometry):
+                continue
+            shape = geometry[0]
+            entry = {"source": source, "type": shape.tag, "origin": _origin_matrix(element.find("origin"))}
+            if shape.tag == "box":
+                entry["size"] = _floats(shape.get("size"), (0, 0, 0))
+            elif shape.tag == "cylinder":
+                entry["radius"], entry["length"] = float(shape.get("radius", 0)), float(shape.get("length", 0))
+            elif shape.tag == "sphere":
+                entry["radius"] = float(shape.get("radius", 0))
+            elif shape.tag == "mesh":
+                entry["filename"] = shape.get("filename")
+                entry["scale"] = _floats(shape.get("scale"), (1, 1, 1))
+            else:
+                log.warning(f"Link '{link.get('name')}': unsupported geometry <{shape.tag}> ignored.")
+                continue
+            shapes.append(entry)
+    return shapes
+
+
+def parse_urdf(path):
+    """
+    Parses the URDF subset the pipeline uses (links, link geometry, joints, origins, axes, limits)
+    with ElementTree. Returns a model dict: name, link_names, geometry ({link: shapes}), joints
+    (list of dicts), base_link and tree (kinematic_tree).
+    """
+    root = ET.parse(path).getroot()
+    if root.tag != "robot":
+        raise ValueError(f"{path}: root element is <{root.tag}>, expected <robot>.")
+    link_names = [link.get("name") for link in root.findall("link")]
+    geometry = {link.get("name"): _link_geometry(link) for link in root.findall("link")}
+    joints = []
+    for joint in root.findall("joint"):
+        limit = joint.find("limit")
+        axis = joint.find("axis")
+        axis = _floats(axis.get("xyz") if axis is not None else None, (1, 0, 0))
+        joints.append({
+            "name": joint.get("name"),
+            "type": joint.get("type"),
+            "parent": joint.find("parent").get("link"),
+            "child": joint.find("child").get("link"),
+            "origin": _origin_matrix(joint.find("origin")),
+            "axis": axis / max(np.linalg.norm(axis), 1e-12),
+            "limit": None if limit is None else tuple(float(limit.get(k, "nan")) for k in ("lower", "upper", "effort", "velocity")),
+        })
+
+    known = set(link_names)
+    children = {j["child"] for j in joints}
+    for j in joints:
+        if j["parent"] not in known or j["child"] not in known:
+            raise ValueError(f"{path}: joint '{j['name']}' references an undefined link.")
+        if j["type"] not in _JOINT_CODES and j["type"] != "fixed":
+            log.warning(f"Joint '{j['name']}' of type '{j['type']}' is treated as fixed.")
+    roots = [name for name in link_names if name not in children]
+    if len(roots) != 1:
+        raise ValueError(f"{path}: expected exactly one root link, found {roots}.")
+
+    model = {"name": root.get("name"), "path": os.path.abspath(path), "link_names": link_names,
+             "geometry": geometry, "joints": joints, "base_link": roots[0]}
+    model["tree"] = _build_tree(model)
+    return model
+
+
+def load_urdf(path):
+    """
+    parse_urdf through an in-process cache keyed by the file's path and content hash (the model
+    keeps its path, against which its mesh filenames resolve).
+    """
+    key = (os.path.abspath(path), file_utils.file_hash(path))
+    model = _MODEL_CACHE.get(key)
+    if model is None:
+        model = _MODEL_CACHE[key] = parse_urdf(path)
+    return model
 
 
 def load_and_verify_urdf(path, package_dirs=None):
-    """Reads the URDF, verifies its data, and returns the urdfpy object."""
-    print(f"\n Starting URDF Read Process")
+    """Reads and verifies the URDF (links, joints and their tree) and returns the parsed model."""
+    log.debug("Starting URDF Read Process")
     if not os.path.exists(path):
-        print(f"ERROR: URDF file not found at: {path}")
+        log.error(f"URDF file not found at: {path}")
         sys.exit(1)
         
     try:
-        model = urdfpy.URDF.load(path)
-        _ = model.visual_geometry_fk(cfg={}) 
-        print(f"SUCCESS: Data read for {model.name} passed. {len(model.links)} links found.")
+        model = load_urdf(path)
+        log.info(f"Data read for {model['name']} passed. {len(model['link_names'])} links found.")
         return model
     except Exception as e:
-        print(f"ERROR: Failed to parse URDF data. Error: {e}")
+        log.error(f"Failed to parse URDF data. Error: {e}")
         sys.exit(1)
 
-def link_positions(model_data, base_position=(0, 0, 0)):
+
+def _build_tree(model):
     """
-    Calculates the world pose for every link, offset by a given base position.
+    Link/joint topology as arrays. Links are ordered parents-before-children (base link
+    first); joint i is the joint whose child is link i (the base link has none).
     """
-    cfg = {}  # Empty config means zero joint angles
-    relative_poses = model_data.link_fk(cfg=cfg)
-    base_translation_matrix = np.identity(4)
-    base_translation_matrix[:3, 3] = base_position
-    
-    world_poses = {}
-    print("WORLD POSES (Offset by Base Position) ")
-    for link_object, matrix_np in relative_poses.items():
-        world_matrix = base_translation_matrix @ matrix_np
-        world_poses[link_object.name] = world_matrix
-        
-        location = world_matrix[:3, 3]
-        print(f"\n--- Link: {link_object.name} ---")
-        print(f"  Location (XYZ): {np.around(location, 4)} (meters)")
-        
-    print("\nKinematic calculation complete.")
+    joints_by_parent = {}
+    for joint in model["joints"]:
+        joints_by_parent.setdefault(joint["parent"], []).append(joint)
+
+    link_names, parent, joint_names, origins, axes, types, limits = [], [], [], [], [], [], []
+    queue = [(model["base_link"], -1, None)]
+    while queue:
+        name, parent_idx, joint = queue.pop(0)
+        idx = len(link_names)
+        link_names.append(name)
+        parent.append(parent_idx)
+        joint_names.append(joint["name"] if joint is not None else None)
+        origins.append(np.identity(4) if joint is None else joint["origin"])
+        axes.append(np.zeros(3) if joint is None else joint["axis"])
+        types.append(JOINT_FIXED if joint is None else _JOINT_CODES.get(joint["type"], JOINT_FIXED))
+        limits.append((np.nan, np.nan) if joint is None or joint["limit"] is None else joint["limit"][:2])
+        queue.extend((j["child"], idx, j) for j in joints_by_parent.get(name, []))
+
+    types = np.array(types, dtype=np.int8)
+    return {
+        "link_names": link_names,
+        "link_index": {name: i for i, name in enumerate(link_names)},
+        "parent": np.array(parent, dtype=np.int64),
+        "joint_names": joint_names,
+        "origins": np.array(origins),
+        "axes": np.array(axes),
+        "joint_types": types,
+        "limits": np.array(limits, dtype=float),  # (L,2) lower/upper, nan when unset
+        # Joints that take a configuration value, in link order.
+        "actuated": [joint_names[i] for i in np.flatnonzero(types != JOINT_FIXED)],
+    }
+
+
+def kinematic_tree(model_data):
+    """Array-backed kinematic tree of a parsed model (built once by parse_urdf)."""
+    return model_data["tree"]
+
+
+def rpy_matrices(rpy):
+    """(N,3) roll/pitch/yaw in radians -> (N,3,3) rotations (R = Rz @ Ry @ Rx, as in URDF and Blender XYZ euler)."""
+    rpy = np.atleast_2d(np.asarray(rpy, dtype=float))
+    cr, sr = np.cos(rpy[:, 0]), np.sin(rpy[:, 0])
+    cp, sp = np.cos(rpy[:, 1]), np.sin(rpy[:, 1])
+    cy, sy = np.cos(rpy[:, 2]), np.sin(rpy[:, 2])
+    R = np.empty((len(rpy), 3, 3))
+    R[:, 0, 0] = cy * cp
+    R[:, 0, 1] = cy * sp * sr - sy * cr
+    R[:, 0, 2] = cy * sp * cr + sy * sr
+    R[:, 1, 0] = sy * cp
+    R[:, 1, 1] = sy * sp * sr + cy * cr
+    R[:, 1, 2] = sy * sp * cr - cy * sr
+    R[:, 2, 0] = -sp
+    R[:, 2, 1] = cp * sr
+    R[:, 2, 2] = cp * cr
+    return R
+
+
+def base_pose_matrices(base_poses):
+    """
+    Converts N base poses to (N,4,4) matrices. Accepted shapes:
+    (N,4,4) matrices, (N,3) xyz, (N,4) xyz + yaw, or (N,6) xyz + roll/pitch/yaw (radians).
+    A single pose (a (4,4) matrix or one row) gives N=1.
+    """
+    poses = np.asarray(base_poses, dtype=float)
+    if poses.shape == (4, 4):
+        return poses[None]
+    if poses.ndim == 3 and poses.shape[1:] == (4, 4):
+        return poses
+    poses = np.atleast_2d(poses)
+    if poses.shape[1] not in (3, 4, 6):
+        raise ValueError(f"Unsupported base pose shape {poses.shape}.")
+    rpy = np.zeros((len(poses), 3))
+    if poses.shape[1] == 4:
+        rpy[:, 2] = poses[:, 3]
+    elif poses.shape[1] == 6:
+        rpy = poses[:, 3:]
+    M = np.tile(np.identity(4), (len(poses), 1, 1))
+    M[:, :3, :3] = rpy_matrices(rpy)
+    M[:, :3, 3] = poses[:, :3]
+    return M
+
+
+def _joint_motions(axis, joint_type, q):
+    """(N,4,4) joint motion transforms for N joint values about/along a unit axis."""
+    M = np.tile(np.identity(4), (len(q), 1, 1))
+    if joint_type == JOINT_REVOLUTE:
+        K = np.array([[0, -axis[2], axis[1]], [axis[2], 0, -axis[0]], [-axis[1], axis[0], 0]])
+        M[:, :3, :3] += np.sin(q)[:, None, None] * K + (1 - np.cos(q))[:, None, None] * (K @ K)
+    elif joint_type == JOINT_PRISMATIC:
+        M[:, :3, 3] = q[:, None] * axis
+    return M
+
+
+@instrumentation.traced("fk")
+def batched_link_fk(model_data, base_poses, joint_cfgs=None):
+    """
+    World poses of every link for N base poses at once.
+    joint_cfgs is None (all zero), an (N,J) array ordered like kinematic_tree(model)["actuated"]
+    (one (J,) row is used for every pose), or a dict of joint name -> scalar or (N,) values.
+    Returns (poses (N,L,4,4), link_names) with links in kinematic_tree order.
+    """
+    tree = kinematic_tree(model_data)
+    base = base_pose_matrices(base_poses)
+    n = len(base)
+
+    if joint_cfgs is None:
+        joint_cfgs = {}
+    elif not isinstance(joint_cfgs, dict):
+        values = np.atleast_2d(np.asarray(joint_cfgs, dtype=float))
+        if values.ndim != 2 or values.shape[0] not in (1, n) or values.shape[1] != len(tree["actuated"]):
+            raise ValueError(f"Joint configurations of shape {values.shape} do not match {n} poses x {len(tree['actuated'])} actuated joints.")
+        values = np.broadcast_to(values, (n, values.shape[1]))
+        joint_cfgs = {name: values[:, j] for j, name in enumerate(tree["actuated"])}
+
+    poses = np.empty((n, len(tree["link_names"]), 4, 4))
+    poses[:, 0] = base
+    for i in range(1, len(tree["link_names"])):
+        local = tree["origins"][i]
+        joint_type = tree["joint_types"][i]
+        q = joint_cfgs.get(tree["joint_names"][i])
+        if joint_type != JOINT_FIXED and q is not None:
+            q = np.broadcast_to(np.asarray(q, dtype=float), (n,))
+            local = local @ _joint_motions(tree["axes"][i], joint_type, q)
+        poses[:, i] = poses[:, tree["parent"][i]] @ local
+    return poses, tree["link_names"]
+
+
+def link_positions(model_data, base_position=(0, 0, 0), base_rotation=(0, 0, 0), cfg=None, verbose=False):
+    """
+    Calculates the world pose for every link, offset by a given base position
+    and rotated by base_rotation (XYZ euler, radians - e.g. a Blender rotation_euler).
+    """
+    base_pose = np.concatenate([np.asarray(base_position, dtype=float), np.asarray(base_rotation, dtype=float)])
+    poses, names = batched_link_fk(model_data, base_pose[None], joint_cfgs=cfg)
+    world_poses = dict(zip(names, poses[0]))
+
+    level = logging.INFO if verbose else logging.DEBUG
+    if log.isEnabledFor(level):
+        for name, world_matrix in world_poses.items():
+            log.log(level, f"Link {name}: location (XYZ) {np.around(world_matrix[:3, 3], 4)} (meters)")
     return world_poses
 
 def get_link_position(all_poses_dict, link_name):
@@ -58,7 +282,7 @@ def get_link_position(all_poses_dict, link_name):
         location_xyz = pose_matrix[:3, 3]
         return location_xyz
     else:
-        print(f" Link '{link_name}' not found in the provided pose data.")
+        log.warning(f"Link '{link_name}' not found in the provided pose data.")
         return None
 
 def find_closest_link(target_pos, all_link_poses):